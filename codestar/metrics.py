@@ -0,0 +1,191 @@
+"""
+Per-request performance metrics.
+
+RequestMetricsMiddleware measures a sample of requests: the number of
+SQL queries and the time spent in them, the time spent rendering
+templates, and the hits and misses of the cached lookups that report to
+record_cache(), with their hit ratio and the time the hits saved. Each
+measured request gets a Server-Timing header, which browser developer
+tools show next to the request, and one JSON line on the
+codestar.metrics logger for log-based dashboards.
+
+settings.REQUEST_METRICS_SAMPLE_RATE is the share of requests measured,
+from 0 (off) to 1 (all), and settings.REQUEST_METRICS_SERVER_TIMING
+whether measured responses carry the header, as it tells clients how
+long the database took.
+
+Template time is measured by the DjangoTemplates backend in this module,
+which settings.TEMPLATES uses in place of Django's own.
+"""
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async)
+from django.conf import settings
+from django.db import connections
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_saved = 0.0
+        # Nested renders, such as a template rendered by a tag, are
+        # already counted in the outer render's time
+        self.render_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Called by the database backend around every query
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+
+def record_cache(hits=0, misses=0, saved=0.0):
+    """
+    Counts cache lookups, and the seconds of work the hits saved, towards
+    the current request's metrics.
+    """
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+        metrics.cache_saved += saved
+
+
+class TimedTemplate:
+    """A backend template that adds its render time to the metrics."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        metrics.render_depth += 1
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.render_depth -= 1
+            if not metrics.render_depth:
+                metrics.template_time += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Django's template backend, with templates timed by TimedTemplate."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_sampled():
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with self.count_queries(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        if not self.is_sampled():
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        # Sync views and the ORM run on the request's thread sensitive
+        # worker thread, whose connections are wrapped from that thread
+        queries = await sync_to_async(self.count_queries)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(queries.close)()
+            _current.reset(token)
+        return self.report(request, response, metrics, started)
+
+    @staticmethod
+    def is_sampled():
+        sample_rate = settings.REQUEST_METRICS_SAMPLE_RATE
+        return sample_rate and random.random() < sample_rate
+
+    @staticmethod
+    def count_queries(metrics):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+        return stack
+
+    def report(self, request, response, metrics, started):
+        total = time.perf_counter() - started
+        if settings.REQUEST_METRICS_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(metrics, total)
+        match = request.resolver_match
+        lookups = metrics.cache_hits + metrics.cache_misses
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round(total * 1000, 2),
+            'queries': metrics.queries,
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'template_ms': round(metrics.template_time * 1000, 2),
+            'cache_hits': metrics.cache_hits,
+            'cache_misses': metrics.cache_misses,
+            'cache_hit_ratio': (
+                round(metrics.cache_hits / lookups, 3) if lookups else None),
+            'cache_saved_ms': round(metrics.cache_saved * 1000, 2),
+        }))
+        return response
+
+
+def server_timing(metrics, total):
+    return ', '.join([
+        f'db;dur={metrics.db_time * 1000:.2f};'
+        f'desc="{metrics.queries} queries"',
+        f'tpl;dur={metrics.template_time * 1000:.2f};desc="Templates"',
+        f'cache;desc="{metrics.cache_hits} hits, '
+        f'{metrics.cache_misses} misses"',
+        f'total;dur={total * 1000:.2f}',
+    ])
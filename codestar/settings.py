@@ -93,6 +93,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'codestar.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -107,7 +108,9 @@ ROOT_URLCONF = 'codestar.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend, with render times reported to codestar.metrics
+        'BACKEND': 'codestar.metrics.DjangoTemplates',
+        'NAME': 'django',
         'DIRS': [
             os.path.join(BASE_DIR, 'templates'),
             os.path.join(BASE_DIR, 'profiles', 'templates'),
@@ -192,6 +195,13 @@ STORAGES = {
     "default": {
         "BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage"
         },
+    # House image uploads wait here until a background thread pushes them
+    # to the default storage (see profiles/uploads.py). They are kept in
+    # the database, which the web and worker dynos share and which
+    # outlives a dyno restart, unlike the dyno's own disk
+    "staging": {
+        "BACKEND": "profiles.storage.DatabaseStorage",
+    },
     # STATIC -> WhiteNoise in prod, plain in dev
     "staticfiles": {
         "BACKEND": (
@@ -202,15 +212,102 @@ STORAGES = {
     },
 }
 
+# Media on disk under MEDIA_ROOT instead of Cloudinary, for local load
+# tests with the generate_synthetic_data command
+if os.environ.get("LOCAL_MEDIA", "False").lower() == "true":
+    STORAGES["default"] = {
+        "BACKEND": "django.core.files.storage.FileSystemStorage"
+        }
+
 # Optional: avoid build failure if a CSS references a missing file
 WHITENOISE_MANIFEST_STRICT = False
 
+# Seconds before a worker rebuilds its swipe feed candidate index
+# (see profiles/feed.py), bounding staleness from other workers' writes
+FEED_INDEX_TTL = int(os.environ.get("FEED_INDEX_TTL", 300))
+
+# Per-process memory cache by default; set REDIS_URL to share the cache
+# (such as the unread notification counts) between workers
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+if os.environ.get("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+    }
+
+# Rendered profile cards (see profiles/cards.py). Entries are keyed on a
+# version stamp and never deleted, only evicted: the memory cache drops
+# the least recently used cards past CARD_CACHE_SIZE, CARD_CACHE_DIR
+# keeps them in files instead, and with REDIS_URL every worker shares
+# them (give Redis an allkeys-lru maxmemory-policy)
+CARD_CACHE_SIZE = int(os.environ.get("CARD_CACHE_SIZE", 5000))
+CACHES["cards"] = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    "LOCATION": "cards",
+    "TIMEOUT": 24 * 60 * 60,
+    "OPTIONS": {"MAX_ENTRIES": CARD_CACHE_SIZE},
+}
+if os.environ.get("CARD_CACHE_DIR"):
+    CACHES["cards"].update({
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ["CARD_CACHE_DIR"],
+    })
+if os.environ.get("REDIS_URL"):
+    CACHES["cards"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+        "KEY_PREFIX": "cards",
+        "TIMEOUT": 24 * 60 * 60,
+    }
+
+# Share of requests measured by codestar.metrics, from 0 (off) to 1, and
+# whether measured responses tell the client their timings
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get(
+    "REQUEST_METRICS_SAMPLE_RATE", 1.0 if DEBUG else 0.0))
+REQUEST_METRICS_SERVER_TIMING = os.environ.get(
+    "REQUEST_METRICS_SERVER_TIMING", str(DEBUG)).lower() == "true"
+
+# Threads per process pushing staged house images to Cloudinary
+IMAGE_UPLOAD_WORKERS = int(os.environ.get("IMAGE_UPLOAD_WORKERS", 4))
+
+# Relays live events to open pages (see notifications/events.py). The
+# streams are only held open under ASGI (codestar.asgi); with several ASGI
+# workers, set REDIS_URL (or EVENT_BROKER_URL) so they share events
+# through Redis. The in-process broker only reaches pages connected to
+# the process that published, which suits a single local process
+EVENT_BROKER_URL = os.environ.get(
+    "EVENT_BROKER_URL", os.environ.get("REDIS_URL", ""))
+EVENT_BROKER = os.environ.get(
+    "EVENT_BROKER",
+    "notifications.events.RedisBroker" if EVENT_BROKER_URL
+    else "notifications.events.InProcessBroker")
+
 # --- Tests: keep uploads in-memory and out of Cloudinary ---
 if "test" in _sys.argv:
     STORAGES["default"] = {
         "BACKEND": "django.core.files.storage.InMemoryStorage"
         }
+    STORAGES["staging"] = {
+        "BACKEND": "django.core.files.storage.InMemoryStorage"
+        }
     MEDIA_ROOT = BASE_DIR / "test_media"
+    # Test transactions roll back without firing delete signals, so
+    # rebuild the feed index on every lookup instead of trusting it
+    FEED_INDEX_TTL = 0
+    # Cached values are keyed on ids that SQLite hands out again in the
+    # next test, so only tests that opt in with override_settings cache
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+        },
+        "cards": {
+            "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+        },
+    }
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -0,0 +1,144 @@
+"""
+Test helpers shared by the app test suites.
+"""
+import re
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, resolve
+
+# Plan lines that mean a query read a whole table or sorted rows itself
+# instead of walking an index in the requested order
+_SQLITE_PROBLEMS = re.compile(r'^(SCAN (?!CONSTANT ROW)|USE TEMP B-TREE)')
+_POSTGRES_PROBLEMS = re.compile(r'(Seq Scan on|Sort\b)')
+
+
+class QueryPlanMixin:
+    """
+    Assertions that hot queries are served by an index, checked against
+    the EXPLAIN output of the database the tests run on (SQLite or
+    PostgreSQL).
+
+    On PostgreSQL sequential scans and sorts are switched off for the
+    test transaction, so the planner picks an index whenever one can
+    serve the query even though the test tables are tiny, and a scan or
+    sort left in the plan means no usable index exists.
+    """
+
+    def explain(self, sql, params=None):
+        """Returns the query plan of sql as a list of lines."""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                return [row[-1] for row in cursor.fetchall()]
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+                cursor.execute('EXPLAIN ' + sql, params)
+                return [row[0] for row in cursor.fetchall()]
+        self.skipTest(f"No query plan checks for {connection.vendor}")
+
+    def plan_problems(self, plan, allow_scan=()):
+        pattern = (
+            _SQLITE_PROBLEMS if connection.vendor == 'sqlite'
+            else _POSTGRES_PROBLEMS)
+        return [
+            line for line in plan
+            if pattern.search(line.strip())
+            and not any(
+                re.search(rf'\b{table}\b', line) for table in allow_scan)
+        ]
+
+    def assertIndexed(self, queryset, allow_scan=()):
+        """
+        Fails if the queryset's plan scans a table or sorts. Tables in
+        allow_scan may be scanned, such as ones holding a handful of rows.
+        """
+        sql, params = queryset.query.sql_with_params()
+        plan = self.explain(sql, params)
+        problems = self.plan_problems(plan, allow_scan)
+        if problems:
+            self.fail(
+                "Query is not served by an index:\n"
+                f"{sql}\n\nPlan:\n" + "\n".join(plan))
+
+    def assertViewQueriesIndexed(self, request, allow_scan=()):
+        """
+        Calls request(), typically a test client call, and checks the plan
+        of every SELECT it ran. Returns the response.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = self.explain(sql)
+            problems = self.plan_problems(plan, allow_scan)
+            if problems:
+                self.fail(
+                    "View query is not served by an index:\n"
+                    f"{sql}\n\nPlan:\n" + "\n".join(plan))
+        return response
+
+
+# Most queries a request to each view may run, by URL name, covering the
+# heaviest request the app test suites make. Raise a budget only with a
+# reason; a view that suddenly needs more usually queries inside a loop.
+QUERY_BUDGETS = {
+    'about': 3,
+    'custom_logout': 4,
+    'delete_image': 8,
+    'delete_profile': 23,
+    'delete_review': 12,
+    'dismiss_notification': 4,
+    'edit_profile': 6,
+    'home': 10,
+    'inbox': 5,
+    'leave_review': 14,
+    'like_profile': 19,
+    'mark_all_read': 3,
+    'mark_notification_read': 4,
+    'message_history': 4,
+    'messages_since': 5,
+    'next_profile': 12,
+    'next_profiles': 9,
+    'notification_preview': 5,
+    'profiles': 9,
+    'register': 10,
+    'travel_log': 5,
+    'unlike_profile': 9,
+    'upload_images': 7,
+    'view_profile': 18,
+}
+
+
+class QueryBudgetClient(Client):
+    """
+    A test client that fails the request when the view it reaches runs
+    more queries than its QUERY_BUDGETS entry.
+    """
+
+    def request(self, **request):
+        with CaptureQueriesContext(connection) as queries:
+            response = super().request(**request)
+        try:
+            view_name = resolve(request['PATH_INFO']).view_name
+        except Resolver404:
+            return response
+        budget = QUERY_BUDGETS.get(view_name)
+        if budget is not None and len(queries) > budget:
+            raise AssertionError(
+                f"{view_name} ran {len(queries)} queries, over its budget "
+                f"of {budget}:\n" + "\n".join(
+                    query['sql'] for query in queries.captured_queries))
+        return response
+
+
+class QueryBudgetMixin:
+    """
+    Checks every request the test client makes against the query budget
+    of the view it reaches, see QUERY_BUDGETS.
+    """
+    client_class = QueryBudgetClient
@@ -31,6 +31,7 @@ urlpatterns = [
     path('about/', profile_views.about, name='about'),
     path('reviews/', include('reviews.urls')),
     path('notifications/', include('notifications.urls')),
+    path('messaging/', include('messaging.urls')),
     # Password reset URLs
     path(
         'password_reset/', auth_views.PasswordResetView.as_view(),
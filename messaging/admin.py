@@ -1,5 +1,22 @@
 from django.contrib import admin
-from .models import Message, BookingRequest
+from .models import (
+    Conversation, ConversationParticipant, Message, BookingRequest)
+
+
+class ConversationParticipantInline(admin.TabularInline):
+    model = ConversationParticipant
+    extra = 0
+    readonly_fields = (
+        'user', 'last_message_at', 'last_read_at', 'unread_count')
+    can_delete = False
+
+
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ('user_a', 'user_b', 'last_message_at')
+    search_fields = ('user_a__username', 'user_b__username')
+    raw_id_fields = ('last_message',)
+    inlines = [ConversationParticipantInline]
 
 
 @admin.register(Message)
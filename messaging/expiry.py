@@ -0,0 +1,167 @@
+"""
+Expiry of booking requests nobody answered before their dates passed.
+
+The expire_bookings command walks the BookingRequest table in primary key
+ranges and calls expire_batch() for each one, so every batch is a short
+transaction over a bounded slice of the table. Rows a live request has
+locked are skipped and picked up by the next run, and the UPDATE only
+matches rows that are still open and bumps their version, so the job can
+run next to live traffic: a user responding at the same moment gets the
+same BookingConflict as for any other concurrent change.
+
+Each batch stores the lines of the users' summary emails as
+ExpirySummaryLine rows in its own transaction, and queue_summaries()
+turns them into one email per user at the end of the run. A run that
+stops partway leaves its lines for the next run to send.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Min
+from django.db.models.signals import post_save
+from django.urls import reverse
+from django.utils import timezone
+
+from notifications.models import Notification
+from notifications.outbox import queue_mass_mail
+
+from .models import BookingRequest, ExpirySummaryLine
+
+BATCH_SIZE = 1000
+
+
+def expire_batch(first_id, last_id, today=None):
+    """
+    Expires the open bookings with ids from first_id up to but excluding
+    last_id whose dates ended before today. Notifies both users and stores
+    a summary line per booking for each of them, to be emailed by
+    queue_summaries(). Returns the number expired.
+    """
+    today = today or timezone.localdate()
+    with transaction.atomic():
+        stale = list(BookingRequest.objects.select_for_update(
+            skip_locked=True, of=('self',)
+        ).select_related('sender', 'recipient').filter(
+            id__gte=first_id,
+            id__lt=last_id,
+            status__in=BookingRequest.OPEN,
+            end_date__lt=today,
+        ))
+        if not stale:
+            return 0
+
+        now = timezone.now()
+        BookingRequest.objects.filter(
+            id__in=[booking.id for booking in stale],
+            status__in=BookingRequest.OPEN,
+        ).update(
+            status='expired',
+            version=F('version') + 1,
+            responded_at=now,
+            last_action_by=None,
+        )
+        # The responded_at stamp tells this run's rows apart from rows
+        # another worker expired first
+        expired_ids = set(BookingRequest.objects.filter(
+            id__in=[booking.id for booking in stale],
+            status='expired',
+            responded_at=now,
+        ).values_list('id', flat=True))
+        expired = [booking for booking in stale if booking.id in expired_ids]
+
+        notifications = []
+        lines = []
+        for booking in expired:
+            booking.status = 'expired'
+            booking.version += 1
+            booking.responded_at = now
+            booking.last_action_by = None
+            sender, recipient = booking.sender, booking.recipient
+            notifications += [
+                Notification(
+                    user=sender,
+                    message=f"Your vacation request to {recipient.username} "
+                            f"for {booking.requested_dates} expired.",
+                    link=reverse('view_profile', args=[recipient.id])),
+                Notification(
+                    user=recipient,
+                    message=f"{sender.username}'s vacation request for "
+                            f"{booking.requested_dates} expired.",
+                    link=reverse('view_profile', args=[sender.id])),
+            ]
+            lines += [
+                ExpirySummaryLine(
+                    user=sender,
+                    line=f"Your request to {recipient.username}: "
+                         f"{booking.requested_dates}"),
+                ExpirySummaryLine(
+                    user=recipient,
+                    line=f"Request from {sender.username}: "
+                         f"{booking.requested_dates}"),
+            ]
+
+        Notification.objects.bulk_create(notifications)
+        ExpirySummaryLine.objects.bulk_create(lines)
+
+        # bulk_create() and update() skip signals, the receivers still
+        # need to clear cached counts and push the changes to open pages
+        for instance in [*expired, *notifications]:
+            post_save.send(
+                sender=type(instance), instance=instance,
+                created=isinstance(instance, Notification), raw=False,
+                using=instance._state.db, update_fields=None)
+    return len(expired)
+
+
+def queue_summaries():
+    """
+    Queues one email per user listing the expired requests of every stored
+    summary line, and deletes the lines in the same transaction. Returns
+    the number of emails queued.
+    """
+    with transaction.atomic():
+        pending = list(ExpirySummaryLine.objects.select_for_update(
+            of=('self',)
+        ).select_related('user').order_by('id'))
+        # Users are equal by primary key, so the lines of one user collect
+        # under one key whichever batch stored them
+        summaries = defaultdict(list)
+        for summary_line in pending:
+            summaries[summary_line.user].append(summary_line.line)
+        queued = queue_mass_mail([
+            (
+                'Vacation requests expired on TravelSwap',
+                "These vacation requests were not answered before their "
+                "dates passed and have expired:\n\n"
+                + "\n".join(lines)
+                + "\n\nLog in to TravelSwap to send a new request.",
+                settings.DEFAULT_FROM_EMAIL,
+                [user.email],
+            )
+            for user, lines in summaries.items() if user.email
+        ])
+        ExpirySummaryLine.objects.filter(
+            id__in=[summary_line.id for summary_line in pending]).delete()
+    return len(queued)
+
+
+def expire_stale_bookings(batch_size=BATCH_SIZE, today=None):
+    """
+    Runs expire_batch() over the whole table in id ranges of batch_size,
+    then queues one summary email per user for the whole run, including
+    lines left by an earlier run that stopped partway. Returns the number
+    expired, the number of batches and the elapsed seconds.
+    """
+    started = time.monotonic()
+    bounds = BookingRequest.objects.aggregate(
+        first=Min('id'), last=Max('id'))
+    total = batches = 0
+    if bounds['first'] is not None:
+        for first_id in range(
+                bounds['first'], bounds['last'] + 1, batch_size):
+            total += expire_batch(first_id, first_id + batch_size, today)
+            batches += 1
+    queue_summaries()
+    return total, batches, time.monotonic() - started
@@ -1,4 +1,5 @@
 from django import forms
+from profiles.models import parse_date_range
 from .models import Message, BookingRequest
 
 
@@ -24,3 +25,10 @@ class BookingRequestForm(forms.ModelForm):
                 'placeholder': 'Select exchange dates'
             }),
         }
+
+    def clean_requested_dates(self):
+        requested_dates = self.cleaned_data['requested_dates']
+        if parse_date_range(requested_dates) is None:
+            raise forms.ValidationError(
+                "Enter dates as 'YYYY-MM-DD to YYYY-MM-DD'.")
+        return requested_dates
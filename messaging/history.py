@@ -0,0 +1,60 @@
+"""
+Keyset pagination of conversation history.
+
+Pages are read on (timestamp, id) through message_history_idx, so loading a
+page costs the same however long the thread is. A cursor holds the
+timestamp and id of a message the client already has: the oldest one when
+paging back through history, the newest one when polling for new messages.
+"""
+from datetime import datetime
+
+PAGE_SIZE = 30
+
+
+def encode_cursor(message):
+    return f'{message.timestamp.isoformat()}_{message.id}'
+
+
+def decode_cursor(cursor):
+    """Returns (timestamp, id), raising ValueError for a malformed cursor."""
+    timestamp, _, message_id = cursor.rpartition('_')
+    timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None:
+        raise ValueError("Cursor timestamp has no time zone")
+    return timestamp, int(message_id)
+
+
+def get_history_page(conversation, before=None, size=PAGE_SIZE):
+    """
+    Returns the page of up to size messages before the cursor (the newest
+    page without one), oldest first, and the cursor for the page before
+    it, or None when the page reaches the start of the conversation.
+    """
+    messages = conversation.messages.select_related(
+        'sender').order_by('-timestamp', '-id')
+    if before:
+        timestamp, message_id = decode_cursor(before)
+        # (timestamp, id) < cursor, written as a range on the index
+        # rather than an OR that would defeat it
+        messages = messages.filter(timestamp__lte=timestamp).exclude(
+            timestamp=timestamp, id__gte=message_id)
+
+    page = list(messages[:size + 1])
+    next_cursor = encode_cursor(page[size - 1]) if len(page) > size else None
+    return page[:size][::-1], next_cursor
+
+
+def get_messages_after(conversation, after=None, size=PAGE_SIZE):
+    """
+    Returns up to size messages after the cursor (from the start of the
+    conversation without one), oldest first, and whether more remain.
+    """
+    messages = conversation.messages.select_related(
+        'sender').order_by('timestamp', 'id')
+    if after:
+        timestamp, message_id = decode_cursor(after)
+        messages = messages.filter(timestamp__gte=timestamp).exclude(
+            timestamp=timestamp, id__lte=message_id)
+
+    page = list(messages[:size + 1])
+    return page[:size], len(page) > size
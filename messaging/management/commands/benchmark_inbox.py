@@ -0,0 +1,161 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from messaging.models import Conversation, ConversationParticipant, Message
+from messaging.views import INBOX_PAGE_SIZE, inbox
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the inbox page for a user with many conversations, and "
+        "compare its participant-row query with computing the same rows "
+        "from the messages in one grouped query. Everything is created "
+        "inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=[10, 100, 500])
+        parser.add_argument('--messages', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self.run_size(size, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run_size(self, size, options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(
+            f"Creating {size} conversations of {options['messages']} "
+            "messages...")
+        viewer = User.objects.create(username='inbox-bench-viewer')
+        User.objects.bulk_create(
+            [User(username=f'inbox-bench-{i}', password='!')
+             for i in range(size)],
+            batch_size=5000)
+        others = User.objects.filter(
+            username__startswith='inbox-bench-').exclude(id=viewer.id)
+        Conversation.objects.bulk_create([
+            Conversation(
+                user_a_id=min(viewer.id, other_id),
+                user_b_id=max(viewer.id, other_id))
+            for other_id in others.values_list('id', flat=True)
+        ], batch_size=5000)
+        conversations = list(Conversation.objects.filter(
+            Q(user_a=viewer) | Q(user_b=viewer)))
+
+        # bulk_create skips Message.save(), so the conversation pointers
+        # and participant counters are filled in below
+        Message.objects.bulk_create((
+            Message(
+                conversation=conversation,
+                sender_id=sender,
+                recipient_id=recipient,
+                content=f"Message {i} " + "lorem ipsum " * 10)
+            for conversation in conversations
+            for i in range(options['messages'])
+            for sender, recipient in [rng.choice([
+                (conversation.user_a_id, conversation.user_b_id),
+                (conversation.user_b_id, conversation.user_a_id)])]
+        ), batch_size=5000)
+        last_ids = dict(Message.objects.filter(
+            conversation__in=conversations
+        ).values_list('conversation').annotate(Max('id')))
+
+        now = timezone.now()
+        participants = []
+        for conversation in conversations:
+            conversation.last_message_id = last_ids[conversation.id]
+            conversation.last_message_at = now - timedelta(
+                minutes=rng.randrange(60 * 24 * 365))
+            unread = rng.choice([0, 0, 0, rng.randrange(1, 20)])
+            for user_id in (conversation.user_a_id, conversation.user_b_id):
+                mine = user_id == viewer.id
+                participants.append(ConversationParticipant(
+                    conversation=conversation,
+                    user_id=user_id,
+                    last_message_at=conversation.last_message_at,
+                    last_read_at=conversation.last_message_at - timedelta(
+                        minutes=unread if mine else 0),
+                    unread_count=unread if mine else 0,
+                ))
+        Conversation.objects.bulk_update(
+            conversations, ['last_message', 'last_message_at'],
+            batch_size=5000)
+        ConversationParticipant.objects.bulk_create(
+            participants, batch_size=5000)
+
+        request = RequestFactory().get('/messaging/inbox/')
+        request.user = viewer
+        with CaptureQueriesContext(connection) as queries:
+            inbox(request)
+        page = self.time_it(lambda: inbox(request), options['repeat'])
+        counters = self.time_it(
+            lambda: self.counter_rows(viewer), options['repeat'])
+        grouped = self.time_it(
+            lambda: self.grouped_rows(viewer), options['repeat'])
+        self.stdout.write(
+            f"  {size:>6} conversations: inbox page {page:.2f} ms "
+            f"({len(queries)} queries); rows from counters "
+            f"{counters:.2f} ms, grouped over messages {grouped:.2f} ms "
+            f"({grouped / counters:.1f}x)")
+
+    def counter_rows(self, user):
+        # The inbox view's row query
+        return list(ConversationParticipant.objects.filter(
+            user=user, last_message_at__isnull=False,
+        ).select_related(
+            'conversation__last_message',
+            'conversation__user_a',
+            'conversation__user_b',
+        ).order_by('-last_message_at')[:INBOX_PAGE_SIZE])
+
+    def grouped_rows(self, user):
+        # The same rows computed from the messages on every request
+        latest = Message.objects.filter(
+            conversation=OuterRef('conversation')
+        ).order_by('-timestamp', '-id')
+        return list(ConversationParticipant.objects.filter(
+            user=user,
+        ).annotate(
+            latest_at=Subquery(latest.values('timestamp')[:1]),
+            snippet=Subquery(latest.values('content')[:1]),
+            unread=Count(
+                'conversation__messages',
+                filter=~Q(conversation__messages__sender=user) & (
+                    Q(last_read_at__isnull=True)
+                    | Q(conversation__messages__timestamp__gt=F(
+                        'last_read_at'))),
+            ),
+        ).select_related(
+            'conversation__user_a', 'conversation__user_b',
+        ).order_by('-latest_at')[:INBOX_PAGE_SIZE])
+
+    def time_it(self, func, repeat):
+        func()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from messaging.expiry import BATCH_SIZE, expire_stale_bookings
+
+
+class Command(BaseCommand):
+    help = (
+        "Expire pending and amended booking requests whose dates have "
+        "passed, in batches of primary key ranges. Both users are notified "
+        "and sent a summary email. Runs once by default, or keeps polling "
+        "with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running instead of exiting after one pass.")
+        parser.add_argument(
+            '--interval', type=float, default=3600.0,
+            help="Seconds to wait between passes with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            expired, batches, elapsed = expire_stale_bookings(
+                options['batch_size'])
+            if expired or not options['loop']:
+                self.report(expired, batches, elapsed)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def report(self, expired, batches, elapsed):
+        rate = expired / elapsed if elapsed else 0.0
+        self.stdout.write(
+            f"Expired {expired} booking requests in {batches} batches "
+            f"in {elapsed:.2f}s ({rate:.1f} bookings/s).")
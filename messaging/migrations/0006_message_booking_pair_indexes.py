@@ -0,0 +1,21 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0005_delete_notification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookingrequest',
+            index=models.Index(fields=['sender', 'recipient', '-created_at'], name='booking_pair_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'recipient', 'timestamp'], name='message_pair_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:50
+
+from django.db import migrations
+from django.db.models import Q
+
+
+def backfill_conversations(apps, schema_editor):
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Message = apps.get_model('messaging', 'Message')
+    pairs = {
+        (min(pair), max(pair))
+        for pair in Message.objects.filter(
+            conversation__isnull=True
+        ).values_list('sender_id', 'recipient_id').distinct()
+    }
+    for user_a, user_b in pairs:
+        conversation, _ = Conversation.objects.get_or_create(
+            user_a_id=user_a, user_b_id=user_b)
+        thread = Message.objects.filter(
+            Q(sender_id=user_a, recipient_id=user_b)
+            | Q(sender_id=user_b, recipient_id=user_a))
+        thread.update(conversation=conversation)
+        last = thread.order_by('-timestamp', '-id').first()
+        conversation.last_message = last
+        conversation.last_message_at = last.timestamp
+        conversation.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0007_conversation'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_participants(apps, schema_editor):
+    # There is no read history for existing messages, so every existing
+    # conversation starts out read
+    Conversation = apps.get_model('messaging', 'Conversation')
+    ConversationParticipant = apps.get_model(
+        'messaging', 'ConversationParticipant')
+    conversations = Conversation.objects.values_list(
+        'id', 'user_a_id', 'user_b_id', 'last_message_at')
+    ConversationParticipant.objects.bulk_create((
+        ConversationParticipant(
+            conversation_id=conversation_id, user_id=user_id,
+            last_message_at=last_message_at, last_read_at=last_message_at)
+        for conversation_id, *users, last_message_at in conversations
+        for user_id in set(users)
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('messaging', '0009_message_conversation_required'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('last_read_at', models.DateTimeField(blank=True, null=True)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='messaging.conversation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_participants', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_message_at'], name='participant_inbox_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='conversationparticipant',
+            constraint=models.UniqueConstraint(fields=('conversation', 'user'), name='participant_unique'),
+        ),
+        migrations.RunPython(backfill_participants, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.20 on 2026-10-18 15:08
+
+from datetime import date
+
+from django.db import migrations, models
+
+
+def parse_date_range(value):
+    parts = [part.strip() for part in (value or '').split(' to ')]
+    if not parts[0] or len(parts) > 2:
+        return None
+    try:
+        start = date.fromisoformat(parts[0])
+        end = date.fromisoformat(parts[-1])
+    except ValueError:
+        return None
+    if end < start:
+        return None
+    return start, end
+
+
+def backfill_booking_dates(apps, schema_editor):
+    BookingRequest = apps.get_model('messaging', 'BookingRequest')
+    batch = []
+    bookings = BookingRequest.objects.only('id', 'requested_dates')
+    for booking in bookings.iterator(chunk_size=2000):
+        dates = parse_date_range(booking.requested_dates)
+        if dates is None:
+            continue
+        booking.start_date, booking.end_date = dates
+        batch.append(booking)
+        if len(batch) >= 2000:
+            BookingRequest.objects.bulk_update(
+                batch, ['start_date', 'end_date'])
+            batch = []
+    BookingRequest.objects.bulk_update(batch, ['start_date', 'end_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0010_conversationparticipant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookingrequest',
+            name='end_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='bookingrequest',
+            name='start_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='bookingrequest',
+            index=models.Index(fields=['sender', 'status', 'start_date', 'end_date'], name='booking_sender_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingrequest',
+            index=models.Index(fields=['recipient', 'status', 'start_date', 'end_date'], name='booking_recipient_dates_idx'),
+        ),
+        migrations.RunPython(
+            backfill_booking_dates, migrations.RunPython.noop),
+    ]
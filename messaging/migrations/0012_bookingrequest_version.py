@@ -0,0 +1,23 @@
+# Generated by Django 4.2.20 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0011_bookingrequest_dates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookingrequest',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='bookingrequest',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('amended', 'Amended'), ('denied', 'Denied'), ('cancelled', 'Cancelled')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0012_bookingrequest_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookingrequest',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('amended', 'Amended'), ('denied', 'Denied'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], default='pending', max_length=20),
+        ),
+    ]
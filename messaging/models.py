@@ -1,8 +1,161 @@
-from django.db import models
+import heapq
+from operator import attrgetter
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_save
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from codestar.metrics import record_cache
+from profiles.models import parse_date_range
+
+
+# Seconds a cached latest message id may live, as a backstop for writes
+# that bypass invalidate_latest_message_id()
+LATEST_MESSAGE_TTL = 300
+
+
+def _ordered_pair(user_id, other_user_id):
+    return min(user_id, other_user_id), max(user_id, other_user_id)
+
+
+def _latest_message_key(user_id, other_user_id):
+    return 'messaging:latest:{}:{}'.format(
+        *_ordered_pair(user_id, other_user_id))
+
+
+def latest_message_id(user_id, other_user_id):
+    """
+    Id of the newest message between two users, or 0 if there is none,
+    cached between writes so polling clients can be answered without
+    reading the message table.
+    """
+    key = _latest_message_key(user_id, other_user_id)
+    latest = cache.get(key)
+    record_cache(hits=latest is not None, misses=latest is None)
+    if latest is None:
+        latest = Conversation.objects.between_ids(
+            user_id, other_user_id
+        ).values_list('last_message_id', flat=True).first() or 0
+        cache.set(key, latest, LATEST_MESSAGE_TTL)
+    return latest
+
+
+def invalidate_latest_message_id(user_id, other_user_id):
+    """
+    Drops the cached latest message id now and again once the current
+    transaction commits, like invalidate_unread_count().
+    """
+    key = _latest_message_key(user_id, other_user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class ConversationQuerySet(models.QuerySet):
+    def between(self, user, other_user):
+        """The two users' conversation, or None if they never wrote."""
+        return self.between_ids(user.id, other_user.id).first()
+
+    def between_ids(self, user_id, other_user_id):
+        user_a, user_b = _ordered_pair(user_id, other_user_id)
+        return self.filter(user_a_id=user_a, user_b_id=user_b)
+
+    def for_pair(self, user_id, other_user_id):
+        user_a, user_b = _ordered_pair(user_id, other_user_id)
+        conversation, created = self.get_or_create(
+            user_a_id=user_a, user_b_id=user_b)
+        if created:
+            ConversationParticipant.objects.bulk_create([
+                ConversationParticipant(
+                    conversation=conversation, user_id=user_id)
+                for user_id in {user_a, user_b}
+            ])
+        return conversation
+
+    def for_user(self, user):
+        return self.filter(Q(user_a=user) | Q(user_b=user))
+
+
+class Conversation(models.Model):
+    """
+    The message thread between two users. The pair is stored in id order
+    (user_a has the lower id) so each pair has exactly one conversation.
+    """
+    user_a = models.ForeignKey(
+        User, related_name='+', on_delete=models.CASCADE)
+    user_b = models.ForeignKey(
+        User, related_name='+', on_delete=models.CASCADE)
+    last_message = models.ForeignKey(
+        'Message', related_name='+', null=True, blank=True,
+        on_delete=models.SET_NULL)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ConversationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user_a', 'user_b'],
+                name='conversation_pair_unique'),
+            models.CheckConstraint(
+                check=Q(user_a__lte=models.F('user_b')),
+                name='conversation_pair_ordered'),
+        ]
+
+    def __str__(self):
+        return f"Conversation between {self.user_a} and {self.user_b}"
+
+    def has_participant(self, user):
+        return user.id in (self.user_a_id, self.user_b_id)
+
+    def other_user(self, user):
+        return self.user_b if user.id == self.user_a_id else self.user_a
+
+    def mark_read(self, user):
+        """Clears the user's unread count, writing only if it was set."""
+        ConversationParticipant.objects.filter(
+            conversation=self, user=user, unread_count__gt=0,
+        ).update(unread_count=0, last_read_at=self.last_message_at)
+
+
+class ConversationParticipant(models.Model):
+    """
+    A user's side of a conversation: their read marker and unread count,
+    and a copy of the conversation's last activity so the inbox can be
+    listed from this table alone. Kept current by Message.save().
+    """
+    conversation = models.ForeignKey(
+        Conversation, related_name='participants', on_delete=models.CASCADE)
+    user = models.ForeignKey(
+        User, related_name='conversation_participants',
+        on_delete=models.CASCADE)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['conversation', 'user'],
+                name='participant_unique'),
+        ]
+        indexes = [
+            # The inbox, most recent activity first
+            models.Index(
+                fields=['user', '-last_message_at'],
+                name='participant_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} in {self.conversation}"
 
 
 class Message(models.Model):
+    conversation = models.ForeignKey(
+        Conversation, related_name='messages', on_delete=models.CASCADE)
     sender = models.ForeignKey(
         User, related_name="sent_messages", on_delete=models.CASCADE)
     recipient = models.ForeignKey(
@@ -10,9 +163,86 @@ class Message(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a conversation, newest first
+            models.Index(
+                fields=['conversation', '-timestamp', '-id'],
+                name='message_history_idx'),
+        ]
+
     def __str__(self):
         return f"From {self.sender} to {self.recipient} at {self.timestamp}"
 
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if self.conversation_id is None:
+            self.conversation = Conversation.objects.for_pair(
+                self.sender_id, self.recipient_id)
+        super().save(*args, **kwargs)
+        if adding:
+            self._record_activity()
+
+    def _record_activity(self):
+        # Only move the pointers forward, in case an older message is
+        # saved after a newer one
+        is_latest = (
+            Q(last_message_at__isnull=True)
+            | Q(last_message_at__lte=self.timestamp))
+        Conversation.objects.filter(
+            is_latest, pk=self.conversation_id,
+        ).update(last_message=self, last_message_at=self.timestamp)
+
+        participants = ConversationParticipant.objects.filter(
+            conversation_id=self.conversation_id)
+        participants.filter(is_latest).update(
+            last_message_at=self.timestamp)
+        # The sender has read everything up to their own message
+        participants.filter(user_id=self.sender_id).update(
+            last_read_at=self.timestamp, unread_count=0)
+        participants.exclude(user_id=self.sender_id).update(
+            unread_count=F('unread_count') + 1)
+
+
+class InvalidTransition(Exception):
+    """The booking's status cannot move to the requested one."""
+
+
+class BookingConflict(Exception):
+    """The booking was changed by someone else since it was read."""
+
+
+class BookingRequestQuerySet(models.QuerySet):
+    def overlapping(self, users, start, end):
+        """
+        Accepted bookings involving any of users whose dates overlap the
+        start to end range, both ends inclusive.
+        """
+        return self.filter(
+            Q(sender__in=users) | Q(recipient__in=users),
+            status='accepted',
+            start_date__lte=end,
+            end_date__gte=start,
+        )
+
+    def calendar(self, user, start, end):
+        """
+        The user's accepted bookings that overlap the start to end window,
+        ordered by start date. Each side of the exchange is read in order
+        from its own index and the two are merged.
+        """
+        sides = [
+            self.filter(
+                **{side: user},
+                status='accepted',
+                start_date__lte=end,
+                end_date__gte=start,
+            ).order_by('start_date')
+            for side in ['sender', 'recipient']
+        ]
+        return list(heapq.merge(*sides, key=attrgetter('start_date')))
+
 
 class BookingRequest(models.Model):
     sender = models.ForeignKey(
@@ -21,13 +251,19 @@ class BookingRequest(models.Model):
         User, on_delete=models.CASCADE,
         related_name='booking_requests_received')
     requested_dates = models.CharField(max_length=100)
+    start_date = models.DateField(null=True, editable=False)
+    end_date = models.DateField(null=True, editable=False)
     message = models.TextField(blank=True)
     status = models.CharField(max_length=20, choices=[
         ('pending', 'Pending'),
         ('accepted', 'Accepted'),
         ('amended', 'Amended'),
         ('denied', 'Denied'),
+        ('cancelled', 'Cancelled'),
+        ('expired', 'Expired'),
     ], default='pending')
+    # Bumped by every status transition, see transition()
+    version = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     responded_at = models.DateTimeField(null=True, blank=True)
 
@@ -39,8 +275,113 @@ class BookingRequest(models.Model):
         related_name='booking_last_actor'
     )
 
+    class Meta:
+        indexes = [
+            # Latest request in one direction between two users
+            models.Index(
+                fields=['sender', 'recipient', '-created_at'],
+                name='booking_pair_idx'),
+            # Overlap checks and calendars for either side of an exchange
+            models.Index(
+                fields=['sender', 'status', 'start_date', 'end_date'],
+                name='booking_sender_dates_idx'),
+            models.Index(
+                fields=['recipient', 'status', 'start_date', 'end_date'],
+                name='booking_recipient_dates_idx'),
+        ]
+
+    # Statuses each status may move to. Denied, cancelled and expired
+    # bookings are kept for history and a new request starts over.
+    TRANSITIONS = {
+        'pending': {'accepted', 'amended', 'denied', 'cancelled', 'expired'},
+        'amended': {'accepted', 'amended', 'denied', 'cancelled', 'expired'},
+        'accepted': {'amended', 'cancelled'},
+        'denied': set(),
+        'cancelled': set(),
+        'expired': set(),
+    }
+    # Statuses still waiting on a reply, see messaging/expiry.py
+    OPEN = ['pending', 'amended']
+
+    objects = BookingRequestQuerySet.as_manager()
+
     def __str__(self):
         return (
             f"{self.sender.username} → {self.recipient.username}: "
             f"{self.requested_dates} ({self.status})"
         )
+
+    def save(self, *args, **kwargs):
+        self.start_date, self.end_date = (
+            parse_date_range(self.requested_dates) or (None, None))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'requested_dates' in update_fields:
+            kwargs['update_fields'] = {
+                *update_fields, 'start_date', 'end_date'}
+        super().save(*args, **kwargs)
+
+    def transition(self, status, user, requested_dates=None, version=None):
+        """
+        Moves the booking to status on behalf of user, optionally with new
+        dates. The write is a single UPDATE matching the status and version
+        this instance was read with (or the version the user last saw), so
+        of two concurrent transitions from the same state only one applies.
+
+        Raises InvalidTransition if TRANSITIONS does not allow the move and
+        BookingConflict if the booking changed in the meantime.
+        """
+        if status not in self.TRANSITIONS[self.status]:
+            raise InvalidTransition(
+                f"Cannot move a booking from {self.status} to {status}")
+        if version is None:
+            version = self.version
+
+        changes = {
+            'status': status,
+            'responded_at': timezone.now(),
+            'last_action_by': user,
+        }
+        if requested_dates is not None:
+            changes['requested_dates'] = requested_dates
+            changes['start_date'], changes['end_date'] = (
+                parse_date_range(requested_dates) or (None, None))
+
+        updated = BookingRequest.objects.filter(
+            pk=self.pk, status=self.status, version=version,
+        ).update(version=F('version') + 1, **changes)
+        if not updated:
+            raise BookingConflict(
+                f"Booking {self.pk} changed since version {version}")
+
+        for field, value in changes.items():
+            setattr(self, field, value)
+        self.version = version + 1
+        # update() skips signals, receivers still need to see the change
+        post_save.send(
+            sender=BookingRequest, instance=self, created=False,
+            update_fields=frozenset([*changes, 'version']), raw=False,
+            using=self._state.db)
+
+    def conflicts(self):
+        """
+        Accepted bookings of either user that overlap this booking's dates.
+        """
+        if self.start_date is None:
+            return BookingRequest.objects.none()
+        return BookingRequest.objects.overlapping(
+            [self.sender_id, self.recipient_id],
+            self.start_date, self.end_date,
+        ).exclude(pk=self.pk)
+
+
+class ExpirySummaryLine(models.Model):
+    """
+    A line of a user's expired-requests summary email, written in the same
+    transaction as the expiry it reports on. See messaging/expiry.py.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    line = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username}: {self.line}"
@@ -0,0 +1,41 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from notifications.events import publish_on_commit
+from .models import Message, BookingRequest, invalidate_latest_message_id
+
+
+# Keep the cached latest message id that polling clients compare against
+# in step with message writes
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def update_latest_message_id(sender, instance, **kwargs):
+    invalidate_latest_message_id(instance.sender_id, instance.recipient_id)
+
+
+# Push new messages and booking changes to the other user's open pages
+@receiver(post_save, sender=Message)
+def publish_message(sender, instance, created, **kwargs):
+    if not created:
+        return
+    publish_on_commit([instance.recipient_id], {
+        'type': 'message',
+        'id': instance.id,
+        'conversation_id': instance.conversation_id,
+        'sender_id': instance.sender_id,
+        'sender': instance.sender.username,
+        'content': instance.content,
+        'timestamp': instance.timestamp.isoformat(),
+    })
+
+
+@receiver(post_save, sender=BookingRequest)
+def publish_booking(sender, instance, **kwargs):
+    user_ids = {instance.sender_id, instance.recipient_id}
+    user_ids.discard(instance.last_action_by_id)
+    publish_on_commit(sorted(user_ids), {
+        'type': 'booking',
+        'id': instance.id,
+        'status': instance.status,
+        'sender_id': instance.sender_id,
+        'recipient_id': instance.recipient_id,
+    })
@@ -1,9 +1,25 @@
-from django.test import TestCase
+import threading
+
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth.models import User
-from messaging.models import Message, BookingRequest
-from datetime import timedelta
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from messaging.models import (
+    BookingConflict, BookingRequest, Conversation, ConversationParticipant,
+    ExpirySummaryLine, InvalidTransition, Message)
+from messaging.expiry import expire_batch, expire_stale_bookings
+from messaging.history import (
+    PAGE_SIZE, encode_cursor, get_history_page)
+from django.core.cache import cache
+from django.test import override_settings
+from datetime import date, timedelta
 from django.utils import timezone
 from messaging.forms import MessageForm, BookingRequestForm
+from notifications.models import Notification, OutboundEmail, unread_count
+from django.core.management import call_command
+from io import StringIO
+from codestar.testing import QueryBudgetMixin, QueryPlanMixin
 
 
 class MessageModelTest(TestCase):
@@ -31,6 +47,301 @@ class MessageModelTest(TestCase):
         )
 
 
+class ConversationTest(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            username='alice', password='pass123')
+        self.bob = User.objects.create_user(
+            username='bob', password='pass123')
+
+    def test_both_directions_share_one_conversation(self):
+        first = Message.objects.create(
+            sender=self.bob, recipient=self.alice, content='Hi')
+        second = Message.objects.create(
+            sender=self.alice, recipient=self.bob, content='Hello')
+
+        self.assertEqual(first.conversation, second.conversation)
+        self.assertEqual(Conversation.objects.count(), 1)
+        conversation = first.conversation
+        self.assertLess(conversation.user_a_id, conversation.user_b_id)
+        self.assertEqual(
+            Conversation.objects.between(self.alice, self.bob), conversation)
+        self.assertEqual(
+            Conversation.objects.between(self.bob, self.alice), conversation)
+
+    def test_last_message_follows_new_messages(self):
+        Message.objects.create(
+            sender=self.alice, recipient=self.bob, content='Hi')
+        latest = Message.objects.create(
+            sender=self.bob, recipient=self.alice, content='Hello')
+
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.last_message, latest)
+        self.assertEqual(conversation.last_message_at, latest.timestamp)
+
+    def test_between_users_who_never_wrote(self):
+        self.assertIsNone(Conversation.objects.between(self.alice, self.bob))
+
+
+class MessageHistoryTest(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            username='alice', password='pass123')
+        self.bob = User.objects.create_user(
+            username='bob', password='pass123')
+
+    def create_thread(self, count, alice, bob):
+        messages = [
+            Message.objects.create(
+                sender=alice if i % 2 else bob,
+                recipient=bob if i % 2 else alice,
+                content=f'Message {i}')
+            for i in range(count)
+        ]
+        # Several messages in the same instant, to check ties on timestamp
+        # are broken by id
+        Message.objects.filter(
+            id__in=[message.id for message in messages[:count // 2]]
+        ).update(timestamp=messages[0].timestamp)
+        return messages[0].conversation
+
+    def test_pages_walk_back_through_whole_thread(self):
+        conversation = self.create_thread(75, self.alice, self.bob)
+        expected = list(conversation.messages.order_by('timestamp', 'id'))
+
+        seen = []
+        page, cursor = get_history_page(conversation, size=20)
+        seen[:0] = page
+        while cursor:
+            page, cursor = get_history_page(
+                conversation, before=cursor, size=20)
+            seen[:0] = page
+
+        self.assertEqual(seen, expected)
+
+    def test_page_cost_does_not_grow_with_thread(self):
+        short = self.create_thread(PAGE_SIZE + 5, self.alice, self.bob)
+        carol = User.objects.create_user(username='carol', password='x')
+        long = self.create_thread(PAGE_SIZE * 10, self.alice, carol)
+
+        for conversation in (short, long):
+            with CaptureQueriesContext(connection) as queries:
+                page, cursor = get_history_page(conversation)
+            self.assertEqual(len(queries), 1)
+            self.assertEqual(len(page), PAGE_SIZE)
+            self.assertIsNotNone(cursor)
+
+    def test_endpoint_returns_older_page(self):
+        conversation = self.create_thread(PAGE_SIZE + 5, self.alice, self.bob)
+        _, cursor = get_history_page(conversation)
+        self.client.login(username='alice', password='pass123')
+
+        response = self.client.get(
+            reverse('message_history', args=[conversation.id]),
+            {'before': cursor})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['html'].count('message-bubble'), 5)
+        self.assertIn('Message 0', data['html'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_endpoint_rejects_bad_cursor(self):
+        conversation = self.create_thread(3, self.alice, self.bob)
+        self.client.login(username='alice', password='pass123')
+
+        response = self.client.get(
+            reverse('message_history', args=[conversation.id]),
+            {'before': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_endpoint_hidden_from_other_users(self):
+        conversation = self.create_thread(3, self.alice, self.bob)
+        User.objects.create_user(username='carol', password='pass123')
+        self.client.login(username='carol', password='pass123')
+
+        response = self.client.get(
+            reverse('message_history', args=[conversation.id]))
+
+        self.assertEqual(response.status_code, 404)
+
+
+class InboxTest(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            username='alice', password='pass123')
+        self.bob = User.objects.create_user(
+            username='bob', password='pass123')
+        self.carol = User.objects.create_user(
+            username='carol', password='pass123')
+
+    def participant(self, user, other_user):
+        return ConversationParticipant.objects.get(
+            user=user,
+            conversation=Conversation.objects.between(user, other_user))
+
+    def test_unread_counts_follow_messages(self):
+        Message.objects.create(
+            sender=self.bob, recipient=self.alice, content='Hi')
+        Message.objects.create(
+            sender=self.bob, recipient=self.alice, content='Are you there?')
+
+        alice = self.participant(self.alice, self.bob)
+        bob = self.participant(self.bob, self.alice)
+        self.assertEqual(alice.unread_count, 2)
+        self.assertEqual(bob.unread_count, 0)
+
+        # Replying means the earlier messages were read
+        reply = Message.objects.create(
+            sender=self.alice, recipient=self.bob, content='Yes')
+        alice = self.participant(self.alice, self.bob)
+        self.assertEqual(alice.unread_count, 0)
+        self.assertEqual(alice.last_read_at, reply.timestamp)
+        bob.refresh_from_db()
+        self.assertEqual(bob.unread_count, 1)
+
+    def test_mark_read_clears_unread_count(self):
+        message = Message.objects.create(
+            sender=self.bob, recipient=self.alice, content='Hi')
+
+        message.conversation.refresh_from_db()
+        message.conversation.mark_read(self.alice)
+
+        alice = self.participant(self.alice, self.bob)
+        self.assertEqual(alice.unread_count, 0)
+        self.assertEqual(alice.last_read_at, message.timestamp)
+
+    def test_inbox_lists_conversations_by_activity(self):
+        Message.objects.create(
+            sender=self.bob, recipient=self.alice, content='Hi from Bob')
+        Message.objects.create(
+            sender=self.alice, recipient=self.carol, content='Hi Carol')
+        Message.objects.create(
+            sender=self.bob, recipient=self.alice, content='Still there?')
+        self.client.login(username='alice', password='pass123')
+
+        response = self.client.get(reverse('inbox'))
+
+        self.assertEqual(response.status_code, 200)
+        rows = list(response.context['page'])
+        self.assertEqual(
+            [row.other_user for row in rows], [self.bob, self.carol])
+        self.assertEqual([row.unread_count for row in rows], [2, 0])
+        self.assertContains(response, 'Still there?')
+        self.assertContains(response, 'You: Hi Carol')
+
+    def test_inbox_queries_do_not_grow_with_conversations(self):
+        self.client.login(username='alice', password='pass123')
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('inbox'))
+            return len(queries)
+
+        Message.objects.create(
+            sender=self.bob, recipient=self.alice, content='Hi')
+        few = count_queries()
+        for i in range(20):
+            other = User.objects.create_user(username=f'user{i}')
+            Message.objects.create(
+                sender=other, recipient=self.alice, content='Hi')
+        self.assertEqual(count_queries(), few)
+
+    def test_inbox_requires_login(self):
+        response = self.client.get(reverse('inbox'))
+        self.assertEqual(response.status_code, 302)
+
+
+class MessagesSinceTest(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            username='alice', password='pass123')
+        self.bob = User.objects.create_user(
+            username='bob', password='pass123')
+        self.url = reverse('messages_since', args=[self.bob.id])
+        self.client.login(username='alice', password='pass123')
+
+    def send(self, sender, recipient, content):
+        return Message.objects.create(
+            sender=sender, recipient=recipient, content=content)
+
+    def test_returns_only_newer_messages(self):
+        seen = self.send(self.bob, self.alice, 'Seen')
+        self.send(self.alice, self.bob, 'Reply')
+        newest = self.send(self.bob, self.alice, 'New')
+
+        response = self.client.get(self.url, {'after': encode_cursor(seen)})
+
+        data = response.json()
+        self.assertEqual(
+            [message['content'] for message in data['messages']],
+            ['Reply', 'New'])
+        self.assertEqual(data['cursor'], encode_cursor(newest))
+        self.assertFalse(data['more'])
+
+    def test_pages_through_many_new_messages(self):
+        for i in range(PAGE_SIZE + 3):
+            self.send(self.bob, self.alice, f'Message {i}')
+
+        data = self.client.get(self.url).json()
+        self.assertEqual(len(data['messages']), PAGE_SIZE)
+        self.assertTrue(data['more'])
+
+        data = self.client.get(self.url, {'after': data['cursor']}).json()
+        self.assertEqual(len(data['messages']), 3)
+        self.assertFalse(data['more'])
+
+    def test_unchanged_conversation_returns_not_modified(self):
+        self.send(self.bob, self.alice, 'Hi')
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.send(self.bob, self.alice, 'Are you there?')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_not_modified_answered_from_cache(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.send(self.bob, self.alice, 'Hi')
+        etag = self.client.get(self.url)['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if 'messaging_' in query['sql']])
+
+    def test_no_conversation_yet(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['messages'], [])
+        self.assertEqual(response['ETag'], '"0"')
+
+    def test_rejects_bad_cursor(self):
+        self.send(self.bob, self.alice, 'Hi')
+        response = self.client.get(self.url, {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+
 class BookingRequestModelTest(TestCase):
 
     def setUp(self):
@@ -65,6 +376,325 @@ class BookingRequestModelTest(TestCase):
         )
         self.assertEqual(str(booking), expected_str)
 
+    def test_save_parses_requested_dates(self):
+        booking = BookingRequest.objects.create(
+            sender=self.sender, recipient=self.recipient,
+            requested_dates='2025-08-01 to 2025-08-10')
+        self.assertEqual(booking.start_date, date(2025, 8, 1))
+        self.assertEqual(booking.end_date, date(2025, 8, 10))
+
+        booking.requested_dates = '2025-09-01'
+        booking.save(update_fields=['requested_dates'])
+        booking.refresh_from_db()
+        self.assertEqual(booking.start_date, date(2025, 9, 1))
+        self.assertEqual(booking.end_date, date(2025, 9, 1))
+
+    def test_unparsable_dates_are_left_empty(self):
+        booking = BookingRequest.objects.create(
+            sender=self.sender, recipient=self.recipient,
+            requested_dates='sometime in August')
+        self.assertIsNone(booking.start_date)
+        self.assertFalse(booking.conflicts().exists())
+
+    def test_conflicts_with_accepted_bookings_of_either_user(self):
+        other = User.objects.create_user(username='carol', password='x')
+        accepted = BookingRequest.objects.create(
+            sender=other, recipient=self.recipient,
+            requested_dates='2025-08-05 to 2025-08-12', status='accepted')
+        BookingRequest.objects.create(
+            sender=other, recipient=self.sender,
+            requested_dates='2025-08-01 to 2025-08-20', status='pending')
+        BookingRequest.objects.create(
+            sender=other, recipient=self.sender,
+            requested_dates='2025-08-11 to 2025-08-20', status='accepted')
+
+        booking = BookingRequest.objects.create(
+            sender=self.sender, recipient=self.recipient,
+            requested_dates='2025-08-01 to 2025-08-05')
+        self.assertEqual(list(booking.conflicts()), [accepted])
+
+        booking.status = 'accepted'
+        booking.save()
+        self.assertEqual(list(booking.conflicts()), [accepted])
+
+    def test_calendar_merges_both_sides_in_date_order(self):
+        other = User.objects.create_user(username='carol', password='x')
+        hosted = BookingRequest.objects.create(
+            sender=other, recipient=self.sender,
+            requested_dates='2025-08-20 to 2025-08-25', status='accepted')
+        sent = BookingRequest.objects.create(
+            sender=self.sender, recipient=self.recipient,
+            requested_dates='2025-07-28 to 2025-08-02', status='accepted')
+        BookingRequest.objects.create(
+            sender=self.sender, recipient=other,
+            requested_dates='2025-08-10 to 2025-08-12', status='denied')
+        BookingRequest.objects.create(
+            sender=self.sender, recipient=other,
+            requested_dates='2025-09-10 to 2025-09-12', status='accepted')
+
+        self.assertEqual(
+            BookingRequest.objects.calendar(
+                self.sender, date(2025, 8, 1), date(2025, 8, 31)),
+            [sent, hosted])
+
+
+class BookingTransitionTest(TestCase):
+
+    def setUp(self):
+        self.sender = User.objects.create_user(
+            username='alice', password='pass123')
+        self.recipient = User.objects.create_user(
+            username='bob', password='pass123')
+        self.booking = BookingRequest.objects.create(
+            sender=self.sender, recipient=self.recipient,
+            requested_dates='2025-08-01 to 2025-08-10')
+
+    def test_transition_bumps_version(self):
+        self.booking.transition(
+            'amended', self.recipient,
+            requested_dates='2025-08-03 to 2025-08-12')
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'amended')
+        self.assertEqual(self.booking.version, 1)
+        self.assertEqual(self.booking.last_action_by, self.recipient)
+        self.assertEqual(self.booking.start_date, date(2025, 8, 3))
+        self.assertIsNotNone(self.booking.responded_at)
+
+    def test_transition_not_in_table_rejected(self):
+        self.booking.transition('denied', self.recipient)
+
+        with self.assertRaises(InvalidTransition):
+            self.booking.transition('accepted', self.sender)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'denied')
+
+    def test_stale_transition_reports_conflict(self):
+        stale = BookingRequest.objects.get(pk=self.booking.pk)
+        self.booking.transition('accepted', self.recipient)
+
+        with self.assertRaises(BookingConflict):
+            stale.transition('denied', self.recipient)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'accepted')
+        self.assertEqual(self.booking.version, 1)
+
+    def test_transition_checks_version_seen_by_user(self):
+        self.booking.transition('amended', self.sender)
+
+        with self.assertRaises(BookingConflict):
+            self.booking.transition('accepted', self.recipient, version=0)
+
+
+class BookingTransitionStressTest(TransactionTestCase):
+    """
+    Races threads, each on its own database connection, through
+    BookingRequest.transition().
+    """
+    THREADS = 8
+
+    def setUp(self):
+        self.sender = User.objects.create_user(username='alice')
+        self.recipient = User.objects.create_user(username='bob')
+        self.booking = BookingRequest.objects.create(
+            sender=self.sender, recipient=self.recipient,
+            requested_dates='2025-08-01 to 2025-08-10')
+
+    def run_threads(self, target):
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def run(i):
+            try:
+                barrier.wait()
+                target(i)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=run, args=(i,))
+            for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def transition(self, booking, *args, **kwargs):
+        # SQLite's shared in-memory test database reports a table lock
+        # instead of waiting for it, so retry until the write goes through
+        while True:
+            try:
+                return booking.transition(*args, **kwargs)
+            except OperationalError:
+                pass
+
+    def test_one_of_concurrent_responses_wins(self):
+        outcomes = []
+        # Every thread responds to the booking as it was first read
+        bookings = [
+            BookingRequest.objects.get(pk=self.booking.pk)
+            for _ in range(self.THREADS)]
+
+        def respond(i):
+            booking = bookings[i]
+            status = 'accepted' if i % 2 else 'denied'
+            try:
+                self.transition(booking, status, self.recipient)
+                outcomes.append(status)
+            except BookingConflict:
+                outcomes.append('conflict')
+
+        self.run_threads(respond)
+
+        self.booking.refresh_from_db()
+        winners = [o for o in outcomes if o != 'conflict']
+        self.assertEqual(len(outcomes), self.THREADS)
+        self.assertEqual(winners, [self.booking.status])
+        self.assertEqual(self.booking.version, 1)
+
+    def test_no_transition_lost_when_retrying(self):
+        rounds = 5
+
+        def amend(i):
+            for _ in range(rounds):
+                while True:
+                    booking = BookingRequest.objects.get(pk=self.booking.pk)
+                    try:
+                        self.transition(booking, 'amended', self.sender)
+                        break
+                    except BookingConflict:
+                        continue
+
+        self.run_threads(amend)
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.version, self.THREADS * rounds)
+
+
+class ExpireBookingsTest(TestCase):
+
+    def setUp(self):
+        self.sender = User.objects.create_user(
+            username='alice', password='pass123', email='a@example.com')
+        self.recipient = User.objects.create_user(
+            username='bob', password='pass123', email='b@example.com')
+        self.today = date(2025, 9, 1)
+
+    def book(self, dates, status='pending'):
+        return BookingRequest.objects.create(
+            sender=self.sender, recipient=self.recipient,
+            requested_dates=dates, status=status)
+
+    def test_expires_open_bookings_whose_dates_passed(self):
+        pending = self.book('2025-08-01 to 2025-08-10')
+        amended = self.book('2025-08-20 to 2025-08-31', status='amended')
+        kept = [
+            self.book('2025-08-25 to 2025-09-01'),
+            self.book('2025-08-01 to 2025-08-10', status='accepted'),
+            self.book('sometime'),
+        ]
+
+        expired, batches, _ = expire_stale_bookings(today=self.today)
+
+        self.assertEqual((expired, batches), (2, 1))
+        for booking in [pending, amended]:
+            booking.refresh_from_db()
+            self.assertEqual(booking.status, 'expired')
+            self.assertEqual(booking.version, 1)
+            self.assertIsNone(booking.last_action_by)
+        for booking in kept:
+            status = booking.status
+            booking.refresh_from_db()
+            self.assertEqual(booking.status, status)
+
+    def test_notifies_both_users_and_queues_one_summary_each(self):
+        self.book('2025-08-01 to 2025-08-10')
+        self.book('2025-08-11 to 2025-08-20')
+
+        expire_stale_bookings(today=self.today)
+
+        self.assertEqual(
+            Notification.objects.filter(user=self.sender).count(), 2)
+        self.assertEqual(
+            Notification.objects.filter(user=self.recipient).count(), 2)
+        emails = OutboundEmail.objects.order_by('id')
+        self.assertEqual(
+            [email.to for email in emails],
+            [['a@example.com'], ['b@example.com']])
+        self.assertIn('2025-08-11 to 2025-08-20', emails[0].body)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_invalidates_cached_unread_counts(self):
+        cache.clear()
+        self.book('2025-08-01 to 2025-08-10')
+        self.assertEqual(unread_count(self.sender.id), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            expire_stale_bookings(today=self.today)
+
+        self.assertEqual(unread_count(self.sender.id), 1)
+
+    def test_batches_cover_the_id_range(self):
+        bookings = [
+            self.book('2025-08-01 to 2025-08-10') for _ in range(5)]
+
+        expired, batches, _ = expire_stale_bookings(
+            batch_size=2, today=self.today)
+
+        self.assertEqual((expired, batches), (5, 3))
+        # One summary per user for the whole run, not one per batch
+        emails = OutboundEmail.objects.order_by('id')
+        self.assertEqual(
+            [email.to for email in emails],
+            [['a@example.com'], ['b@example.com']])
+        self.assertEqual(emails[0].body.count('2025-08-01 to 2025-08-10'), 5)
+        self.assertEqual(expire_batch(
+            bookings[0].id, bookings[-1].id + 1, self.today), 0)
+        self.assertFalse(ExpirySummaryLine.objects.exists())
+
+    def test_summary_lines_of_an_interrupted_run_are_sent_later(self):
+        first, second = [
+            self.book(dates) for dates in
+            ['2025-08-01 to 2025-08-10', '2025-08-11 to 2025-08-20']]
+
+        # A run that stopped after its first batch
+        expire_batch(first.id, first.id + 1, self.today)
+        self.assertFalse(OutboundEmail.objects.exists())
+        self.assertEqual(ExpirySummaryLine.objects.count(), 2)
+
+        expired, _, _ = expire_stale_bookings(today=self.today)
+
+        self.assertEqual(expired, 1)
+        emails = OutboundEmail.objects.order_by('id')
+        self.assertEqual(
+            [email.to for email in emails],
+            [['a@example.com'], ['b@example.com']])
+        for email in emails:
+            self.assertIn('2025-08-01 to 2025-08-10', email.body)
+            self.assertIn('2025-08-11 to 2025-08-20', email.body)
+        self.assertFalse(ExpirySummaryLine.objects.exists())
+
+    def test_stale_response_conflicts_with_expiry(self):
+        booking = self.book('2025-08-01 to 2025-08-10')
+
+        expire_stale_bookings(today=self.today)
+
+        with self.assertRaises(BookingConflict):
+            booking.transition('accepted', self.recipient)
+
+    def test_command_reports_throughput(self):
+        self.book('2025-08-01 to 2025-08-10')
+        out = StringIO()
+
+        call_command('expire_bookings', stdout=out)
+
+        self.assertIn(
+            'Expired 1 booking requests in 1 batches', out.getvalue())
+
 
 class MessageFormTest(TestCase):
 
@@ -93,6 +723,12 @@ class BookingRequestFormTest(TestCase):
             data={'requested_dates': '2025-08-10 to 2025-08-20'})
         self.assertTrue(form.is_valid())
 
+    def test_unparsable_booking_request_form(self):
+        form = BookingRequestForm(
+            data={'requested_dates': '2025-08-20 to 2025-08-10'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('requested_dates', form.errors)
+
     def test_blank_booking_request_form(self):
         form = BookingRequestForm(data={'requested_dates': ''})
         self.assertFalse(form.is_valid())
@@ -103,4 +739,59 @@ class BookingRequestFormTest(TestCase):
         widget = form.fields['requested_dates'].widget
         self.assertEqual(widget.attrs.get('id'), 'requested-dates')
         self.assertEqual(
-            widget.attrs.get('placeholder'), 'Select exchange dates')
\ No newline at end of file
+            widget.attrs.get('placeholder'), 'Select exchange dates')
+
+
+class MessagingQueryPlanTest(QueryPlanMixin, TestCase):
+
+    def setUp(self):
+        self.sender = User.objects.create_user(
+            username='alice', password='pass123')
+        self.recipient = User.objects.create_user(
+            username='bob', password='pass123')
+
+    def test_history_pages_use_index(self):
+        message = Message.objects.create(
+            sender=self.sender, recipient=self.recipient, content='Hi')
+        messages = message.conversation.messages.order_by(
+            '-timestamp', '-id')
+        self.assertIndexed(messages[:PAGE_SIZE + 1])
+        self.assertIndexed(messages.filter(
+            timestamp__lte=message.timestamp
+        ).exclude(
+            timestamp=message.timestamp, id__gte=message.id
+        )[:PAGE_SIZE + 1])
+
+    def test_new_messages_use_index(self):
+        message = Message.objects.create(
+            sender=self.sender, recipient=self.recipient, content='Hi')
+        messages = message.conversation.messages.order_by('timestamp', 'id')
+        self.assertIndexed(messages.filter(
+            timestamp__gte=message.timestamp
+        ).exclude(
+            timestamp=message.timestamp, id__lte=message.id
+        )[:PAGE_SIZE + 1])
+
+    def test_inbox_uses_index(self):
+        self.assertIndexed(ConversationParticipant.objects.filter(
+            user=self.sender, last_message_at__isnull=False,
+        ).order_by('-last_message_at')[:25])
+
+    def test_booking_overlap_check_uses_index(self):
+        self.assertIndexed(BookingRequest.objects.overlapping(
+            [self.sender.id, self.recipient.id],
+            date(2025, 8, 1), date(2025, 8, 10)))
+
+    def test_booking_calendar_uses_index(self):
+        for side in ['sender', 'recipient']:
+            self.assertIndexed(BookingRequest.objects.filter(
+                **{side: self.sender},
+                status='accepted',
+                start_date__lte=date(2025, 8, 31),
+                end_date__gte=date(2025, 8, 1),
+            ).order_by('start_date'))
+
+    def test_latest_booking_in_one_direction_uses_index(self):
+        self.assertIndexed(BookingRequest.objects.filter(
+            sender=self.sender, recipient=self.recipient
+        ).order_by('-created_at')[:1])
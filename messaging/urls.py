@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('inbox/', views.inbox, name='inbox'),
+    path('conversations/<int:conversation_id>/history/',
+         views.message_history, name='message_history'),
+    path('with/<int:user_id>/messages/',
+         views.messages_since, name='messages_since'),
+]
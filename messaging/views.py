@@ -0,0 +1,101 @@
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.template.loader import render_to_string
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .history import encode_cursor, get_history_page, get_messages_after
+from .models import (
+    Conversation, ConversationParticipant, latest_message_id)
+
+# Conversations listed per inbox page
+INBOX_PAGE_SIZE = 25
+
+
+@login_required
+def inbox(request):
+    """
+    The user's conversations, most recent activity first. Each row comes
+    from the user's ConversationParticipant, which carries the unread
+    count and last activity, joined to the conversation's last message
+    and users in the same query.
+    """
+    participants = ConversationParticipant.objects.filter(
+        user=request.user, last_message_at__isnull=False,
+    ).select_related(
+        'conversation__last_message',
+        'conversation__user_a',
+        'conversation__user_b',
+    ).order_by('-last_message_at')
+    page = Paginator(participants, INBOX_PAGE_SIZE).get_page(
+        request.GET.get('page'))
+    for participant in page:
+        participant.other_user = participant.conversation.other_user(
+            request.user)
+
+    return render(request, 'inbox.html', {'page': page})
+
+
+@login_required
+def message_history(request, conversation_id):
+    """
+    Older messages of a conversation for the message window, loaded as the
+    user scrolls up. Pass the next_cursor of the previous response as
+    ?before= to get the page before it.
+    """
+    conversation = get_object_or_404(
+        Conversation.objects.for_user(request.user), id=conversation_id)
+    try:
+        page, next_cursor = get_history_page(
+            conversation, before=request.GET.get('before'))
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    return JsonResponse({
+        'html': render_to_string(
+            'partials/message_bubbles.html',
+            {'messages_between': page, 'user': request.user}),
+        'next_cursor': next_cursor,
+    })
+
+
+def messages_since_etag(request, user_id):
+    # Changes whenever a message is sent either way between the two users
+    if not request.user.is_authenticated:
+        return None
+    return str(latest_message_id(request.user.id, user_id))
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=messages_since_etag)
+def messages_since(request, user_id):
+    """
+    Messages between the user and user_id newer than the ?after= cursor,
+    for clients polling an open conversation. A request whose
+    If-None-Match holds the current ETag gets a 304, answered from the
+    cached latest message id without reading the message table.
+    """
+    after = request.GET.get('after')
+    conversation = Conversation.objects.between_ids(
+        request.user.id, user_id).first()
+    if conversation is None:
+        return JsonResponse({'messages': [], 'cursor': after, 'more': False})
+    try:
+        page, more = get_messages_after(conversation, after=after)
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    return JsonResponse({
+        'messages': [{
+            'id': message.id,
+            'sender_id': message.sender_id,
+            'sender': message.sender.username,
+            'content': message.content,
+            'timestamp': message.timestamp.isoformat(),
+        } for message in page],
+        'cursor': encode_cursor(page[-1]) if page else after,
+        'more': more,
+    })
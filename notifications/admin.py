@@ -1,9 +1,16 @@
 from django.contrib import admin
-from .models import Notification
+from .models import Notification, OutboundEmail
 
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ('user', 'message', 'is_read', 'created_at')
     list_filter = ('is_read', 'created_at')
-    search_fields = ('user__username', 'message')
\ No newline at end of file
+    search_fields = ('user__username', 'message')
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'to')
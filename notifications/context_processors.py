@@ -1,8 +1,9 @@
-from notifications.models import Notification
+from notifications.models import unread_count
 
 
 def unread_notifications(request):
+    # Only the badge count is needed on every page; the dropdown loads its
+    # preview from notification_preview when the bell is opened
     if request.user.is_authenticated:
-        unread = Notification.objects.filter(user=request.user, is_read=False)
-        return {'unread_notifications': unread}
-    return {'unread_notifications': []}
+        return {'unread_notification_count': unread_count(request.user.id)}
+    return {'unread_notification_count': 0}
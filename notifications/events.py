@@ -0,0 +1,213 @@
+"""
+Push channel for events a user should see without reloading the page: new
+messages, booking changes and notifications.
+
+Events are published to a broker once the transaction that produced them
+commits, and the event_stream view relays them to the user's open
+EventSource connections as server-sent events. The view is async, so under
+an ASGI server an idle connection is a suspended coroutine waiting on a
+queue rather than a thread, and one worker process can hold thousands.
+
+The broker class is set with settings.EVENT_BROKER. InProcessBroker only
+reaches connections held by the same process, which suits runserver and
+the tests. When the site is served from several ASGI worker processes
+(codestar.asgi), RedisBroker carries the events between them over Redis
+pub/sub. The Heroku web process runs WSGI, where the stream is refused
+and pages poll for new messages instead.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+DEFAULT_BROKER = 'notifications.events.InProcessBroker'
+
+# Seconds before a lost Redis subscription is opened again
+RESUBSCRIBE_DELAY = 1
+
+logger = logging.getLogger(__name__)
+
+# Events held for a connection that is not reading them; later events are
+# dropped until it catches up, and the page shows them on its next load
+QUEUE_SIZE = 100
+
+
+class Subscription:
+    """One open connection's queue of events, bound to its event loop."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def put(self, event):
+        # Runs on self.loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+
+class Broker:
+    """
+    Interface of an event broker. subscribe() and unsubscribe() are called
+    on the event loop serving the connection; publish() is called from
+    sync code, usually a view's thread.
+    """
+
+    def subscribe(self, user_id):
+        """Returns a new Subscription to the user's events."""
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, user_id, event):
+        """Sends event, a JSON-serializable dict with a 'type' key."""
+        raise NotImplementedError
+
+
+class InProcessBroker(Broker):
+    def __init__(self):
+        self._lock = threading.Lock()
+        # user id -> set of Subscriptions
+        self._subscriptions = {}
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_id, event):
+        self.deliver(user_id, event)
+
+    def deliver(self, user_id, event):
+        """Hands event to the user's connections on this process."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.put, event)
+            except RuntimeError:
+                # The connection's event loop has closed
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(map(len, self._subscriptions.values()))
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Shares events between processes through one Redis pub/sub channel on
+    settings.EVENT_BROKER_URL. publish() sends to the channel from any
+    process; a process holding streams runs one listener task on its event
+    loop, started by the first subscribe(), that delivers each event to
+    its own connections.
+    """
+
+    channel = 'travelswap:events'
+
+    def __init__(self, url=None):
+        super().__init__()
+        self.url = url or settings.EVENT_BROKER_URL
+        self._client = None
+        self._listener = None
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(
+                self._listen())
+        return subscription
+
+    def publish(self, user_id, event):
+        import redis
+
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        message = json.dumps(
+            {'user_id': user_id, 'event': event}, cls=DjangoJSONEncoder)
+        try:
+            self._client.publish(self.channel, message)
+        except redis.RedisError as exc:
+            # Pages still show the change on their next load
+            logger.warning(f"Could not publish event: {exc}")
+
+    def receive(self, message):
+        """Delivers a message read from the channel."""
+        data = json.loads(message)
+        self.deliver(data['user_id'], data['event'])
+
+    async def _listen(self):
+        import redis
+        import redis.asyncio
+
+        while True:
+            client = redis.asyncio.Redis.from_url(self.url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.receive(message['data'])
+            except redis.RedisError as exc:
+                logger.warning(f"Event subscription lost: {exc}")
+            finally:
+                await client.aclose()
+            await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(
+                getattr(settings, 'EVENT_BROKER', DEFAULT_BROKER))()
+        return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    global _broker
+    if setting == 'EVENT_BROKER':
+        with _broker_lock:
+            _broker = None
+
+
+def publish_on_commit(user_ids, event):
+    """
+    Publishes event to each user once the current transaction commits, so
+    clients never hear about rows they cannot load yet or that were
+    rolled back.
+    """
+    def publish():
+        broker = get_broker()
+        for user_id in user_ids:
+            broker.publish(user_id, event)
+
+    transaction.on_commit(publish)
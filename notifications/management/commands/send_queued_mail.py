@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications.models import OutboundEmail
+from notifications.outbox import MAX_ATTEMPTS, drain
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver the queued emails in the outbox in batches, reusing one "
+        "mail connection per batch and retrying failures with exponential "
+        "backoff. Runs once by default, or keeps polling with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument(
+            '--max-attempts', type=int, default=MAX_ATTEMPTS)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep polling the outbox instead of exiting once drained.")
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help="Seconds to wait between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, retried, failed, elapsed = drain(
+                options['batch_size'], options['max_attempts'])
+            if sent or retried or failed or not options['loop']:
+                self.report(sent, retried, failed, elapsed)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def report(self, sent, retried, failed, elapsed):
+        rate = sent / elapsed if elapsed else 0.0
+        pending = OutboundEmail.objects.filter(
+            status=OutboundEmail.PENDING).count()
+        self.stdout.write(
+            f"Sent {sent}, retrying {retried}, failed {failed} "
+            f"in {elapsed:.2f}s ({rate:.1f} emails/s), "
+            f"{pending} still pending.")
@@ -1,5 +1,41 @@
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from codestar.metrics import record_cache
+
+
+# Seconds a cached unread count may live, as a backstop for writes that
+# bypass invalidate_unread_count()
+UNREAD_COUNT_TTL = 300
+
+
+def _unread_count_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def unread_count(user_id):
+    """The user's number of unread notifications, cached between writes."""
+    key = _unread_count_key(user_id)
+    count = cache.get(key)
+    record_cache(hits=count is not None, misses=count is None)
+    if count is None:
+        count = Notification.objects.filter(
+            user_id=user_id, is_read=False).count()
+        cache.set(key, count, UNREAD_COUNT_TTL)
+    return count
+
+
+def invalidate_unread_count(user_id):
+    """
+    Drops the cached unread count now and again once the current
+    transaction commits, so a request that reads the count in between
+    cannot cache the pre-commit value.
+    """
+    key = _unread_count_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
 
 
 class Notification(models.Model):
@@ -9,5 +45,51 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at'],
+                condition=models.Q(is_read=False),
+                name='notification_unread_idx'),
+        ]
+
     def __str__(self):
         return f"Notification for {self.user.username}: {self.message}"
+
+
+class OutboundEmail(models.Model):
+    """
+    An email waiting in the outbox. Rows are written in the same
+    transaction as the change they report on and delivered later by the
+    send_queued_mail command.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField()
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'next_attempt_at'],
+                name='outboundemail_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
@@ -0,0 +1,140 @@
+"""
+Transactional email outbox.
+
+Views call queue_mail() instead of send_mail() so the email is stored
+alongside the change it reports on, and a slow or failing SMTP server no
+longer affects the request. The send_queued_mail command delivers the
+outbox in batches with deliver_batch().
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger('email_notifications')
+
+MAX_ATTEMPTS = 5
+# Delay before the first retry, doubled after each further failure
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+
+
+def queue_mail(subject, message, from_email, recipient_list):
+    """Adds an email to the outbox. Takes the same arguments as send_mail."""
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(recipient_list),
+    )
+
+
+def queue_mass_mail(datatuple):
+    """
+    Adds several emails to the outbox in one INSERT. Takes the same
+    (subject, message, from_email, recipient_list) tuples as
+    send_mass_mail.
+    """
+    return OutboundEmail.objects.bulk_create([
+        OutboundEmail(
+            subject=subject,
+            body=message,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            to=list(recipient_list),
+        )
+        for subject, message, from_email, recipient_list in datatuple
+    ])
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def deliver_batch(batch_size=50, max_attempts=MAX_ATTEMPTS, connection=None):
+    """
+    Sends up to batch_size due emails over a single mail connection.
+    Returns a (sent, retried, failed) tuple of counts.
+
+    The claimed rows stay locked until the batch is recorded, and other
+    workers skip them, so several workers can drain the outbox at once.
+    """
+    sent = retried = failed = 0
+    with transaction.atomic():
+        batch = list(OutboundEmail.objects.select_for_update(
+            skip_locked=True
+        ).filter(
+            status=OutboundEmail.PENDING,
+            next_attempt_at__lte=timezone.now(),
+        ).order_by('next_attempt_at')[:batch_size])
+        if not batch:
+            return sent, retried, failed
+
+        try:
+            connection = connection or get_connection()
+            connection.open()
+        except Exception as exc:
+            # Nothing can be sent in this batch, so all of it is retried
+            logger.warning(f"Could not open mail connection: {exc}")
+            errors = {email.id: exc for email in batch}
+        else:
+            errors = {}
+            try:
+                for email in batch:
+                    message = EmailMessage(
+                        email.subject, email.body, email.from_email,
+                        email.to, connection=connection)
+                    try:
+                        connection.send_messages([message])
+                    except Exception as exc:
+                        errors[email.id] = exc
+            finally:
+                connection.close()
+
+        now = timezone.now()
+        for email in batch:
+            email.attempts += 1
+            exc = errors.get(email.id)
+            if exc is None:
+                email.status = OutboundEmail.SENT
+                email.sent_at = now
+                email.last_error = ''
+                sent += 1
+                logger.info(
+                    f"Email sent to: {', '.join(email.to)} "
+                    f"with subject: {email.subject}")
+            elif email.attempts >= max_attempts:
+                email.status = OutboundEmail.FAILED
+                email.last_error = str(exc)
+                failed += 1
+                logger.error(
+                    f"Giving up on email {email.id} after "
+                    f"{email.attempts} attempts: {exc}")
+            else:
+                email.next_attempt_at = now + retry_delay(email.attempts)
+                email.last_error = str(exc)
+                retried += 1
+        OutboundEmail.objects.bulk_update(batch, [
+            'status', 'attempts', 'next_attempt_at', 'last_error',
+            'sent_at'])
+    return sent, retried, failed
+
+
+def drain(batch_size=50, max_attempts=MAX_ATTEMPTS):
+    """
+    Delivers batches until no due email is left. Returns the totals and
+    the elapsed seconds.
+    """
+    totals = [0, 0, 0]
+    started = time.monotonic()
+    while True:
+        counts = deliver_batch(batch_size, max_attempts)
+        if not any(counts):
+            break
+        totals = [total + count for total, count in zip(totals, counts)]
+    return (*totals, time.monotonic() - started)
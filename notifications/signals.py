@@ -0,0 +1,22 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .events import publish_on_commit
+from .models import Notification, invalidate_unread_count
+
+
+# Keep the cached unread badge count in step with notification writes
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def update_unread_count(sender, instance, **kwargs):
+    invalidate_unread_count(instance.user_id)
+
+
+@receiver(post_save, sender=Notification)
+def publish_notification(sender, instance, created, **kwargs):
+    if created:
+        publish_on_commit([instance.user_id], {
+            'type': 'notification',
+            'id': instance.id,
+            'message': instance.message,
+            'link': instance.link,
+        })
@@ -1,10 +1,31 @@
-from django.test import TestCase, Client, RequestFactory
+from django.test import TestCase, RequestFactory
 from django.contrib.auth.models import User, AnonymousUser
-from notifications.models import Notification
+from notifications.models import Notification, OutboundEmail
+from notifications.outbox import queue_mail, deliver_batch, retry_delay
 from django.utils import timezone
 from datetime import timedelta
 from django.urls import reverse
 from notifications.context_processors import unread_notifications
+from notifications.models import unread_count, invalidate_unread_count
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.management import call_command
+from io import StringIO
+from unittest import mock
+from codestar.testing import QueryBudgetMixin, QueryPlanMixin
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from messaging.models import BookingRequest, Message
+from notifications.events import (
+    Broker, InProcessBroker, RedisBroker, get_broker)
+import redis
+from notifications.views import stream_events
 
 
 class NotificationModelTest(TestCase):
@@ -35,10 +56,9 @@ class NotificationModelTest(TestCase):
         self.assertEqual(str(notif), expected_str)
 
 
-class NotificationViewsTest(TestCase):
+class NotificationViewsTest(QueryBudgetMixin, TestCase):
 
     def setUp(self):
-        self.client = Client()
         self.user = User.objects.create_user(
             username='testuser', password='pass123')
         self.other_user = User.objects.create_user(
@@ -96,30 +116,375 @@ class NotificationContextProcessorTest(TestCase):
         self.user = User.objects.create_user(
             username='testuser', password='pass123')
 
-    def test_returns_queryset_for_authenticated_user(self):
+    def test_returns_count_for_authenticated_user(self):
         Notification.objects.create(
             user=self.user, message='Test', is_read=False)
         request = self.factory.get('/')
         request.user = self.user
 
         context = unread_notifications(request)
-        self.assertIn('unread_notifications', context)
-        self.assertEqual(context['unread_notifications'].count(), 1)
+        self.assertEqual(context['unread_notification_count'], 1)
 
-    def test_returns_empty_queryset_if_all_read(self):
+    def test_returns_zero_if_all_read(self):
         Notification.objects.create(
             user=self.user, message='Test', is_read=True)
         request = self.factory.get('/')
         request.user = self.user
 
         context = unread_notifications(request)
-        self.assertIn('unread_notifications', context)
-        self.assertEqual(context['unread_notifications'].count(), 0)
+        self.assertEqual(context['unread_notification_count'], 0)
 
-    def test_returns_empty_list_for_anonymous_user(self):
+    def test_returns_zero_for_anonymous_user(self):
         request = self.factory.get('/')
         request.user = AnonymousUser()
 
-        context = unread_notifications(request)
-        self.assertIn('unread_notifications', context)
-        self.assertEqual(context['unread_notifications'], [])
+        with self.assertNumQueries(0):
+            context = unread_notifications(request)
+        self.assertEqual(context['unread_notification_count'], 0)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'unread-count-tests',
+}})
+class UnreadCountCacheTest(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser', password='pass123')
+        Notification.objects.create(user=self.user, message='First')
+
+    def test_count_is_cached_between_writes(self):
+        self.assertEqual(unread_count(self.user.id), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_count(self.user.id), 1)
+
+    def test_writes_invalidate_cached_count(self):
+        self.assertEqual(unread_count(self.user.id), 1)
+        second = Notification.objects.create(
+            user=self.user, message='Second')
+        self.assertEqual(unread_count(self.user.id), 2)
+
+        second.is_read = True
+        second.save()
+        self.assertEqual(unread_count(self.user.id), 1)
+
+        self.client.login(username='testuser', password='pass123')
+        self.client.post(reverse('mark_all_read'))
+        self.assertEqual(unread_count(self.user.id), 0)
+
+    def test_page_cost_does_not_grow_with_unread_count(self):
+        self.client.login(username='testuser', password='pass123')
+        self.client.get(reverse('about'))
+        with CaptureQueriesContext(connection) as one:
+            response = self.client.get(reverse('about'))
+        self.assertContains(response, '1 unread notifications')
+
+        Notification.objects.bulk_create([
+            Notification(user=self.user, message=f'Note {i}')
+            for i in range(500)
+        ])
+        invalidate_unread_count(self.user.id)
+        self.client.get(reverse('about'))
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('about'))
+        self.assertContains(response, '501 unread notifications')
+        self.assertNotContains(response, 'Note 1')
+        self.assertEqual(len(many), len(one))
+
+
+class NotificationPreviewTest(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='pass123')
+        self.url = reverse('notification_preview')
+
+    def test_preview_is_capped_to_latest(self):
+        Notification.objects.bulk_create([
+            Notification(user=self.user, message=f'Note {i}')
+            for i in range(15)
+        ])
+        self.client.login(username='testuser', password='pass123')
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, 'partials/notification_preview.html')
+        self.assertEqual(len(response.context['notifications']), 10)
+        self.assertContains(response, 'Showing the latest 10 of 15')
+        self.assertContains(response, 'Mark all as read')
+
+    def test_preview_empty(self):
+        self.client.login(username='testuser', password='pass123')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'No new notifications')
+
+    def test_preview_requires_login(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+
+class RecordingBroker(Broker):
+    """Stand-in broker that keeps what was published."""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, user_id, event):
+        self.published.append((user_id, event))
+
+
+@override_settings(EVENT_BROKER='notifications.tests.RecordingBroker')
+class EventPublishingTest(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        get_broker().published.clear()
+
+    def test_new_message_published_to_recipient_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            message = Message.objects.create(
+                sender=self.alice, recipient=self.bob, content='Hi')
+            self.assertEqual(get_broker().published, [])
+
+        for callback in callbacks:
+            callback()
+        [(user_id, event)] = get_broker().published
+        self.assertEqual(user_id, self.bob.id)
+        self.assertEqual(event['type'], 'message')
+        self.assertEqual(event['id'], message.id)
+        self.assertEqual(event['sender'], 'alice')
+
+    def test_booking_change_published_to_other_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = BookingRequest.objects.create(
+                sender=self.alice, recipient=self.bob,
+                requested_dates='2025-08-01 to 2025-08-05',
+                last_action_by=self.alice)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.transition('accepted', self.bob)
+
+        self.assertEqual(
+            [(user_id, event['status'])
+             for user_id, event in get_broker().published],
+            [(self.bob.id, 'pending'), (self.alice.id, 'accepted')])
+
+    def test_new_notification_published(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(
+                user=self.bob, message='Someone liked you')
+
+        [(user_id, event)] = get_broker().published
+        self.assertEqual(user_id, self.bob.id)
+        self.assertEqual(event['type'], 'notification')
+        self.assertEqual(event['message'], 'Someone liked you')
+
+
+class InProcessBrokerTest(TestCase):
+    async def test_delivers_events_published_from_other_threads(self):
+        broker = InProcessBroker()
+        mine = broker.subscribe(1)
+        other = broker.subscribe(2)
+
+        await asyncio.to_thread(broker.publish, 1, {'type': 'ping'})
+
+        self.assertEqual(
+            await asyncio.wait_for(mine.get(), 1), {'type': 'ping'})
+        self.assertTrue(other.queue.empty())
+
+    async def test_holds_many_idle_subscriptions(self):
+        broker = InProcessBroker()
+        subscriptions = [broker.subscribe(user_id) for user_id in range(5000)]
+        self.assertEqual(broker.subscriber_count(), 5000)
+
+        broker.publish(1234, {'type': 'ping'})
+        await asyncio.sleep(0)
+
+        self.assertEqual(
+            [s.user_id for s in subscriptions if not s.queue.empty()],
+            [1234])
+        for subscription in subscriptions:
+            broker.unsubscribe(subscription)
+        self.assertEqual(broker.subscriber_count(), 0)
+
+
+class RedisBrokerTest(TestCase):
+    def setUp(self):
+        self.broker = RedisBroker('redis://events.example:6379/0')
+
+    def test_publish_sends_event_to_channel(self):
+        with mock.patch('redis.Redis.from_url') as from_url:
+            self.broker.publish(7, {'type': 'ping'})
+
+        from_url.assert_called_once_with('redis://events.example:6379/0')
+        channel, message = from_url.return_value.publish.call_args.args
+        self.assertEqual(channel, RedisBroker.channel)
+        self.assertEqual(json.loads(message), {
+            'user_id': 7, 'event': {'type': 'ping'}})
+
+    def test_publish_failure_is_logged(self):
+        with mock.patch('redis.Redis.from_url') as from_url:
+            from_url.return_value.publish.side_effect = (
+                redis.ConnectionError('refused'))
+            with self.assertLogs('notifications.events', 'WARNING'):
+                self.broker.publish(7, {'type': 'ping'})
+
+    async def test_received_events_reach_local_subscriptions(self):
+        listen = mock.AsyncMock()
+        with mock.patch.object(self.broker, '_listen', listen):
+            mine = self.broker.subscribe(7)
+            other = self.broker.subscribe(8)
+            self.broker.subscribe(7)
+        listen.assert_called_once()
+
+        self.broker.receive(json.dumps({
+            'user_id': 7, 'event': {'type': 'ping'}}))
+
+        self.assertEqual(
+            await asyncio.wait_for(mine.get(), 1), {'type': 'ping'})
+        self.assertTrue(other.queue.empty())
+
+
+class EventStreamViewTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='pass123')
+        self.url = reverse('event_stream')
+
+    async def test_stream_relays_published_events(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry:'))
+
+        broker = get_broker()
+        broker.publish(self.user.id, {'type': 'notification', 'id': 1})
+        chunk = (await asyncio.wait_for(anext(chunks), 1)).decode()
+        event, data = chunk.strip().split('\n')
+        self.assertEqual(event, 'event: notification')
+        self.assertEqual(json.loads(data.removeprefix('data: ')), {
+            'type': 'notification', 'id': 1})
+
+        await chunks.aclose()
+
+    async def test_closing_stream_unsubscribes(self):
+        broker = get_broker()
+        before = broker.subscriber_count()
+        stream = stream_events(self.user.id)
+        await anext(stream)
+        self.assertEqual(broker.subscriber_count(), before + 1)
+
+        await stream.aclose()
+
+        self.assertEqual(broker.subscriber_count(), before)
+
+    async def test_stream_closes_after_lifetime(self):
+        before = get_broker().subscriber_count()
+        chunks = [chunk async for chunk in stream_events(1, lifetime=0)]
+        self.assertEqual(chunks, ['retry: 3000\n\n'])
+        self.assertEqual(get_broker().subscriber_count(), before)
+
+    async def test_anonymous_user_refused(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_not_streamed_under_wsgi(self):
+        self.client.login(username='testuser', password='pass123')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 204)
+
+
+class OutboxTest(TestCase):
+
+    def queue(self, count=1):
+        for i in range(count):
+            queue_mail(
+                f"Subject {i}", "Body", None, [f"user{i}@example.com"])
+
+    def failing_connection(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = OSError("SMTP down")
+        return connection
+
+    def test_queue_mail_does_not_send(self):
+        self.queue()
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.status, OutboundEmail.PENDING)
+        self.assertEqual(email.from_email, settings.DEFAULT_FROM_EMAIL)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_deliver_batch_sends_over_one_connection(self):
+        self.queue(3)
+        connection = get_connection()
+        with mock.patch.object(
+                connection, 'open', wraps=connection.open) as opened:
+            self.assertEqual(
+                deliver_batch(connection=connection), (3, 0, 0))
+        opened.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutboundEmail.objects.exclude(
+            status=OutboundEmail.SENT).exists())
+
+    def test_batch_size_limits_claimed_rows(self):
+        self.queue(3)
+        self.assertEqual(deliver_batch(batch_size=2), (2, 0, 0))
+        self.assertEqual(OutboundEmail.objects.filter(
+            status=OutboundEmail.PENDING).count(), 1)
+
+    def test_failed_send_retried_with_backoff(self):
+        self.queue()
+        before = timezone.now()
+        self.assertEqual(
+            deliver_batch(connection=self.failing_connection()), (0, 1, 0))
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.last_error, "SMTP down")
+        self.assertGreaterEqual(
+            email.next_attempt_at, before + timedelta(seconds=30))
+
+        # Not due yet, so the next batch leaves it alone
+        self.assertEqual(deliver_batch(), (0, 0, 0))
+        self.assertEqual(retry_delay(3), timedelta(seconds=120))
+
+    def test_gives_up_after_max_attempts(self):
+        self.queue()
+        OutboundEmail.objects.update(attempts=4)
+        self.assertEqual(
+            deliver_batch(connection=self.failing_connection()), (0, 0, 1))
+        self.assertEqual(
+            OutboundEmail.objects.get().status, OutboundEmail.FAILED)
+
+    def test_command_reports_throughput(self):
+        self.queue(2)
+        out = StringIO()
+        call_command('send_queued_mail', stdout=out)
+        self.assertIn("Sent 2, retrying 0, failed 0", out.getvalue())
+        self.assertIn("emails/s", out.getvalue())
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class NotificationQueryPlanTest(QueryBudgetMixin, QueryPlanMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='pass123')
+        Notification.objects.create(user=self.user, message='Unread')
+        Notification.objects.create(
+            user=self.user, message='Read', is_read=True)
+
+    def test_unread_count_uses_index(self):
+        self.assertIndexed(
+            Notification.objects.filter(user=self.user, is_read=False))
+
+    def test_preview_queries_use_indexes(self):
+        self.client.login(username='testuser', password='pass123')
+        response = self.assertViewQueriesIndexed(
+            lambda: self.client.get(reverse('notification_preview')))
+        self.assertContains(response, 'Unread')
+
+    def test_due_emails_use_index(self):
+        self.assertIndexed(OutboundEmail.objects.filter(
+            status=OutboundEmail.PENDING,
+            next_attempt_at__lte=timezone.now(),
+        ).order_by('next_attempt_at')[:50])
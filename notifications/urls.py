@@ -7,4 +7,7 @@ urlpatterns = [
          views.dismiss_notification, name='dismiss_notification'),
     path('read/<int:notification_id>/',
          views.mark_notification_read, name='mark_notification_read'),
+    path('preview/', views.notification_preview,
+         name='notification_preview'),
+    path('events/', views.event_stream, name='event_stream'),
 ]
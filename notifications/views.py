@@ -1,6 +1,27 @@
-from django.shortcuts import redirect, get_object_or_404
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.auth import get_user
 from django.contrib.auth.decorators import login_required
-from .models import Notification
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+from .events import get_broker
+from .models import Notification, invalidate_unread_count, unread_count
+
+# Number of notifications shown in the bell dropdown
+PREVIEW_SIZE = 10
+
+# Seconds between keep-alive comments on an idle event stream, under the
+# idle timeout of common proxies
+KEEPALIVE_INTERVAL = 25
+# Seconds before a stream is closed and the browser reconnects. This also
+# bounds how long a stream can outlive a client that went away unnoticed.
+STREAM_LIFETIME = 300
+# Milliseconds the browser waits before reconnecting
+RECONNECT_DELAY = 3000
 
 
 @login_required
@@ -8,6 +29,7 @@ def mark_all_read(request):
     if request.method == "POST":
         Notification.objects.filter(
             user=request.user, is_read=False).update(is_read=True)
+        invalidate_unread_count(request.user.id)
     return redirect(request.META.get('HTTP_REFERER', 'home'))
 
 
@@ -29,3 +51,56 @@ def mark_notification_read(request, notification_id):
     notification.save()
     return redirect(
         notification.link or 'home')  # fallback to 'home' if no link
+
+
+@login_required
+def notification_preview(request):
+    notifications = Notification.objects.filter(
+        user=request.user, is_read=False
+    ).order_by('-created_at')[:PREVIEW_SIZE]
+    return render(request, 'partials/notification_preview.html', {
+        'notifications': notifications,
+        'unread_count': unread_count(request.user.id),
+    })
+
+
+async def event_stream(request):
+    """
+    Server-sent event stream of the user's messages, booking changes and
+    notifications, for the EventSource opened by static/js/events.js.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI an open stream would hold a worker thread for its
+        # whole life, so tell the browser not to connect (204 stops
+        # EventSource from retrying) and let pages update on reload
+        return HttpResponse(status=204)
+    user = await sync_to_async(get_user)(request)
+    if not user.is_authenticated:
+        return HttpResponse(status=403)
+
+    response = StreamingHttpResponse(
+        stream_events(user.id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def stream_events(user_id, lifetime=STREAM_LIFETIME):
+    broker = get_broker()
+    subscription = broker.subscribe(user_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + lifetime
+    try:
+        yield f'retry: {RECONNECT_DELAY}\n\n'
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(), min(KEEPALIVE_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            data = json.dumps(event, cls=DjangoJSONEncoder)
+            yield f'event: {event["type"]}\ndata: {data}\n\n'
+    finally:
+        broker.unsubscribe(subscription)
@@ -1,6 +1,13 @@
 from django.contrib import admin
-from .models import Profile, MatchResponse, HouseImage
+from .models import Profile, MatchResponse, HouseImage, FileDeletion
 
 admin.site.register(Profile)
 admin.site.register(MatchResponse)
 admin.site.register(HouseImage)
+
+
+@admin.register(FileDeletion)
+class FileDeletionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'storage', 'status', 'attempts', 'created_at')
+    list_filter = ('status', 'storage')
+    search_fields = ('name',)
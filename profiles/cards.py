@@ -0,0 +1,125 @@
+"""
+Cache of rendered profile cards.
+
+The image gallery and the details of a profile card only change when the
+profile, its images or its reviews do, so they are rendered once per
+Profile.card_version and kept in the "cards" cache. Profile.save() and the
+HouseImage and Review signals in profiles/signals.py replace the version,
+so the next request renders the card under a new key and the old entry
+is left for the cache to evict. The match buttons, which depend on who
+is looking, are rendered around the cached fragments on every request.
+
+Hits, misses and the render time saved by the hits are reported to
+codestar.metrics, which logs them with the rest of the request's metrics.
+"""
+import time
+
+from django.core.cache import caches
+from django.db.models import Prefetch, prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from codestar.metrics import record_cache
+from reviews.models import Review
+
+from .models import HouseImage
+
+CARD_CACHE = 'cards'
+
+
+def ready_images(lookup='house_images'):
+    """
+    Prefetches the images that finished uploading, the only ones other
+    users see, into a ready_images list on each profile.
+    """
+    return Prefetch(
+        lookup, queryset=HouseImage.objects.ready(), to_attr='ready_images')
+
+
+def get_profile_cards(profiles):
+    """
+    Returns the profile card template context for each profile, with the
+    recent reviews of all of them fetched at once.
+    """
+    user_ids = [profile.user_id for profile in profiles]
+    recent_reviews = {}
+    for review in Review.objects.filter(
+        reviewee_id__in=user_ids
+    ).select_related('reviewer').order_by('reviewee', '-created_at'):
+        reviews = recent_reviews.setdefault(review.reviewee_id, [])
+        if len(reviews) < 3:
+            reviews.append(review)
+
+    return [{
+        'profile': profile,
+        'reviews': recent_reviews.get(profile.user_id, []),
+        'average_rating': profile.average_rating,
+    } for profile in profiles]
+
+
+def card_key(profile):
+    return f'profiles:card:{profile.id}:{profile.card_version.hex}'
+
+
+def get_card_fragments(profiles):
+    """
+    Returns the cached gallery and details HTML of each profile by id,
+    rendering and caching the ones that are missing. Only the missing
+    profiles have their images and reviews loaded.
+    """
+    cache = caches[CARD_CACHE]
+    keys = {profile.id: card_key(profile) for profile in profiles}
+    cached = cache.get_many(list(keys.values()))
+
+    fragments = {}
+    missing = []
+    saved = 0.0
+    for profile in profiles:
+        entry = cached.get(keys[profile.id])
+        if entry is None:
+            missing.append(profile)
+        else:
+            fragments[profile.id] = entry
+            saved += entry['render_time']
+
+    rendered = {}
+    prefetch_related_objects(missing, ready_images())
+    for card in get_profile_cards(missing):
+        started = time.perf_counter()
+        entry = {
+            'gallery': render_to_string(
+                'partials/profile_card_gallery.html', card),
+            'details': render_to_string(
+                'partials/profile_card_details.html', card),
+        }
+        entry['render_time'] = time.perf_counter() - started
+        profile_id = card['profile'].id
+        fragments[profile_id] = rendered[keys[profile_id]] = entry
+    if rendered:
+        cache.set_many(rendered)
+
+    record_cache(
+        hits=len(profiles) - len(missing), misses=len(missing), saved=saved)
+    return fragments
+
+
+def render_cards(profiles, user):
+    """The complete profile card HTML of each profile, for user."""
+    fragments = get_card_fragments(profiles)
+    return [
+        render_to_string('partials/profile_card.html', {
+            'profile': profile,
+            'gallery': mark_safe(fragments[profile.id]['gallery']),
+            'details': mark_safe(fragments[profile.id]['details']),
+            'user': user,
+        })
+        for profile in profiles
+    ]
+
+
+def render_card(profile, user):
+    """The profile card HTML of profile, or the empty card for None."""
+    if profile is None:
+        return render_to_string(
+            'partials/profile_card.html', {'profile': None, 'user': user})
+    return render_cards([profile], user)[0]
@@ -0,0 +1,248 @@
+"""
+Deletion of stored image files.
+
+Deleting a HouseImage or Profile, directly or through the cascade from
+its user, queues its files as FileDeletion rows in the same transaction
+(see profiles/signals.py). The delete_queued_files command removes them
+with delete_batch(), grouping the names per storage so Cloudinary gets
+one multi-delete call per 100 files instead of one call per file.
+
+Files whose rows are gone without passing through the queue, such as
+replaced profile pictures or uploads interrupted before their row was
+saved, are found by the sweep_orphaned_files command: it lists the media
+directories of the storage, subtracts the set of names still referenced
+and deletes the rest with find_orphans() and delete_files().
+"""
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import cloudinary.api
+from cloudinary_storage.storage import MediaCloudinaryStorage
+from django.core.files.storage import storages
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import FileDeletion, HouseImage, Profile
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = timedelta(minutes=1)
+RETRY_MAX_DELAY = timedelta(hours=6)
+# Most public ids Cloudinary's delete_resources accepts in one call
+CLOUDINARY_DELETE_LIMIT = 100
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.avif')
+
+
+def queue_deletions(files):
+    """Queues (storage alias, name) pairs for deletion in one INSERT."""
+    return FileDeletion.objects.bulk_create([
+        FileDeletion(storage=alias, name=name)
+        for alias, name in files if name
+    ])
+
+
+def is_cloudinary(storage):
+    return isinstance(storage, MediaCloudinaryStorage)
+
+
+def public_id(name):
+    """
+    The Cloudinary public id of a stored name. Image public ids have no
+    extension, but names saved before the Cloudinary storage was used
+    still end in one.
+    """
+    root, extension = os.path.splitext(name)
+    return root if extension.lower() in IMAGE_EXTENSIONS else name
+
+
+def delete_files(storage, names):
+    """
+    Deletes names from storage, in bulk where the storage supports it.
+    Returns a dict of the names that could not be deleted and the error
+    for each; files that were already gone count as deleted.
+    """
+    names = list(names)
+    errors = {}
+    if is_cloudinary(storage):
+        for start in range(0, len(names), CLOUDINARY_DELETE_LIMIT):
+            chunk = names[start:start + CLOUDINARY_DELETE_LIMIT]
+            try:
+                cloudinary.api.delete_resources(
+                    [public_id(name) for name in chunk],
+                    resource_type=storage.RESOURCE_TYPE, invalidate=True)
+            except Exception as exc:
+                errors.update(dict.fromkeys(chunk, exc))
+    elif hasattr(storage, 'delete_many'):
+        try:
+            storage.delete_many(names)
+        except Exception as exc:
+            errors.update(dict.fromkeys(names, exc))
+    else:
+        for name in names:
+            try:
+                storage.delete(name)
+            except Exception as exc:
+                errors[name] = exc
+    return errors
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def delete_batch(batch_size=500, max_attempts=MAX_ATTEMPTS):
+    """
+    Deletes up to batch_size due queued files. Returns a (deleted,
+    retried, failed) tuple of counts.
+
+    The claimed rows stay locked until the batch is recorded, and other
+    workers skip them, so several workers can drain the queue at once.
+    """
+    deleted = retried = failed = 0
+    with transaction.atomic():
+        batch = list(FileDeletion.objects.select_for_update(
+            skip_locked=True
+        ).filter(
+            status=FileDeletion.PENDING,
+            next_attempt_at__lte=timezone.now(),
+        ).order_by('next_attempt_at')[:batch_size])
+        if not batch:
+            return deleted, retried, failed
+
+        by_storage = defaultdict(list)
+        for deletion in batch:
+            by_storage[deletion.storage].append(deletion)
+        errors = {}
+        for alias, deletions in by_storage.items():
+            try:
+                storage = storages[alias]
+            except Exception as exc:
+                storage_errors = {
+                    deletion.name: exc for deletion in deletions}
+            else:
+                storage_errors = delete_files(
+                    storage, {deletion.name for deletion in deletions})
+            for deletion in deletions:
+                if deletion.name in storage_errors:
+                    errors[deletion.id] = storage_errors[deletion.name]
+
+        now = timezone.now()
+        done = []
+        for deletion in batch:
+            exc = errors.get(deletion.id)
+            if exc is None:
+                done.append(deletion.id)
+                deleted += 1
+                continue
+            deletion.attempts += 1
+            deletion.last_error = str(exc)
+            if deletion.attempts >= max_attempts:
+                deletion.status = FileDeletion.FAILED
+                failed += 1
+                logger.error(
+                    f"Giving up on deleting {deletion.name} after "
+                    f"{deletion.attempts} attempts: {exc}")
+            else:
+                deletion.next_attempt_at = now + retry_delay(
+                    deletion.attempts)
+                retried += 1
+        FileDeletion.objects.filter(id__in=done).delete()
+        FileDeletion.objects.bulk_update(
+            [deletion for deletion in batch if deletion.id in errors],
+            ['status', 'attempts', 'next_attempt_at', 'last_error'])
+    return deleted, retried, failed
+
+
+def drain(batch_size=500, max_attempts=MAX_ATTEMPTS):
+    """
+    Deletes batches until no due file is left. Returns the totals and the
+    elapsed seconds.
+    """
+    totals = [0, 0, 0]
+    started = time.monotonic()
+    while True:
+        counts = delete_batch(batch_size, max_attempts)
+        if not any(counts):
+            break
+        totals = [total + count for total, count in zip(totals, counts)]
+    return (*totals, time.monotonic() - started)
+
+
+def media_directories():
+    """The directories the media fields upload to."""
+    return [
+        HouseImage._meta.get_field('image').upload_to,
+        Profile._meta.get_field('image').upload_to,
+    ]
+
+
+def list_files(storage, directory):
+    """
+    Yields (name, created) for every file under directory, with created
+    None where the storage cannot tell.
+    """
+    if is_cloudinary(storage):
+        cursor = None
+        while True:
+            page = cloudinary.api.resources(
+                type='upload',
+                resource_type=storage.RESOURCE_TYPE,
+                prefix=storage._prepend_prefix(directory),
+                max_results=500,
+                next_cursor=cursor)
+            for resource in page['resources']:
+                yield (
+                    resource['public_id'],
+                    parse_datetime(resource['created_at']))
+            cursor = page.get('next_cursor')
+            if not cursor:
+                return
+
+    try:
+        directories, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for file_name in files:
+        name = os.path.join(directory, file_name)
+        try:
+            created = storage.get_created_time(name)
+        except NotImplementedError:
+            created = None
+        yield name, created
+    for subdirectory in directories:
+        yield from list_files(storage, os.path.join(directory, subdirectory))
+
+
+def referenced_files():
+    """The names in the media storage that rows still point to."""
+    names = set(HouseImage.objects.exclude(image='').values_list(
+        'image', flat=True).iterator())
+    for variants in HouseImage.objects.exclude(variants=[]).values_list(
+            'variants', flat=True).iterator():
+        names.update(variant['name'] for variant in variants)
+    names.update(Profile.objects.values_list(
+        'image', flat=True).iterator())
+    return names
+
+
+def find_orphans(storage, min_age=timedelta(days=1)):
+    """
+    The names in the media directories of storage that no row references.
+    Files younger than min_age are left alone, as their row may not be
+    committed yet.
+    """
+    cutoff = timezone.now() - min_age
+    key = public_id if is_cloudinary(storage) else str
+    referenced = {key(name) for name in referenced_files()}
+    stored = {
+        name
+        for directory in media_directories()
+        for name, created in list_files(storage, directory)
+        if created is None or created < cutoff
+    }
+    return sorted(name for name in stored if key(name) not in referenced)
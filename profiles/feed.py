@@ -0,0 +1,415 @@
+"""
+Candidate index and cursor for the swipe feed on the home page.
+
+Instead of scanning the Profile table on every page load, visible profiles
+are grouped into buckets keyed on their criteria bitmask and location. The
+buckets live in process memory and are kept current by the Profile and
+MatchResponse signals in profiles/signals.py once the writes commit. Each
+worker process holds its own copy, so the whole index is rebuilt from the
+database once it is older than settings.FEED_INDEX_TTL seconds to pick up
+writes made by other workers. One thread runs the rebuild query while the
+others keep serving the old copy, and the new copy is swapped in at the end.
+
+A FeedCursor walks the candidates in a seeded pseudo-random order without
+storing the shuffled sequence, so the session only holds a few integers.
+"""
+import heapq
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .models import Profile, MatchResponse, criteria_mask, parse_date_range
+
+DEFAULT_TTL = 300
+
+# Positions a cursor probes per requested card before it falls back to
+# ranking the (then sparse) candidate set directly
+PROBE_LIMIT = 256
+
+
+def _location_code(location):
+    # CountryField gives a Country object on instances and a str in values()
+    return getattr(location, 'code', location) or ''
+
+
+class CandidateIndex:
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        # Guards the index data; held only to read or swap it, never
+        # while the database is queried
+        self._lock = threading.RLock()
+        # Held by the one thread rebuilding the index
+        self._rebuild_lock = threading.Lock()
+        self._built_at = None
+        # (criteria bitmask, location code) -> set of profile ids
+        self._buckets = {}
+        # profile id -> (criteria, location, available_from, available_to)
+        self._profiles = {}
+        # user id -> id of the user's own visible profile
+        self._owners = {}
+        # user id -> set of profile ids the user has responded to
+        self._responded = {}
+        self._max_id = 0
+        # Changes made while the index or a user's responses are loaded
+        # from the database, replayed on top of the loaded rows
+        self._pending_profiles = None
+        self._pending_responses = {}
+
+    def _get_ttl(self):
+        if self.ttl is not None:
+            return self.ttl
+        return getattr(settings, 'FEED_INDEX_TTL', DEFAULT_TTL)
+
+    def _is_stale(self):
+        if self._built_at is None:
+            return True
+        return time.monotonic() - self._built_at >= self._get_ttl()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def rebuild(self):
+        with self._rebuild_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        with self._lock:
+            self._pending_profiles = []
+        try:
+            rows = Profile.objects.filter(is_visible=True).values_list(
+                'id', 'user_id', 'location', 'criteria',
+                'available_from', 'available_to',
+            )
+            buckets = {}
+            profiles = {}
+            owners = {}
+            for profile_id, user_id, location, criteria, *available in (
+                    rows.iterator(chunk_size=10000)):
+                entry = (criteria, _location_code(location), *available)
+                buckets.setdefault(entry[:2], set()).add(profile_id)
+                profiles[profile_id] = entry
+                owners[user_id] = profile_id
+        except BaseException:
+            with self._lock:
+                self._pending_profiles = None
+            raise
+
+        with self._lock:
+            pending, self._pending_profiles = self._pending_profiles, None
+            self._buckets = buckets
+            self._profiles = profiles
+            self._owners = owners
+            self._responded = {}
+            self._max_id = max(profiles, default=0)
+            for change, args in pending:
+                change(*args)
+            self._built_at = time.monotonic()
+
+    def _ensure_built(self):
+        """
+        Rebuilds a stale index. Only one thread rebuilds; the others keep
+        reading the old copy meanwhile, or wait if there is none yet.
+        """
+        if not self._is_stale():
+            return
+        if self._rebuild_lock.acquire(blocking=self._built_at is None):
+            try:
+                if self._is_stale():
+                    self._rebuild()
+            finally:
+                self._rebuild_lock.release()
+
+    def update_profile(self, profile):
+        """Place a saved profile in its bucket, or drop it if hidden."""
+        with self._lock:
+            if self._pending_profiles is not None:
+                self._pending_profiles.append(
+                    (self._update_profile, (profile,)))
+            if self._built_at is not None:
+                self._update_profile(profile)
+
+    def _update_profile(self, profile):
+        self._discard(profile.id)
+        if profile.is_visible:
+            entry = (
+                profile.criteria,
+                _location_code(profile.location),
+                profile.available_from,
+                profile.available_to,
+            )
+            self._buckets.setdefault(entry[:2], set()).add(profile.id)
+            self._profiles[profile.id] = entry
+            self._owners[profile.user_id] = profile.id
+            self._max_id = max(self._max_id, profile.id)
+
+    def remove_profile(self, profile_id):
+        with self._lock:
+            if self._pending_profiles is not None:
+                self._pending_profiles.append((self._discard, (profile_id,)))
+            self._discard(profile_id)
+
+    def _discard(self, profile_id):
+        entry = self._profiles.pop(profile_id, None)
+        if entry is None:
+            return
+        bucket = self._buckets.get(entry[:2])
+        if bucket is not None:
+            bucket.discard(profile_id)
+            if not bucket:
+                del self._buckets[entry[:2]]
+
+    def add_response(self, user_id, profile_id):
+        with self._lock:
+            self._change_response(user_id, set.add, profile_id)
+
+    def remove_response(self, user_id, profile_id):
+        with self._lock:
+            self._change_response(user_id, set.discard, profile_id)
+
+    def _change_response(self, user_id, change, profile_id):
+        responded = self._responded.get(user_id)
+        if responded is not None:
+            change(responded, profile_id)
+        pending = self._pending_responses.get(user_id)
+        if pending is not None:
+            pending.append((change, profile_id))
+
+    def _responded_ids(self, user_id):
+        """
+        The user's responded-to profile ids, loaded without holding the
+        lock the first time they are needed.
+        """
+        with self._lock:
+            responded = self._responded.get(user_id)
+            if responded is not None:
+                return responded
+            pending = self._pending_responses.setdefault(user_id, [])
+        try:
+            responded = set(MatchResponse.objects.filter(
+                from_user_id=user_id
+            ).values_list('to_profile_id', flat=True))
+        except BaseException:
+            with self._lock:
+                self._pending_responses.pop(user_id, None)
+            raise
+        with self._lock:
+            self._pending_responses.pop(user_id, None)
+            for change, profile_id in pending:
+                change(responded, profile_id)
+            return self._responded.setdefault(user_id, responded)
+
+    def id_bits(self):
+        """Bit length of the largest indexed profile id."""
+        self._ensure_built()
+        with self._lock:
+            return max(self._max_id.bit_length(), 1)
+
+    def candidates(self, user=None, filters=None, dates=None):
+        """
+        Returns the sorted ids of visible profiles matching the SearchForm
+        filters (and available at some point in the dates range) that the
+        user has not responded to, excluding their own.
+        """
+        with self._candidate_ids(user, filters, dates) as ids:
+            return sorted(ids)
+
+    def nsmallest(self, count, key, user=None, filters=None, dates=None):
+        """
+        Returns the count candidates() with the smallest key(id), skipping
+        ids whose key is None, without building the full candidate set.
+        """
+        with self._candidate_ids(user, filters, dates) as ids:
+            keyed = (
+                (rank, profile_id) for profile_id in ids
+                for rank in [key(profile_id)] if rank is not None
+            )
+            return [profile_id for _, profile_id in heapq.nsmallest(
+                count, keyed)]
+
+    @contextmanager
+    def _candidate_ids(self, user, filters, dates):
+        # Yields an iterator over the candidate ids, valid only while the
+        # lock is held
+        filters = filters or {}
+        mask = criteria_mask(filters)
+        location = filters.get('location') or None
+
+        self._ensure_built()
+        responded = ()
+        own_id = None
+        if user is not None and user.is_authenticated:
+            responded = self._responded_ids(user.id)
+
+        with self._lock:
+            if user is not None and user.is_authenticated:
+                own_id = self._owners.get(user.id)
+            if mask or location:
+                pools = [
+                    bucket
+                    for (criteria, code), bucket in self._buckets.items()
+                    if (not location or code == location)
+                    and criteria & mask == mask
+                ]
+            else:
+                # Every visible profile matches, skip the buckets
+                pools = [self._profiles]
+            yield (
+                profile_id for pool in pools for profile_id in pool
+                if profile_id not in responded and profile_id != own_id
+                and (not dates
+                     or self._is_available(self._profiles[profile_id], dates))
+            )
+
+    def is_candidate(self, profile_id, user=None, filters=None, dates=None):
+        """Single-profile version of candidates(), in constant time."""
+        filters = filters or {}
+        self._ensure_built()
+        with self._lock:
+            entry = self._profiles.get(profile_id)
+            if entry is None:
+                return False
+            mask = criteria_mask(filters)
+            location = filters.get('location') or None
+            if entry[0] & mask != mask:
+                return False
+            if location and entry[1] != location:
+                return False
+            if dates and not self._is_available(entry, dates):
+                return False
+            if user is None or not user.is_authenticated:
+                return True
+            if profile_id == self._owners.get(user.id):
+                return False
+        responded = self._responded_ids(user.id)
+        with self._lock:
+            return profile_id not in responded
+
+    @staticmethod
+    def _is_available(entry, dates):
+        available_from, available_to = entry[2:]
+        return (
+            available_from is not None
+            and available_from <= dates[1]
+            and available_to >= dates[0]
+        )
+
+
+candidate_index = CandidateIndex()
+
+
+class FeedCursor:
+    """
+    Position in a seeded pseudo-random walk over the swipe feed.
+
+    Positions 0 .. 2**bits - 1 are mapped onto profile ids by a bijection
+    derived from the seed (an affine map and two xorshift-multiply rounds,
+    all invertible mod 2**bits). Walking the positions in order visits every
+    id once in shuffled order, and ids that are not current candidates are
+    skipped. Profiles added to or removed from the feed mid-pass do not
+    disturb the order of the rest.
+    """
+
+    def __init__(self, seed, bits, position=0, served=0,
+                 filters=None, dates=None):
+        self.seed = seed
+        self.bits = bits
+        self.position = position
+        self.served = served
+        self.filters = filters or {}
+        self.dates = dates
+
+        self._size = 1 << bits
+        self._mask = self._size - 1
+        self._shift = (bits + 1) // 2
+        rng = random.Random(seed)
+        self._mult1 = rng.getrandbits(bits) | 1
+        self._mult2 = rng.getrandbits(bits) | 1
+        self._add = rng.getrandbits(bits)
+        self._inv1 = pow(self._mult1, -1, self._size)
+        self._inv2 = pow(self._mult2, -1, self._size)
+
+    @classmethod
+    def start(cls, filters=None, dates=None, index=candidate_index):
+        """A new pass over the feed for SearchForm filters and a date range."""
+        filters = {
+            field: value for field, value in (filters or {}).items() if value
+        }
+        if dates and not parse_date_range(dates):
+            dates = None
+        return cls(random.getrandbits(32), index.id_bits(),
+                   filters=filters, dates=dates)
+
+    def restart(self, index=candidate_index):
+        return self.start(self.filters, self.dates, index=index)
+
+    @classmethod
+    def from_session(cls, data):
+        if not data:
+            return None
+        return cls(data['seed'], data['bits'], data['position'],
+                   data['served'], data['filters'], data['dates'])
+
+    def to_session(self):
+        return {
+            'seed': self.seed,
+            'bits': self.bits,
+            'position': self.position,
+            'served': self.served,
+            'filters': self.filters,
+            'dates': self.dates,
+        }
+
+    @property
+    def exhausted(self):
+        return self.position >= self._size
+
+    def _to_id(self, position):
+        x = (position * self._mult1 + self._add) & self._mask
+        x ^= x >> self._shift
+        x = (x * self._mult2) & self._mask
+        return x ^ (x >> self._shift)
+
+    def _to_position(self, profile_id):
+        x = profile_id ^ (profile_id >> self._shift)
+        x = (x * self._inv2) & self._mask
+        x ^= x >> self._shift
+        return ((x - self._add) * self._inv1) & self._mask
+
+    def next_ids(self, user=None, count=1, index=candidate_index):
+        """Advances the cursor past the next count candidate ids."""
+        dates = parse_date_range(self.dates) if self.dates else None
+        found = []
+        probes = 0
+        while len(found) < count and not self.exhausted:
+            if probes >= PROBE_LIMIT * count:
+                found.extend(self._rank_remaining(
+                    user, count - len(found), dates, index))
+                break
+            profile_id = self._to_id(self.position)
+            self.position += 1
+            probes += 1
+            if index.is_candidate(profile_id, user, self.filters, dates):
+                found.append(profile_id)
+        return found
+
+    def _rank_remaining(self, user, count, dates, index):
+        # Few candidates left relative to the id space: rank them directly
+        # instead of probing positions one by one
+        def remaining_position(profile_id):
+            if profile_id < self._size:
+                position = self._to_position(profile_id)
+                if position >= self.position:
+                    return position
+            return None
+
+        ranked = index.nsmallest(
+            count, remaining_position, user, self.filters, dates)
+        if ranked:
+            self.position = self._to_position(ranked[-1]) + 1
+        else:
+            self.position = self._size
+        return ranked
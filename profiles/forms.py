@@ -2,7 +2,7 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.forms import modelformset_factory
-from .models import Profile, HouseImage
+from .models import Profile, HouseImage, criteria_mask, parse_date_range
 from django.core.exceptions import ValidationError
 from PIL import Image
 from .widgets import CountrySelectWidgetNoFlags
@@ -128,6 +128,9 @@ class ProfileForm(forms.ModelForm):
 
     def clean_available_dates(self):
         dates = self.cleaned_data.get('available_dates', '').strip()
+        if dates and parse_date_range(dates) is None:
+            raise forms.ValidationError(
+                "Enter dates as YYYY-MM-DD to YYYY-MM-DD.")
         return dates
 
 
@@ -142,6 +145,10 @@ class SearchForm(forms.Form):
     in_city = forms.BooleanField(required=False)
     in_rural = forms.BooleanField(required=False)
 
+    def criteria_mask(self):
+        """Bitmask of the checked house criteria, for Profile.criteria."""
+        return criteria_mask(self.cleaned_data)
+
 
 class ImageForm(forms.ModelForm):
     image = forms.ImageField(
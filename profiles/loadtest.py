@@ -0,0 +1,237 @@
+"""
+Load tests against the synthetic population.
+
+run() starts a number of virtual users, each logged in as one of the
+synthetic users of profiles/synthetic.py, and has each of them repeat the
+main swipe journey: the home page, a few next_profile swipes, a like, the
+travel log and another user's profile. The requests go either through the
+Django test client in this process, where the queries of each request are
+counted directly, or over HTTP to a running server, where they are read
+from the Server-Timing header when the server measures requests (see
+codestar/metrics.py).
+
+summarise() turns the timings into p50/p95/p99 latencies and query counts
+per endpoint, which the run_benchmarks command saves as JSON so runs
+before and after a change can be compared with compare().
+"""
+import json
+import logging
+import random
+import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from .synthetic import SYNTHETIC_PASSWORD
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = (
+    'home', 'next_profile', 'like_profile', 'travel_log', 'view_profile')
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+class ClientSession:
+    """Requests through the test client, as user, in this process."""
+
+    def __init__(self, user):
+        # ALLOWED_HOSTS has no 'testserver' outside of tests
+        self.client = Client(SERVER_NAME='localhost')
+        self.client.force_login(user)
+
+    def request(self, method, path, json_data=None):
+        """Returns the status code and the number of queries run."""
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        kwargs = {}
+        if json_data is not None:
+            kwargs = {
+                'data': json.dumps(json_data),
+                'content_type': 'application/json',
+            }
+        with connection.execute_wrapper(count):
+            response = getattr(self.client, method)(path, **kwargs)
+        return response.status_code, queries[0]
+
+    def close(self):
+        pass
+
+
+class HttpSession:
+    """Requests over HTTP to the server at base_url, logged in as user."""
+
+    def __init__(self, user, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        login_url = self.base_url + reverse('login')
+        self.session.get(login_url, timeout=timeout)
+        response = self.session.post(login_url, data={
+            'username': user.username,
+            'password': SYNTHETIC_PASSWORD,
+            'csrfmiddlewaretoken': self.session.cookies.get('csrftoken'),
+        }, headers={'Referer': login_url}, timeout=timeout)
+        if 'sessionid' not in self.session.cookies:
+            raise RuntimeError(
+                f"Could not log in as {user.username} "
+                f"({response.status_code})")
+
+    def request(self, method, path, json_data=None):
+        """
+        Returns the status code and the number of queries from the
+        Server-Timing header, or None if the server sent none.
+        """
+        response = self.session.request(
+            method, self.base_url + path, json=json_data,
+            headers={'X-CSRFToken': self.session.cookies.get(
+                'csrftoken', '')},
+            allow_redirects=False, timeout=self.timeout)
+        match = SERVER_TIMING_QUERIES.search(
+            response.headers.get('Server-Timing', ''))
+        return response.status_code, int(match[1]) if match else None
+
+    def close(self):
+        self.session.close()
+
+
+def journey(rng, profile_ids, user_ids, swipes):
+    """
+    One pass through the pages a member visits, yielding the endpoint
+    and request arguments of each request.
+    """
+    yield 'home', 'get', reverse('home'), None
+    for _ in range(swipes):
+        yield 'next_profile', 'post', reverse('next_profile'), {}
+    yield 'like_profile', 'post', reverse('like_profile'), {
+        'profile_id': rng.choice(profile_ids)}
+    yield 'travel_log', 'get', reverse('travel_log'), None
+    yield 'view_profile', 'get', reverse(
+        'view_profile', args=[rng.choice(user_ids)]), None
+
+
+def run_virtual_user(make_session, user, profile_ids, user_ids, seed,
+                     iterations, warmup, swipes):
+    """
+    Runs the journey iterations + warmup times as user and returns an
+    (endpoint, seconds, status, queries) sample per request, leaving out
+    the warmup passes.
+    """
+    rng = random.Random(seed)
+    session = make_session(user)
+    samples = []
+    try:
+        for iteration in range(warmup + iterations):
+            for endpoint, method, path, data in journey(
+                    rng, profile_ids, user_ids, swipes):
+                started = time.perf_counter()
+                try:
+                    status, queries = session.request(method, path, data)
+                except Exception as exc:
+                    logger.warning(f"{method.upper()} {path} failed: {exc}")
+                    status, queries = None, None
+                elapsed = time.perf_counter() - started
+                if iteration >= warmup:
+                    samples.append((endpoint, elapsed, status, queries))
+    finally:
+        session.close()
+    return samples
+
+
+def run(users, profile_ids, base_url=None, iterations=10, warmup=1,
+        swipes=3, seed=1):
+    """
+    Runs one virtual user per user concurrently, through the test client
+    or against base_url, and returns the samples of all of them and the
+    wall clock seconds taken.
+    """
+    if base_url:
+        def make_session(user):
+            return HttpSession(user, base_url)
+    else:
+        make_session = ClientSession
+
+    user_ids = [user.id for user in users]
+    arguments = [
+        (make_session, user, profile_ids, user_ids, seed + number,
+         iterations, warmup, swipes)
+        for number, user in enumerate(users)
+    ]
+    started = time.perf_counter()
+    if len(users) == 1:
+        # In this thread, so a test's transaction sees the same rows
+        results = [run_virtual_user(*arguments[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(users)) as executor:
+            results = list(executor.map(
+                lambda args: _run_and_close(*args), arguments))
+    elapsed = time.perf_counter() - started
+    return [sample for samples in results for sample in samples], elapsed
+
+
+def _run_and_close(*args):
+    # Each virtual user thread opens its own database connection
+    try:
+        return run_virtual_user(*args)
+    finally:
+        connection.close()
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """The given percentiles of values, interpolated between samples."""
+    if len(values) == 1:
+        return [values[0]] * len(points)
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return [cuts[point - 1] for point in points]
+
+
+def summarise(samples):
+    """Latency percentiles in ms, errors and query counts per endpoint."""
+    summary = {}
+    for endpoint in ENDPOINTS:
+        rows = [sample for sample in samples if sample[0] == endpoint]
+        if not rows:
+            continue
+        timings = [elapsed * 1000 for _, elapsed, _, _ in rows]
+        queries = [count for *_, count in rows if count is not None]
+        p50, p95, p99 = percentiles(timings)
+        summary[endpoint] = {
+            'requests': len(rows),
+            'errors': sum(
+                1 for _, _, status, _ in rows
+                if status is None or status >= 400),
+            'p50_ms': round(p50, 2),
+            'p95_ms': round(p95, 2),
+            'p99_ms': round(p99, 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'queries_median': (
+                statistics.median(queries) if queries else None),
+            'queries_max': max(queries) if queries else None,
+        }
+    return summary
+
+
+def compare(previous, current, metrics=('p50_ms', 'p95_ms', 'queries_max')):
+    """
+    Yields (endpoint, metric, previous, current, change) for the metrics
+    of each endpoint in both results, change being the relative change or
+    None where it cannot be computed.
+    """
+    for endpoint, stats in current['endpoints'].items():
+        before = previous.get('endpoints', {}).get(endpoint)
+        if before is None:
+            continue
+        for metric in metrics:
+            old, new = before.get(metric), stats.get(metric)
+            change = None
+            if old and new is not None:
+                change = (new - old) / old
+            yield endpoint, metric, old, new, change
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from profiles.models import MatchResponse
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the MatchResponse.mutual flag from the liked responses "
+        "in both directions, for data written before the flag existed or "
+        "edited outside the like and unlike views."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            set_count, cleared_count = (
+                MatchResponse.objects.refresh_mutual())
+        self.stdout.write(
+            f"Set {set_count} mutual flags, cleared {cleared_count}.")
@@ -0,0 +1,90 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from profiles.models import Profile
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the old available_dates__icontains date filter with the "
+        "indexed availability overlap query on synthetic profiles. "
+        "Everything is created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=[10000, 100000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self.run_size(size, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run_size(self, size, options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(f"Creating {size} synthetic profiles...")
+        User.objects.bulk_create(
+            [User(username=f'dates-bench-{i}', password='!')
+             for i in range(size)],
+            batch_size=5000)
+        user_ids = User.objects.filter(
+            username__startswith='dates-bench-'
+        ).values_list('id', flat=True)
+
+        first_day = date(2025, 1, 1)
+        profiles = []
+        for user_id in user_ids.iterator():
+            start = first_day + timedelta(days=rng.randrange(730))
+            end = start + timedelta(days=rng.randrange(3, 30))
+            # bulk_create skips Profile.save(), so fill the range columns
+            profiles.append(Profile(
+                user_id=user_id,
+                available_dates=f'{start} to {end}',
+                available_from=start,
+                available_to=end,
+            ))
+        Profile.objects.bulk_create(profiles, batch_size=5000)
+
+        for days in (1, 7, 30):
+            start = first_day + timedelta(days=365)
+            end = start + timedelta(days=days - 1)
+            like_ms, like_count = self.time_it(
+                lambda: list(Profile.objects.filter(
+                    Q(available_dates__icontains=str(start)) |
+                    Q(available_dates__icontains=str(end))
+                ).values_list('id', flat=True)),
+                options['repeat'])
+            overlap_ms, overlap_count = self.time_it(
+                lambda: list(Profile.objects.available_between(
+                    start, end).values_list('id', flat=True)),
+                options['repeat'])
+            self.stdout.write(
+                f"  {size:>8} profiles, {days:>2}-day window: "
+                f"LIKE {like_ms:.2f} ms ({like_count} rows), "
+                f"overlap {overlap_ms:.2f} ms ({overlap_count} rows)")
+
+    def time_it(self, func, repeat):
+        rows = len(func())
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), rows
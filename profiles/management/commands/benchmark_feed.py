@@ -0,0 +1,133 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from profiles.feed import CandidateIndex
+from profiles.models import (
+    CRITERIA_FIELDS, Profile, MatchResponse, criteria_mask)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare swipe feed candidate lookups against the candidate index "
+        "with the old per-request table scan, on synthetic profiles. "
+        "Everything is created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', type=int,
+            default=[10000, 100000, 1000000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--responses', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self.run_size(size, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run_size(self, size, options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(f"Creating {size} synthetic profiles...")
+        User.objects.bulk_create(
+            [User(username=f'feed-bench-{i}', password='!')
+             for i in range(size)],
+            batch_size=5000)
+        user_ids = list(User.objects.filter(
+            username__startswith='feed-bench-'
+        ).values_list('id', flat=True))
+        countries = ['FR', 'GB', 'US', 'ES', 'IT', 'DE', 'PT', 'GR']
+        profiles = []
+        for user_id in user_ids:
+            flags = {f: rng.random() < 0.3 for f in CRITERIA_FIELDS}
+            # bulk_create skips Profile.save(), so pack the bitmask here
+            profiles.append(Profile(
+                user_id=user_id,
+                location=rng.choice(countries),
+                is_visible=rng.random() < 0.9,
+                criteria=criteria_mask(flags),
+                **flags
+            ))
+        Profile.objects.bulk_create(profiles, batch_size=5000)
+        viewer = User.objects.get(id=user_ids[0])
+        profile_ids = list(Profile.objects.filter(
+            user__username__startswith='feed-bench-').exclude(
+            user=viewer).values_list('id', flat=True))
+        MatchResponse.objects.bulk_create(
+            [MatchResponse(from_user=viewer, to_profile_id=pid,
+                           liked=rng.random() < 0.5)
+             for pid in rng.sample(
+                 profile_ids, min(options['responses'], len(profile_ids)))],
+            batch_size=5000)
+
+        filter_sets = [
+            {},
+            {'near_beach': True},
+            {'has_pool': True, 'location': 'FR'},
+        ]
+
+        index = CandidateIndex(ttl=3600)
+        started = time.perf_counter()
+        index.rebuild()
+        build_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(f"  index build: {build_ms:.1f} ms")
+
+        for filters in filter_sets:
+            scan = self.time_it(
+                lambda: self.scan_candidates(viewer, filters),
+                options['repeat'])
+            bitmask = self.time_it(
+                lambda: self.bitmask_candidates(viewer, filters),
+                options['repeat'])
+            indexed = self.time_it(
+                lambda: index.candidates(viewer, filters),
+                options['repeat'])
+            label = ', '.join(sorted(filters)) or 'no filters'
+            self.stdout.write(
+                f"  {size:>8} profiles [{label}]: "
+                f"scan {scan:.2f} ms, bitmask {bitmask:.2f} ms, "
+                f"index {indexed:.2f} ms ({scan / indexed:.1f}x)")
+
+    def scan_candidates(self, user, filters):
+        # The per-request query home() ran before the candidate index
+        profiles = Profile.objects.filter(is_visible=True).exclude(user=user)
+        profiles = profiles.exclude(id__in=MatchResponse.objects.filter(
+            from_user=user).values_list('to_profile_id', flat=True))
+        for field, value in filters.items():
+            if value and field != 'location':
+                profiles = profiles.filter(**{field: True})
+        if filters.get('location'):
+            profiles = profiles.filter(location=filters['location'])
+        return list(profiles.values_list('id', flat=True))
+
+    def bitmask_candidates(self, user, filters):
+        # Same query with one criteria & mask = mask predicate
+        profiles = Profile.objects.filter(is_visible=True).exclude(
+            user=user).with_criteria(criteria_mask(filters))
+        profiles = profiles.exclude(id__in=MatchResponse.objects.filter(
+            from_user=user).values_list('to_profile_id', flat=True))
+        if filters.get('location'):
+            profiles = profiles.filter(location=filters['location'])
+        return list(profiles.values_list('id', flat=True))
+
+    def time_it(self, func, repeat):
+        func()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
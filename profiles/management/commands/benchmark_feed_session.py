@@ -0,0 +1,94 @@
+import random
+from contextlib import contextmanager
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from profiles.feed import FeedCursor
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the session payload and the bytes written to the "
+        "django_session table per swipe for the old shuffled "
+        "profile_sequence list and the FeedCursor. Sessions are stored "
+        "with the database backend inside a transaction that is rolled "
+        "back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', type=int,
+            default=[1000, 10000, 100000])
+        parser.add_argument('--swipes', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'candidates':>10} {'layout':>8} {'payload B':>10} "
+            f"{'written B/swipe':>16}")
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self.run_size(size, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run_size(self, size, options):
+        rng = random.Random(options['seed'])
+        profile_ids = list(range(1, size + 1))
+        rng.shuffle(profile_ids)
+
+        def swipe_list(session, swipe):
+            session['current_index'] = swipe + 1
+
+        session = SessionStore()
+        session['profile_sequence'] = profile_ids
+        session['current_index'] = 0
+        self.report(size, 'list', session, swipe_list, options['swipes'])
+
+        cursor = FeedCursor(
+            rng.getrandbits(32), size.bit_length(),
+            filters={'has_pool': True, 'location': 'FR'},
+            dates='2025-07-01 to 2025-07-15')
+
+        def swipe_cursor(session, swipe):
+            # A swipe skips a few non-candidate positions on average
+            cursor.position += rng.randint(1, 4)
+            cursor.served += 1
+            session['feed_cursor'] = cursor.to_session()
+
+        session = SessionStore()
+        session['feed_cursor'] = cursor.to_session()
+        self.report(size, 'cursor', session, swipe_cursor, options['swipes'])
+
+    def report(self, size, layout, session, swipe, swipes):
+        session.save()
+        payload = len(session.encode(session._get_session()))
+        with self.count_written() as written:
+            for i in range(swipes):
+                swipe(session, i)
+                session.save()
+        self.stdout.write(
+            f"{size:>10} {layout:>8} {payload:>10} "
+            f"{written[0] // swipes:>16}")
+
+    @contextmanager
+    def count_written(self):
+        written = [0]
+
+        def wrapper(execute, sql, params, many, context):
+            if 'django_session' in sql and sql.lstrip().startswith(
+                    ('UPDATE', 'INSERT')):
+                written[0] += sum(
+                    len(str(param)) for param in params or ())
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(wrapper):
+            yield written
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from profiles.cleanup import MAX_ATTEMPTS, drain
+from profiles.models import FileDeletion
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the image files queued when their house images or "
+        "profiles were deleted, in batches, using the storage's "
+        "multi-delete call where it has one and retrying failures with "
+        "exponential backoff. Runs once by default, or keeps polling with "
+        "--loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--max-attempts', type=int, default=MAX_ATTEMPTS)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep polling the queue instead of exiting once drained.")
+        parser.add_argument(
+            '--interval', type=float, default=30.0,
+            help="Seconds to wait between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            deleted, retried, failed, elapsed = drain(
+                options['batch_size'], options['max_attempts'])
+            if deleted or retried or failed or not options['loop']:
+                self.report(deleted, retried, failed, elapsed)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def report(self, deleted, retried, failed, elapsed):
+        rate = deleted / elapsed if elapsed else 0.0
+        pending = FileDeletion.objects.filter(
+            status=FileDeletion.PENDING).count()
+        self.stdout.write(
+            f"Deleted {deleted}, retrying {retried}, failed {failed} "
+            f"in {elapsed:.2f}s ({rate:.1f} files/s), "
+            f"{pending} still pending.")
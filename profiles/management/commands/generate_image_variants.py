@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from profiles.models import HouseImage
+from profiles.variants import add_variants
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the resized variants of ready house images that have "
+        "none, such as images uploaded before variants existed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int,
+            help="Stop after this many images.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        images = HouseImage.objects.ready().filter(
+            variants=[]).exclude(image='').order_by('id')
+        if options['limit']:
+            images = images[:options['limit']]
+
+        done = failed = 0
+        for image in images.iterator():
+            with image.image.open('rb') as source:
+                if add_variants(image, source):
+                    image.save(update_fields=['variants'])
+                    done += 1
+                else:
+                    failed += 1
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"Created variants for {done} images, {failed} failed, "
+            f"in {elapsed:.2f}s.")
@@ -0,0 +1,92 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles import synthetic
+from profiles.cleanup import is_cloudinary
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users for load tests: profiles "
+        "with criteria and availability, house images pointing at local "
+        "placeholder files, likes with a tunable mutual rate, and "
+        "conversations, bookings, reviews and notifications between the "
+        "matches. Rows are written with bulk_create. The users are named "
+        "<prefix>-<n> and share the password 'synthetic-password'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--likes-per-user', type=int, default=20)
+        parser.add_argument(
+            '--mutual-rate', type=float, default=0.3,
+            help="Share of likes that the liked user returns.")
+        parser.add_argument('--images-per-profile', type=int, default=3)
+        parser.add_argument(
+            '--conversation-rate', type=float, default=0.6,
+            help="Share of mutual matches that have a conversation.")
+        parser.add_argument(
+            '--messages-per-conversation', type=int, default=8)
+        parser.add_argument(
+            '--booking-rate', type=float, default=0.3,
+            help="Share of mutual matches with a booking request.")
+        parser.add_argument(
+            '--review-rate', type=float, default=0.4,
+            help="Chance that each side of a mutual match left a review.")
+        parser.add_argument('--notifications-per-user', type=int, default=5)
+        parser.add_argument('--prefix', default=synthetic.DEFAULT_PREFIX)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--batch-size', type=int, default=synthetic.BATCH_SIZE)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help="Delete the users with the prefix first.")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['clear']:
+            started = time.monotonic()
+            deleted = synthetic.clear(prefix)
+            self.stdout.write(
+                f"Deleted {deleted} synthetic users in "
+                f"{time.monotonic() - started:.2f}s.")
+        elif synthetic.existing_users(prefix).exists():
+            raise CommandError(
+                f"Users named {prefix}-<n> already exist, pass --clear to "
+                f"replace them or choose another --prefix.")
+
+        if options['images_per_profile'] and is_cloudinary(default_storage):
+            raise CommandError(
+                "The placeholder images would be uploaded to Cloudinary. "
+                "Set LOCAL_MEDIA=true to keep media on disk, or pass "
+                "--images-per-profile 0.")
+
+        started = time.monotonic()
+
+        def progress(model, count):
+            self.stdout.write(
+                f"{model:>24} {count:>9} "
+                f"({time.monotonic() - started:.2f}s)")
+
+        counts = synthetic.generate(
+            users=options['users'],
+            likes_per_user=options['likes_per_user'],
+            mutual_rate=options['mutual_rate'],
+            images_per_profile=options['images_per_profile'],
+            conversation_rate=options['conversation_rate'],
+            messages_per_conversation=options['messages_per_conversation'],
+            booking_rate=options['booking_rate'],
+            review_rate=options['review_rate'],
+            notifications_per_user=options['notifications_per_user'],
+            prefix=prefix,
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        elapsed = time.monotonic() - started
+        rows = sum(counts.values())
+        self.stdout.write(
+            f"Created {rows} rows in {elapsed:.2f}s "
+            f"({rows / elapsed if elapsed else 0:.0f} rows/s).")
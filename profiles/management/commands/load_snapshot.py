@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles import snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a pg_dump custom format snapshot, latest.dump by default, "
+        "into a freshly migrated database. The users and app tables are "
+        "streamed in foreign key order with COPY on PostgreSQL and "
+        "batched INSERTs elsewhere, indexes and constraints are created "
+        "after the load, sequences are reset and the denormalised columns "
+        "are rebuilt. pg_restore is not needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=str(settings.BASE_DIR / 'latest.dump'))
+        parser.add_argument(
+            '--anonymize', action='store_true',
+            help="Replace usernames and email addresses with user<id> and "
+                 "user<id>@example.com as the rows are loaded.")
+        parser.add_argument(
+            '--batch-size', type=int, default=snapshot.BATCH_SIZE,
+            help="Rows per INSERT batch where COPY is not available.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(table, rows):
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"  {table}: {rows} rows ({elapsed:.2f}s)")
+
+        try:
+            with open(options['path'], 'rb') as dump:
+                stats, skipped = snapshot.load(
+                    dump, anonymize=options['anonymize'],
+                    batch_size=options['batch_size'], progress=progress)
+        except (OSError, snapshot.SnapshotError) as exc:
+            raise CommandError(exc)
+
+        self.stdout.write(
+            f"{'table':>28} {'rows':>9} {'MB':>7} {'seconds':>8} "
+            f"{'rows/s':>9}")
+        total_rows = total_bytes = 0
+        for table, rows, size, elapsed in stats:
+            if size:
+                total_rows += rows
+                total_bytes += size
+            self.stdout.write(
+                f"{table:>28} {rows:>9} {size / 1e6:>7.2f} "
+                f"{elapsed:>8.3f} {rows / elapsed if elapsed else 0:>9.0f}")
+
+        if skipped:
+            self.stdout.write(
+                f"Left out the tables {', '.join(skipped)}, which are "
+                f"not user or app tables.")
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"Loaded {total_rows} rows ({total_bytes / 1e6:.2f} MB) in "
+            f"{elapsed:.2f}s ({total_rows / elapsed:.0f} rows/s, "
+            f"{total_bytes / 1e6 / elapsed:.2f} MB/s).")
@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from profiles.uploads import claimable_images, publish_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Upload house images still waiting in the staging storage to the "
+        "media storage, several at a time. Normally the web process does "
+        "this right after the upload, so this picks up images left "
+        "pending, such as by a restart, once their claim has run out. "
+        "Runs once by default, or keeps polling with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.IMAGE_UPLOAD_WORKERS)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep polling for pending images instead of exiting.")
+        parser.add_argument(
+            '--interval', type=float, default=30.0,
+            help="Seconds to wait between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            image_ids = list(claimable_images().values_list('id', flat=True))
+            ready, failed = publish_images(image_ids, options['workers'])
+            elapsed = time.monotonic() - started
+            if image_ids or not options['loop']:
+                self.stdout.write(
+                    f"Uploaded {ready} of {len(image_ids)} pending images, "
+                    f"{failed} failed, in {elapsed:.2f}s.")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
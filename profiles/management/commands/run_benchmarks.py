@@ -0,0 +1,131 @@
+import json
+import os
+import random
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles import loadtest, synthetic
+from profiles.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the swipe journey with concurrent virtual users logged "
+        "in as the synthetic users of generate_synthetic_data, through "
+        "the test client or against a running server with --url. Reports "
+        "p50/p95/p99 latency and queries per endpoint and saves the "
+        "results as JSON. The virtual users like profiles, so run it on "
+        "a database that only holds test data, and on PostgreSQL for "
+        "more than one virtual user as SQLite locks out concurrent "
+        "writes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--virtual-users', type=int, default=4,
+            help="Concurrent virtual users, each one a synthetic user.")
+        parser.add_argument(
+            '--iterations', type=int, default=10,
+            help="Journeys measured per virtual user.")
+        parser.add_argument(
+            '--warmup', type=int, default=1,
+            help="Journeys per virtual user run before measuring.")
+        parser.add_argument(
+            '--swipes', type=int, default=3,
+            help="next_profile requests per journey.")
+        parser.add_argument(
+            '--url',
+            help="Base URL of a running server, such as "
+                 "http://localhost:8000. Queries are read from its "
+                 "Server-Timing header if REQUEST_METRICS_SERVER_TIMING "
+                 "is on. Defaults to the test client in this process.")
+        parser.add_argument('--prefix', default=synthetic.DEFAULT_PREFIX)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--output',
+            help="File to save the results to. Defaults to "
+                 "benchmarks/<timestamp>.json.")
+        parser.add_argument(
+            '--compare',
+            help="Results file of an earlier run to compare against.")
+
+    def handle(self, *args, **options):
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as results_file:
+                previous = json.load(results_file)
+
+        population = list(synthetic.existing_users(
+            options['prefix']).order_by('id'))
+        if len(population) < 2:
+            raise CommandError(
+                "Not enough synthetic users, run generate_synthetic_data "
+                "first.")
+        rng = random.Random(options['seed'])
+        users = rng.sample(
+            population, min(options['virtual_users'], len(population)))
+        profile_ids = list(Profile.objects.filter(
+            user__in=population).values_list('id', flat=True))
+
+        samples, elapsed = loadtest.run(
+            users, profile_ids,
+            base_url=options['url'],
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            swipes=options['swipes'],
+            seed=options['seed'],
+        )
+        results = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'target': options['url'] or 'test client',
+            'population': len(population),
+            'virtual_users': len(users),
+            'iterations': options['iterations'],
+            'swipes': options['swipes'],
+            'seed': options['seed'],
+            'seconds': round(elapsed, 3),
+            'requests_per_second': round(
+                len(samples) / elapsed if elapsed else 0, 1),
+            'endpoints': loadtest.summarise(samples),
+        }
+        self.report(results)
+
+        output = options['output'] or os.path.join(
+            'benchmarks',
+            f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+        if os.path.dirname(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+        self.stdout.write(f"Saved the results to {output}.")
+
+        if previous:
+            self.report_comparison(previous, results)
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'endpoint':>14} {'requests':>8} {'errors':>6} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>7}")
+        for endpoint, stats in results['endpoints'].items():
+            queries = stats['queries_max']
+            self.stdout.write(
+                f"{endpoint:>14} {stats['requests']:>8} "
+                f"{stats['errors']:>6} {stats['p50_ms']:>8.2f} "
+                f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} "
+                f"{'-' if queries is None else queries:>7}")
+        self.stdout.write(
+            f"{results['virtual_users']} virtual users made "
+            f"{sum(s['requests'] for s in results['endpoints'].values())} "
+            f"requests in {results['seconds']:.2f}s "
+            f"({results['requests_per_second']:.1f} requests/s).")
+
+    def report_comparison(self, previous, results):
+        self.stdout.write(
+            f"Compared with the run of {previous.get('created_at')}:")
+        for endpoint, metric, old, new, change in loadtest.compare(
+                previous, results):
+            delta = '-' if change is None else f"{change:+.1%}"
+            self.stdout.write(
+                f"{endpoint:>14} {metric:>12} {old!s:>9} -> {new!s:>9} "
+                f"{delta:>8}")
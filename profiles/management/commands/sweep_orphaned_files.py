@@ -0,0 +1,50 @@
+import time
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from profiles.cleanup import delete_files, find_orphans
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete files in the media storage's image directories that no "
+        "house image or profile references any more, such as replaced "
+        "profile pictures. Lists the storage, diffs it against the "
+        "database and deletes the orphans in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--min-age', type=float, default=24.0,
+            help="Hours a file must have existed before it is deleted, so "
+                 "uploads still being saved are left alone.")
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="List the orphans without deleting them.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        orphans = find_orphans(
+            default_storage, timedelta(hours=options['min_age']))
+        if options['dry_run']:
+            for name in orphans:
+                self.stdout.write(name)
+            self.stdout.write(f"Found {len(orphans)} orphaned files.")
+            return
+
+        failed = 0
+        batch_size = options['batch_size']
+        for start in range(0, len(orphans), batch_size):
+            errors = delete_files(
+                default_storage, orphans[start:start + batch_size])
+            for name, exc in errors.items():
+                self.stderr.write(f"Could not delete {name}: {exc}")
+            failed += len(errors)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"Deleted {len(orphans) - failed} of {len(orphans)} orphaned "
+            f"files, {failed} failed, in {elapsed:.2f}s.")
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:15
+
+from django.db import migrations, models
+
+
+CRITERIA_FIELDS = (
+    'pets_allowed',
+    'has_pool',
+    'more_than_3_bedrooms',
+    'near_beach',
+    'in_mountains',
+    'in_city',
+    'in_rural',
+)
+
+
+def backfill_criteria(apps, schema_editor):
+    Profile = apps.get_model('profiles', 'Profile')
+    # One set-based UPDATE per criteria bit
+    for bit, field in enumerate(CRITERIA_FIELDS):
+        Profile.objects.filter(**{field: True}).update(
+            criteria=models.F('criteria').bitor(1 << bit))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0009_alter_profile_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='criteria',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['is_visible', 'criteria'], name='profile_visible_criteria_idx'),
+        ),
+        migrations.RunPython(
+            backfill_criteria, migrations.RunPython.noop),
+    ]
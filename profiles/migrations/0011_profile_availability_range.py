@@ -0,0 +1,63 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:18
+
+from datetime import date
+
+from django.db import migrations, models
+
+
+def parse_date_range(value):
+    parts = [part.strip() for part in (value or '').split(' to ')]
+    if not parts[0] or len(parts) > 2:
+        return None
+    try:
+        start = date.fromisoformat(parts[0])
+        end = date.fromisoformat(parts[-1])
+    except ValueError:
+        return None
+    if end < start:
+        return None
+    return start, end
+
+
+def backfill_availability(apps, schema_editor):
+    Profile = apps.get_model('profiles', 'Profile')
+    batch = []
+    profiles = Profile.objects.exclude(available_dates='').only(
+        'id', 'available_dates')
+    for profile in profiles.iterator(chunk_size=2000):
+        dates = parse_date_range(profile.available_dates)
+        if dates is None:
+            continue
+        profile.available_from, profile.available_to = dates
+        batch.append(profile)
+        if len(batch) >= 2000:
+            Profile.objects.bulk_update(
+                batch, ['available_from', 'available_to'])
+            batch = []
+    Profile.objects.bulk_update(batch, ['available_from', 'available_to'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0010_profile_criteria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='available_from',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='available_to',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['available_from', 'available_to'], name='profile_availability_idx'),
+        ),
+        migrations.RunPython(
+            backfill_availability, migrations.RunPython.noop),
+    ]
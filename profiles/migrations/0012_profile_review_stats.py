@@ -0,0 +1,45 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+
+def backfill_review_stats(apps, schema_editor):
+    Profile = apps.get_model('profiles', 'Profile')
+    Review = apps.get_model('reviews', 'Review')
+    totals = {
+        reviewee: (count, total)
+        for reviewee, count, total in Review.objects.values_list(
+            'reviewee').annotate(
+            count=models.Count('id'), total=models.Sum('rating'))
+    }
+    profiles = []
+    for profile in Profile.objects.only('id', 'user_id').iterator():
+        if profile.user_id in totals:
+            profile.review_count, profile.rating_sum = (
+                totals[profile.user_id])
+            profiles.append(profile)
+    Profile.objects.bulk_update(
+        profiles, ['review_count', 'rating_sum'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0011_profile_availability_range'),
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(
+            backfill_review_stats, migrations.RunPython.noop),
+    ]
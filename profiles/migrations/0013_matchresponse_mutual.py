@@ -0,0 +1,33 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:35
+
+from django.db import migrations, models
+
+
+def backfill_mutual(apps, schema_editor):
+    MatchResponse = apps.get_model('profiles', 'MatchResponse')
+    reciprocated = models.Exists(MatchResponse.objects.filter(
+        from_user=models.OuterRef('to_profile__user'),
+        to_profile__user=models.OuterRef('from_user'),
+        liked=True))
+    MatchResponse.objects.filter(liked=True).filter(
+        reciprocated).update(mutual=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0012_profile_review_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchresponse',
+            name='mutual',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='matchresponse',
+            index=models.Index(fields=['from_user', 'mutual'], name='matchresponse_mutual_idx'),
+        ),
+        migrations.RunPython(backfill_mutual, migrations.RunPython.noop),
+    ]
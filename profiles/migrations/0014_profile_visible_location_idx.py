@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0013_matchresponse_mutual'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['location'], name='profile_visible_location_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.20 on 2026-10-18 15:21
+
+from django.db import migrations, models
+import profiles.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0014_profile_visible_location_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='houseimage',
+            name='staged_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='houseimage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='houseimage',
+            name='image',
+            field=models.ImageField(blank=True, upload_to='house_images/', validators=[profiles.models.ImageValidator(max_size_mb=2)]),
+        ),
+    ]
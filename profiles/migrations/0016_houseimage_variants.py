@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 15:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0015_houseimage_upload_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='houseimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.20 on 2026-10-18 15:40
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0017_filedeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='card_version',
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0018_profile_card_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='houseimage',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,11 +1,88 @@
+from datetime import date
+import uuid
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models.functions import NullIf
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.deconstruct import deconstructible
 import mimetypes
 from django_countries.fields import CountryField
 
 
+# House criteria fields, each stored as one bit of Profile.criteria
+CRITERIA_FIELDS = (
+    'pets_allowed',
+    'has_pool',
+    'more_than_3_bedrooms',
+    'near_beach',
+    'in_mountains',
+    'in_city',
+    'in_rural',
+)
+
+# Profile columns only written when update_fields names them
+REVIEW_TOTAL_FIELDS = ('review_count', 'rating_sum')
+
+
+def criteria_mask(values):
+    """
+    Packs a mapping of criteria field name -> bool (such as
+    SearchForm.cleaned_data) into a criteria bitmask.
+    """
+    mask = 0
+    for bit, field in enumerate(CRITERIA_FIELDS):
+        if values.get(field):
+            mask |= 1 << bit
+    return mask
+
+
+def parse_date_range(value):
+    """
+    Parses a flatpickr range such as '2025-07-01 to 2025-07-14' (or a
+    single date) into a (start, end) tuple of dates. Returns None if the
+    value is blank or not in that format.
+    """
+    parts = [part.strip() for part in (value or '').split(' to ')]
+    if not parts[0] or len(parts) > 2:
+        return None
+    try:
+        start = date.fromisoformat(parts[0])
+        end = date.fromisoformat(parts[-1])
+    except ValueError:
+        return None
+    if end < start:
+        return None
+    return start, end
+
+
+class ProfileQuerySet(models.QuerySet):
+    def with_criteria(self, mask):
+        """Profiles that have every criteria bit set in mask."""
+        if not mask:
+            return self
+        return self.annotate(
+            criteria_match=models.F('criteria').bitand(mask)
+        ).filter(criteria_match=mask)
+
+    def available_between(self, start, end):
+        """Profiles whose availability window overlaps start..end."""
+        return self.filter(available_from__lte=end, available_to__gte=start)
+
+    def by_rating(self):
+        """Highest average review rating first, unreviewed profiles last."""
+        return self.annotate(
+            rating_avg=models.ExpressionWrapper(
+                models.F('rating_sum') * 1.0
+                / NullIf('review_count', 0),
+                output_field=models.FloatField())
+        ).order_by(models.F('rating_avg').desc(nulls_last=True), 'id')
+
+    def new_card_version(self):
+        """Marks the cached cards of these profiles as out of date."""
+        return self.update(card_version=uuid.uuid4())
+
+
 # Create your models here.
 # Profile model linked one-to-one with User
 class Profile(models.Model):
@@ -25,6 +102,9 @@ class Profile(models.Model):
     house_description = models.TextField(blank=True)
     preferred_destinations = models.CharField(max_length=255, blank=True)
     available_dates = models.CharField(max_length=255, blank=True)
+    # Parsed from available_dates by save(), for indexed overlap queries
+    available_from = models.DateField(null=True, editable=False)
+    available_to = models.DateField(null=True, editable=False)
 
     # House criteria fields
     pets_allowed = models.BooleanField(default=False)
@@ -34,10 +114,68 @@ class Profile(models.Model):
     in_mountains = models.BooleanField(default=False)
     in_city = models.BooleanField(default=False)
     in_rural = models.BooleanField(default=False)
+    # Bitmask of the criteria fields above, kept in sync by save()
+    criteria = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    # Totals of the reviews received by the user, kept in sync by the
+    # Review signals in reviews/signals.py
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    # Replaced whenever the rendered profile card would change, see
+    # profiles/cards.py
+    card_version = models.UUIDField(default=uuid.uuid4, editable=False)
+
+    objects = ProfileQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['is_visible', 'criteria'],
+                name='profile_visible_criteria_idx'),
+            models.Index(
+                fields=['available_from', 'available_to'],
+                name='profile_availability_idx'),
+            models.Index(
+                fields=['location'],
+                condition=models.Q(is_visible=True),
+                name='profile_visible_location_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} - {self.location}'
 
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return round(self.rating_sum / self.review_count, 1)
+
+    def save(self, *args, **kwargs):
+        self.criteria = criteria_mask(
+            {field: getattr(self, field) for field in CRITERIA_FIELDS})
+        self.available_from, self.available_to = (
+            parse_date_range(self.available_dates) or (None, None))
+        self.card_version = uuid.uuid4()
+        update_fields = kwargs.get('update_fields')
+        if (update_fields is None and not self._state.adding
+                and not kwargs.get('force_insert')):
+            # The review totals are written by refresh_review_stats, so a
+            # profile loaded before a review was saved must not put back
+            # the totals it read
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in REVIEW_TOTAL_FIELDS
+            ]
+        if update_fields is not None:
+            update_fields = set(update_fields) | {'card_version'}
+            if update_fields & set(CRITERIA_FIELDS):
+                update_fields.add('criteria')
+            if 'available_dates' in update_fields:
+                update_fields.update({'available_from', 'available_to'})
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
 
 @deconstructible
 class ImageValidator:
@@ -66,16 +204,145 @@ class ImageValidator:
 
 
 # New model to support multiple images per profile
+class HouseImageQuerySet(models.QuerySet):
+    def ready(self):
+        """Images that have reached the media storage."""
+        return self.filter(status=HouseImage.READY)
+
+
 class HouseImage(models.Model):
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
     profile = models.ForeignKey(
         Profile, on_delete=models.CASCADE, related_name='house_images'
     )
-    image = models.ImageField(upload_to='house_images/',
+    # Empty until a staged upload is pushed to the media storage
+    image = models.ImageField(upload_to='house_images/', blank=True,
                               validators=[ImageValidator(max_size_mb=2)])
+    # Name of the file in the staging storage while the image is pending,
+    # see profiles/uploads.py
+    staged_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=READY)
+    # Set while a worker uploads the pending image; once it has passed,
+    # the worker is presumed gone and another may take the image over
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    # Resized copies of image, see profiles/variants.py
+    variants = models.JSONField(default=list, blank=True)
+
+    objects = HouseImageQuerySet.as_manager()
 
     def __str__(self):
         return f"Image for {self.profile.user.username}"
 
+    def variants_of(self, format_name):
+        """The recorded variants in one format, narrowest first."""
+        return [
+            variant for variant in self.variants
+            if variant['format'] == format_name
+        ]
+
+    def srcset(self, format_name):
+        storage = self.image.storage
+        return ', '.join(
+            f"{storage.url(variant['name'])} {variant['width']}w"
+            for variant in self.variants_of(format_name)
+        )
+
+    def stored_files(self):
+        """(storage alias, name) of every file kept for this image."""
+        files = []
+        if self.image:
+            files.append(('default', self.image.name))
+        files += [('default', variant['name']) for variant in self.variants]
+        if self.staged_name:
+            files.append(('staging', self.staged_name))
+        return files
+
+
+class StagedFile(models.Model):
+    """
+    An uploaded file waiting in the database for a worker to push it to
+    the media storage, read and written through
+    profiles.storage.DatabaseStorage.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class FileDeletion(models.Model):
+    """
+    A stored file waiting to be deleted. Rows are written in the same
+    transaction as the deletion of the record that referenced the file and
+    removed in batches by the delete_queued_files command, see
+    profiles/cleanup.py.
+    """
+    PENDING = 'pending'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (FAILED, 'Failed'),
+    ]
+
+    # Alias in settings.STORAGES
+    storage = models.CharField(max_length=50, default='default')
+    name = models.CharField(max_length=255)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'next_attempt_at'],
+                name='filedeletion_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} in {self.storage} ({self.status})"
+
+
+class MatchResponseQuerySet(models.QuerySet):
+    def reverse_of(self, from_user_id, to_profile_id):
+        """The response going the other way between the same two users."""
+        return self.filter(
+            from_user__profile__id=to_profile_id,
+            to_profile__user_id=from_user_id)
+
+    def is_match(self, user1, user2):
+        """True if user1 and user2 have liked each other."""
+        return self.filter(
+            from_user=user1, to_profile__user=user2, mutual=True).exists()
+
+    def refresh_mutual(self):
+        """
+        Recomputes the mutual flag from the liked responses in both
+        directions. Returns the number of flags set and cleared.
+        """
+        reciprocated = models.Exists(MatchResponse.objects.filter(
+            from_user=models.OuterRef('to_profile__user'),
+            to_profile__user=models.OuterRef('from_user'),
+            liked=True))
+        set_count = self.filter(liked=True, mutual=False).filter(
+            reciprocated).update(mutual=True)
+        cleared_count = self.filter(mutual=True).filter(
+            models.Q(liked=False) | ~reciprocated).update(mutual=False)
+        return set_count, cleared_count
+
 
 class MatchResponse(models.Model):
     # The user giving a thumbs up or down.
@@ -88,10 +355,20 @@ class MatchResponse(models.Model):
     liked = models.BooleanField()
     # The timestamp of the response.
     timestamp = models.DateTimeField(auto_now_add=True)
+    # True while both users have liked each other, kept in sync by the
+    # MatchResponse signals in profiles/signals.py
+    mutual = models.BooleanField(default=False, editable=False)
+
+    objects = MatchResponseQuerySet.as_manager()
 
     class Meta:
         # Ensure that a user can only respond once to a profile.
         unique_together = ('from_user', 'to_profile')
+        indexes = [
+            models.Index(
+                fields=['from_user', 'mutual'],
+                name='matchresponse_mutual_idx'),
+        ]
 
     def __str__(self):
         # Return a string representation of the response.
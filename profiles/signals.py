@@ -0,0 +1,86 @@
+import copy
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from reviews.models import Review
+from .models import HouseImage, Profile, MatchResponse
+from .cleanup import queue_deletions
+from .feed import candidate_index
+
+
+# Keep the swipe feed candidate index in step with profile changes once
+# they commit, so rolled back writes never reach it. The instance is copied
+# as later changes in the same transaction are saved (and queued) again.
+@receiver(post_save, sender=Profile)
+def update_feed_profile(sender, instance, **kwargs):
+    transaction.on_commit(partial(
+        candidate_index.update_profile, copy.copy(instance)))
+
+
+@receiver(post_delete, sender=Profile)
+def remove_feed_profile(sender, instance, **kwargs):
+    transaction.on_commit(partial(
+        candidate_index.remove_profile, instance.id))
+
+
+@receiver(post_save, sender=MatchResponse)
+def add_feed_response(sender, instance, **kwargs):
+    transaction.on_commit(partial(
+        candidate_index.add_response,
+        instance.from_user_id, instance.to_profile_id))
+
+
+@receiver(post_delete, sender=MatchResponse)
+def remove_feed_response(sender, instance, **kwargs):
+    transaction.on_commit(partial(
+        candidate_index.remove_response,
+        instance.from_user_id, instance.to_profile_id))
+
+
+# Keep the mutual flag set on both responses while the two users like
+# each other
+@receiver(post_save, sender=MatchResponse)
+def sync_mutual_match(sender, instance, **kwargs):
+    reverse = MatchResponse.objects.reverse_of(
+        instance.from_user_id, instance.to_profile_id)
+    mutual = instance.liked and reverse.filter(liked=True).exists()
+    reverse.exclude(mutual=mutual).update(mutual=mutual)
+    if instance.mutual != mutual:
+        MatchResponse.objects.filter(pk=instance.pk).update(mutual=mutual)
+        instance.mutual = mutual
+
+
+@receiver(post_delete, sender=MatchResponse)
+def clear_mutual_match(sender, instance, **kwargs):
+    MatchResponse.objects.reverse_of(
+        instance.from_user_id, instance.to_profile_id
+    ).filter(mutual=True).update(mutual=False)
+
+
+# Queue the files of deleted images and profiles for deletion from the
+# storage, including rows removed by the cascade from a deleted user
+@receiver(post_delete, sender=HouseImage)
+def queue_house_image_files(sender, instance, **kwargs):
+    queue_deletions(instance.stored_files())
+
+
+@receiver(post_delete, sender=Profile)
+def queue_profile_image_file(sender, instance, **kwargs):
+    if instance.image.name != Profile._meta.get_field('image').default:
+        queue_deletions([('default', instance.image.name)])
+
+
+# Profile.save() replaces the card version itself, images and reviews
+# shown on the card replace it here
+@receiver(post_save, sender=HouseImage)
+@receiver(post_delete, sender=HouseImage)
+def refresh_card_for_image(sender, instance, **kwargs):
+    Profile.objects.filter(id=instance.profile_id).new_card_version()
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def refresh_card_for_review(sender, instance, **kwargs):
+    Profile.objects.filter(user_id=instance.reviewee_id).new_card_version()
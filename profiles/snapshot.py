@@ -0,0 +1,646 @@
+"""
+Loading of pg_dump snapshots such as latest.dump.
+
+DumpArchive reads a custom format archive (pg_dump -Fc) without
+pg_restore: the table of contents, then the COPY data of one table at a
+time, decompressed as it is read so a table never has to fit in memory.
+
+load() streams the tables of the project's models into a freshly migrated
+database in foreign key order. The snapshot may predate later migrations,
+so its columns are matched to the models by name, columns it lacks take
+their field default, and the columns that save() or the signals would
+have derived are filled in on the way: the profile criteria mask and
+availability range, the booking request dates and each message's
+conversation. What depends on other rows (conversations and their
+participants, the mutual flags and the review totals) is rebuilt once the
+rows are in.
+
+PostgreSQL loads with COPY, other databases with batched INSERTs. Indexes
+and constraints are dropped before the load and created again after it,
+which is much faster than maintaining them row by row, and the sequences
+are reset so new rows get ids after the loaded ones. With anonymize,
+usernames and email addresses are replaced in the stream, so the real
+ones never reach the database.
+"""
+import json
+import re
+import time
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+
+from messaging.models import (
+    BookingRequest, Conversation, ConversationParticipant, Message)
+from notifications.models import Notification
+from reviews.models import refresh_review_stats
+
+from .feed import candidate_index
+from .models import (
+    CRITERIA_FIELDS, MatchResponse, Profile, criteria_mask,
+    parse_date_range)
+
+APP_LABELS = ('profiles', 'messaging', 'notifications', 'reviews')
+BATCH_SIZE = 5000
+# Rows between progress reports within a table
+PROGRESS_EVERY = 100_000
+
+# Archive versions 1.14 to 1.16, written by pg_dump 12 to 17
+MIN_VERSION = (1, 14)
+MAX_VERSION = (1, 16)
+BLOCK_DATA = 1
+OFFSET_SET = 2
+OFFSET_NO_DATA = 3
+COMPRESSION_NONE = 0
+COMPRESSION_GZIP = 1
+COPY_STATEMENT = re.compile(r'COPY (\S+) \((.*)\) FROM stdin;')
+COPY_ESCAPE = re.compile(r'\\([0-7]{1,3}|x[0-9a-fA-F]{1,2}|.)')
+COPY_ESCAPES = {
+    'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+USERNAME_TOKEN = re.compile(r'[\w.@+-]+')
+
+TableData = namedtuple('TableData', 'dump_id table columns offset')
+
+
+class SnapshotError(Exception):
+    """The snapshot cannot be read or loaded into this database."""
+
+
+class DumpArchive:
+    """A pg_dump custom format archive, read from an open binary file."""
+
+    def __init__(self, file):
+        self.file = file
+        self._read_header()
+        self.tables = {}
+        for entry in self._read_toc():
+            if entry.table:
+                self.tables[entry.table] = entry
+        if any(entry.offset is None for entry in self.tables.values()):
+            self._find_offsets()
+
+    def _read_byte(self):
+        data = self.file.read(1)
+        if not data:
+            raise SnapshotError("The archive ends unexpectedly.")
+        return data[0]
+
+    def _read_int(self):
+        negative = self._read_byte()
+        value = int.from_bytes(self.file.read(self.int_size), 'little')
+        return -value if negative else value
+
+    def _read_str(self):
+        length = self._read_int()
+        if length < 0:
+            return None
+        return self.file.read(length).decode()
+
+    def _read_header(self):
+        if self.file.read(5) != b'PGDMP':
+            raise SnapshotError(
+                "Not a pg_dump custom format archive (pg_dump -Fc).")
+        major, minor, _ = self.file.read(3)
+        self.version = (major, minor)
+        if not MIN_VERSION <= self.version <= MAX_VERSION:
+            raise SnapshotError(
+                f"Unsupported archive version {major}.{minor}.")
+        self.int_size, self.offset_size, archive_format = self.file.read(3)
+        if archive_format != 1:
+            raise SnapshotError("Only custom format archives can be read.")
+        if self.version >= (1, 15):
+            self.compression = self._read_byte()
+        else:
+            # A gzip level before 1.15, 0 being none
+            self.compression = (
+                COMPRESSION_NONE if self._read_int() == 0
+                else COMPRESSION_GZIP)
+        if self.compression not in (COMPRESSION_NONE, COMPRESSION_GZIP):
+            raise SnapshotError(
+                "Only uncompressed or gzip compressed archives can be "
+                "read, dump with pg_dump -Fc -Z gzip.")
+        # Creation time
+        for _ in range(7):
+            self._read_int()
+        self.database = self._read_str()
+        self.server_version = self._read_str()
+        self.dump_version = self._read_str()
+
+    def _read_toc(self):
+        for _ in range(self._read_int()):
+            dump_id = self._read_int()
+            self._read_int()  # had dumper
+            self._read_str()  # table oid
+            self._read_str()  # oid
+            tag = self._read_str()
+            description = self._read_str()
+            self._read_int()  # section
+            self._read_str()  # definition
+            self._read_str()  # drop statement
+            copy_statement = self._read_str()
+            self._read_str()  # namespace
+            self._read_str()  # tablespace
+            self._read_str()  # table access method
+            if self.version >= (1, 16):
+                self._read_int()  # relkind
+            self._read_str()  # owner
+            self._read_str()  # with oids
+            while self._read_str() is not None:
+                pass  # dependencies
+            offset_state = self._read_byte()
+            offset = int.from_bytes(
+                self.file.read(self.offset_size), 'little')
+
+            if description != 'TABLE DATA':
+                continue
+            match = COPY_STATEMENT.match(copy_statement or '')
+            if match is None:
+                continue
+            columns = [
+                column.strip().strip('"')
+                for column in match[2].split(',')]
+            if offset_state == OFFSET_NO_DATA:
+                offset = 0
+            elif offset_state != OFFSET_SET:
+                offset = None
+            yield TableData(dump_id, tag, columns, offset)
+        self.data_start = self.file.tell()
+
+    def _find_offsets(self):
+        # An archive written to a pipe has no offsets in its table of
+        # contents, so the data blocks are located by skipping through
+        # them once
+        offsets = {}
+        self.file.seek(self.data_start)
+        while self.file.read(1) == bytes([BLOCK_DATA]):
+            offset = self.file.tell() - 1
+            offsets[self._read_int()] = offset
+            while size := self._read_int():
+                self.file.seek(size, 1)
+        for table, entry in self.tables.items():
+            if entry.offset is None:
+                self.tables[table] = entry._replace(
+                    offset=offsets.get(entry.dump_id, 0))
+
+    def _chunks(self, entry):
+        if not entry.offset:
+            return
+        self.file.seek(entry.offset)
+        if (self._read_byte() != BLOCK_DATA
+                or self._read_int() != entry.dump_id):
+            raise SnapshotError(f"The data of {entry.table} is damaged.")
+        decompressor = (
+            zlib.decompressobj()
+            if self.compression == COMPRESSION_GZIP else None)
+        while size := self._read_int():
+            data = self.file.read(size)
+            yield decompressor.decompress(data) if decompressor else data
+        if decompressor:
+            yield decompressor.flush()
+
+    def rows(self, entry):
+        """
+        Yields the rows of a table, each a list of the text of its
+        columns with None for NULL, along with the bytes read so far.
+        """
+        pending = b''
+        read = 0
+        for chunk in self._chunks(entry):
+            read += len(chunk)
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                if line == b'\\.':
+                    return
+                yield parse_copy_line(line.decode()), read
+        if pending and pending != b'\\.':
+            yield parse_copy_line(pending.decode()), read
+
+
+def _unescape(match):
+    code = match[1]
+    if code[0] == 'x':
+        return chr(int(code[1:], 16))
+    if code[0].isdigit():
+        return chr(int(code, 8))
+    return COPY_ESCAPES.get(code, code)
+
+
+def parse_copy_line(line):
+    """Splits a line of COPY text format into its column values."""
+    return [
+        None if value == '\\N'
+        else COPY_ESCAPE.sub(_unescape, value) if '\\' in value
+        else value
+        for value in line.split('\t')
+    ]
+
+
+def copy_value(field, value):
+    """A value in COPY text format, for the COPY into PostgreSQL."""
+    if value is None:
+        return '\\N'
+    if not isinstance(value, str):
+        if isinstance(field, models.JSONField):
+            value = json.dumps(value)
+        elif isinstance(value, bool):
+            value = 't' if value else 'f'
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        else:
+            value = str(value)
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def insert_value(field, value):
+    """A value ready for a parameterised INSERT on any database."""
+    if isinstance(value, str):
+        # Text from the dump, in PostgreSQL's output format
+        value = (
+            json.loads(value) if isinstance(field, models.JSONField)
+            else field.to_python(value))
+    return field.get_db_prep_save(value, connection)
+
+
+class ConversationBuilder:
+    """
+    Gives each message the conversation of its pair of users, numbering
+    the conversations as they are met, and records what Message.save()
+    would have: the last message of each conversation and its
+    participants, all of whom have read it.
+    """
+
+    def __init__(self):
+        self.conversations = {}
+        self.latest = {}
+        self.timestamp = Message._meta.get_field('timestamp')
+
+    def __call__(self, row):
+        sender, recipient = int(row['sender_id']), int(row['recipient_id'])
+        pair = (min(sender, recipient), max(sender, recipient))
+        conversation_id = self.conversations.setdefault(
+            pair, len(self.conversations) + 1)
+        row['conversation_id'] = conversation_id
+        latest = (self.timestamp.to_python(row['timestamp']), int(row['id']))
+        if (conversation_id not in self.latest
+                or latest > self.latest[conversation_id]):
+            self.latest[conversation_id] = latest
+
+    def save(self, batch_size=BATCH_SIZE):
+        conversations = []
+        participants = []
+        for (user_a, user_b), conversation_id in self.conversations.items():
+            last_message_at, last_message_id = self.latest[conversation_id]
+            conversations.append(Conversation(
+                id=conversation_id, user_a_id=user_a, user_b_id=user_b,
+                last_message_id=last_message_id,
+                last_message_at=last_message_at))
+            participants.extend(
+                ConversationParticipant(
+                    conversation_id=conversation_id, user_id=user_id,
+                    last_message_at=last_message_at,
+                    last_read_at=last_message_at)
+                for user_id in {user_a, user_b})
+        Conversation.objects.bulk_create(
+            conversations, batch_size=batch_size)
+        ConversationParticipant.objects.bulk_create(
+            participants, batch_size=batch_size)
+        return len(conversations)
+
+
+class Anonymizer:
+    """
+    Replaces usernames with user<id> and email addresses with
+    user<id>@example.com, and the old usernames in notification texts.
+    """
+
+    def __init__(self):
+        self.usernames = {}
+
+    def user(self, row):
+        new_username = f"user{row['id']}"
+        self.usernames[row['username']] = new_username
+        row['username'] = new_username
+        if row['email']:
+            row['email'] = f'{new_username}@example.com'
+
+    def _replace(self, match):
+        token = match[0]
+        if token in self.usernames:
+            return self.usernames[token]
+        # A username at the end of a sentence
+        stripped = token.rstrip('.')
+        if stripped in self.usernames:
+            return self.usernames[stripped] + token[len(stripped):]
+        return token
+
+    def notification(self, row):
+        if row['message']:
+            row['message'] = USERNAME_TOKEN.sub(self._replace, row['message'])
+
+
+def derive_profile(row):
+    fields = {field.column: field for field in Profile._meta.fields}
+    row['criteria'] = criteria_mask({
+        name: fields[name].to_python(row[name])
+        for name in CRITERIA_FIELDS
+    })
+    row['available_from'], row['available_to'] = (
+        parse_date_range(row['available_dates']) or (None, None))
+
+
+def derive_booking(row):
+    row['start_date'], row['end_date'] = (
+        parse_date_range(row['requested_dates']) or (None, None))
+
+
+def load_order():
+    """
+    The models load() fills, users and the project's apps, each after the
+    models its foreign keys point to. The one cycle, between conversations
+    and their last message, is broken where it is met.
+    """
+    candidates = [User] + [
+        model for label in APP_LABELS
+        for model in apps.get_app_config(label).get_models()]
+    ordered = []
+
+    def visit(model, visiting=()):
+        if model in ordered or model in visiting or model not in candidates:
+            return
+        for field in model._meta.concrete_fields:
+            if field.remote_field:
+                visit(field.related_model, (*visiting, model))
+        ordered.append(model)
+
+    for model in candidates:
+        visit(model)
+    return ordered
+
+
+def table_plan(model, columns, derived):
+    """
+    Matches the columns of a table in the dump to the model's fields.
+    Returns the fields to write and, for the ones the dump lacks, a
+    function giving each row's value: the field default, or None for the
+    derived columns that hooks fill in.
+    """
+    fields = model._meta.concrete_fields
+    missing = {}
+    for field in fields:
+        if field.column in columns or field.column in derived:
+            continue
+        if not field.has_default() and not field.null and (
+                not field.empty_strings_allowed):
+            raise SnapshotError(
+                f"The dump has no {model._meta.db_table}.{field.column} "
+                f"and the field has no default.")
+        missing[field.column] = field.get_default
+    return fields, missing
+
+
+def write_rows(cursor, model, fields, rows, batch_size):
+    """Writes rows, lists of values in field order, to the model's table."""
+    table = connection.ops.quote_name(model._meta.db_table)
+    names = ', '.join(
+        connection.ops.quote_name(field.column) for field in fields)
+    if connection.vendor == 'postgresql':
+        lines = (
+            '\t'.join(
+                copy_value(field, value)
+                for field, value in zip(fields, row)) + '\n'
+            for row in rows)
+        statement = f'COPY {table} ({names}) FROM STDIN'
+        driver_cursor = cursor.cursor
+        if hasattr(driver_cursor, 'copy'):
+            # psycopg 3
+            with driver_cursor.copy(statement) as copy:
+                for line in lines:
+                    copy.write(line)
+        else:
+            driver_cursor.copy_expert(statement, LineReader(lines))
+        return
+
+    statement = (
+        f'INSERT INTO {table} ({names}) VALUES '
+        f'({", ".join(["%s"] * len(fields))})')
+    batch = []
+    for row in rows:
+        batch.append([
+            insert_value(field, value)
+            for field, value in zip(fields, row)])
+        if len(batch) >= batch_size:
+            cursor.executemany(statement, batch)
+            batch = []
+    if batch:
+        cursor.executemany(statement, batch)
+
+
+class LineReader:
+    """A file-like view of an iterator of lines, for copy_expert()."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        return next(self.lines, '')
+
+
+@contextmanager
+def deferred_indexes(tables):
+    """
+    Drops the indexes and constraints of tables and creates them again on
+    exit, keeping primary keys that other tables' foreign keys need.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            statements = _drop_postgresql_indexes(cursor, tables)
+        elif connection.vendor == 'sqlite':
+            statements = _drop_sqlite_indexes(cursor, tables)
+        else:
+            statements = []
+    yield
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def _drop_postgresql_indexes(cursor, tables):
+    quote = connection.ops.quote_name
+    cursor.execute(
+        "SELECT oid FROM pg_class WHERE relname = ANY(%s::text[]) "
+        "AND relkind = 'r' AND pg_table_is_visible(oid)", [list(tables)])
+    oids = [oid for oid, in cursor.fetchall()]
+    # Constraints, foreign keys last, except those that back a foreign
+    # key of a table that is not being loaded
+    cursor.execute(
+        "SELECT con.conrelid::regclass::text, con.conname, "
+        "pg_get_constraintdef(con.oid), con.contype = 'f' "
+        "FROM pg_constraint con WHERE con.conrelid = ANY(%s::oid[]) "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint fk "
+        "WHERE fk.contype = 'f' AND fk.conindid = con.conindid "
+        "AND con.contype != 'f' AND NOT fk.conrelid = ANY(%s::oid[])) "
+        "ORDER BY con.contype = 'f'", [oids, oids])
+    constraints = cursor.fetchall()
+    cursor.execute(
+        "SELECT idx.relname, pg_get_indexdef(idx.oid) FROM pg_index x "
+        "JOIN pg_class idx ON idx.oid = x.indexrelid "
+        "WHERE x.indrelid = ANY(%s::oid[]) AND NOT EXISTS "
+        "(SELECT 1 FROM pg_constraint con WHERE con.conindid = x.indexrelid)",
+        [oids])
+    indexes = cursor.fetchall()
+
+    for table, name, _, _ in reversed(constraints):
+        cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {quote(name)}')
+    for name, _ in indexes:
+        cursor.execute(f'DROP INDEX {quote(name)}')
+    adds = {
+        is_foreign_key: [
+            f'ALTER TABLE {table} ADD CONSTRAINT {quote(name)} {definition}'
+            for table, name, definition, foreign_key in constraints
+            if foreign_key == is_foreign_key]
+        for is_foreign_key in (False, True)
+    }
+    return (
+        adds[False] + [definition for _, definition in indexes]
+        + adds[True])
+
+
+def _drop_sqlite_indexes(cursor, tables):
+    # Unique constraints declared in the table have indexes without SQL,
+    # which stay. Foreign keys are only checked on commit anyway.
+    cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+        f"AND sql IS NOT NULL AND tbl_name IN "
+        f"({', '.join(['%s'] * len(tables))})", list(tables))
+    indexes = cursor.fetchall()
+    for name, _ in indexes:
+        cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+    return [definition for _, definition in indexes]
+
+
+def check_empty(models_to_load):
+    filled = [
+        model._meta.db_table for model in models_to_load
+        if model._default_manager.exists()]
+    if filled:
+        raise SnapshotError(
+            f"{', '.join(filled)} already hold rows, load the snapshot "
+            f"into a freshly migrated database.")
+
+
+def load(file, anonymize=False, batch_size=BATCH_SIZE, progress=None):
+    """
+    Loads the snapshot in the open binary file into the empty tables of
+    the project's models, in one transaction. Returns a list of (table,
+    rows, bytes, seconds) tuples, the loaded tables followed by the steps
+    run after them, and the names of the tables in the dump that were
+    left out.
+
+    progress, if given, is called with the table and the rows loaded so
+    far every PROGRESS_EVERY rows.
+    """
+    archive = DumpArchive(file)
+    order = load_order()
+    conversations = ConversationBuilder()
+    # Columns a snapshot from before their migration lacks, and the hook
+    # that fills them in from the rest of the row
+    derived = {
+        Profile: (
+            {'criteria', 'available_from', 'available_to'}, derive_profile),
+        BookingRequest: ({'start_date', 'end_date'}, derive_booking),
+        Message: ({'conversation_id'}, conversations),
+    }
+    hooks = {}
+    for model, (columns, hook) in derived.items():
+        entry = archive.tables.get(model._meta.db_table)
+        if entry and not columns <= set(entry.columns):
+            hooks[model] = [hook]
+    if anonymize:
+        anonymizer = Anonymizer()
+        hooks.setdefault(User, []).append(anonymizer.user)
+        hooks.setdefault(Notification, []).append(anonymizer.notification)
+
+    to_load = [
+        model for model in order if model._meta.db_table in archive.tables]
+    stats = []
+    with transaction.atomic():
+        check_empty(order)
+        tables = [model._meta.db_table for model in order]
+        with deferred_indexes(tables), connection.cursor() as cursor:
+            for model in to_load:
+                entry = archive.tables[model._meta.db_table]
+                stats.append(load_table(
+                    cursor, archive, entry, model, hooks.get(model, []),
+                    derived.get(model, (set(),))[0], batch_size, progress))
+            started = time.monotonic()
+            count = conversations.save(batch_size)
+            stats.append(('conversations', count, 0,
+                          time.monotonic() - started))
+
+        started = time.monotonic()
+        connection.check_constraints(table_names=tables)
+        with connection.cursor() as cursor:
+            for statement in connection.ops.sequence_reset_sql(
+                    no_style(), order):
+                cursor.execute(statement)
+        stats.append(('indexes and constraints', 0, 0,
+                      time.monotonic() - started))
+
+        started = time.monotonic()
+        set_count, _ = MatchResponse.objects.refresh_mutual()
+        stats.append(('mutual flags', set_count, 0,
+                      time.monotonic() - started))
+        started = time.monotonic()
+        user_ids = list(Profile.objects.order_by('user_id').values_list(
+            'user_id', flat=True))
+        changed = sum(
+            refresh_review_stats(user_ids[start:start + 1000])
+            for start in range(0, len(user_ids), 1000))
+        stats.append(('review totals', changed, 0,
+                      time.monotonic() - started))
+
+    candidate_index.invalidate()
+    skipped = sorted(
+        set(archive.tables) - {model._meta.db_table for model in to_load})
+    return stats, skipped
+
+
+def load_table(cursor, archive, entry, model, hooks, derived, batch_size,
+               progress):
+    fields, missing = table_plan(model, entry.columns, derived)
+    read = [0]
+    count = [0]
+
+    def rows():
+        for values, read[0] in archive.rows(entry):
+            row = dict(zip(entry.columns, values))
+            for column, default in missing.items():
+                row[column] = default()
+            for hook in hooks:
+                hook(row)
+            count[0] += 1
+            if progress and not count[0] % PROGRESS_EVERY:
+                progress(entry.table, count[0])
+            yield [row.get(field.column) for field in fields]
+
+    started = time.monotonic()
+    write_rows(cursor, model, fields, rows(), batch_size)
+    return entry.table, count[0], read[0], time.monotonic() - started
@@ -0,0 +1,43 @@
+"""
+Storage of staged house image uploads in the database.
+
+Uploads wait in the staging storage until a worker pushes them to
+Cloudinary (see profiles/uploads.py). A dyno's local disk is neither
+shared with the other dynos nor kept over a restart, so the files are
+kept as StagedFile rows instead, which every process can read and which
+are written in the same transaction as their HouseImage.
+"""
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+
+from .models import StagedFile
+
+
+@deconstructible
+class DatabaseStorage(Storage):
+    def _open(self, name, mode='rb'):
+        try:
+            data = StagedFile.objects.values_list(
+                'data', flat=True).get(name=name)
+        except StagedFile.DoesNotExist:
+            raise FileNotFoundError(f"No staged file named {name}")
+        return ContentFile(bytes(data), name=name)
+
+    def _save(self, name, content):
+        StagedFile.objects.create(
+            name=name, data=b''.join(content.chunks()))
+        return name
+
+    def exists(self, name):
+        return StagedFile.objects.filter(name=name).exists()
+
+    def delete(self, name):
+        StagedFile.objects.filter(name=name).delete()
+
+    def size(self, name):
+        try:
+            return len(StagedFile.objects.values_list(
+                'data', flat=True).get(name=name))
+        except StagedFile.DoesNotExist:
+            raise FileNotFoundError(f"No staged file named {name}")
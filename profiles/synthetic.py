@@ -0,0 +1,372 @@
+"""
+Synthetic data for load tests.
+
+generate() fills the database with a population of users shaped like the
+real one: profiles with house criteria and availability, house images,
+likes of which a tunable share are returned, and between the mutual
+matches conversations, booking requests and reviews, plus a backlog of
+notifications. Every table is written with bulk_create, which skips
+save() and the signals, so the denormalised columns they maintain (the
+criteria mask, the availability range, the mutual flag, the conversation
+pointers and unread counts and the review totals) are filled in here.
+
+The house images all point at a few placeholder files written to the
+default storage, which should be a local one (LOCAL_MEDIA=true) rather
+than Cloudinary. The users are named <prefix>-<n> and share the password
+SYNTHETIC_PASSWORD, so the run_benchmarks command can log in as them;
+clear() removes them again along with the placeholders.
+"""
+import io
+import logging
+import os
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from messaging.models import (
+    BookingRequest, Conversation, ConversationParticipant, Message)
+from notifications.models import Notification
+from reviews.models import Review, refresh_review_stats
+
+from .cleanup import delete_files, list_files
+from .feed import candidate_index
+from .models import (
+    CRITERIA_FIELDS, FileDeletion, HouseImage, MatchResponse, Profile,
+    criteria_mask)
+from .variants import generate_variants
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFIX = 'synthetic'
+SYNTHETIC_PASSWORD = 'synthetic-password'
+PLACEHOLDER_DIR = 'house_images/synthetic'
+PLACEHOLDER_COUNT = 8
+BATCH_SIZE = 5000
+
+FIRST_NAMES = [
+    'Alex', 'Sam', 'Maria', 'Jonas', 'Aoife', 'Luca', 'Noor', 'Kenji',
+    'Ines', 'Tomas', 'Freya', 'Omar', 'Lena', 'Pablo', 'Mei', 'Ravi',
+]
+LAST_NAMES = [
+    'Murphy', 'Garcia', 'Schmidt', 'Rossi', 'Dubois', 'Novak', 'Silva',
+    'Jensen', 'Kowalski', 'Tanaka', 'Okafor', 'Larsen', 'Byrne', 'Costa',
+]
+COUNTRIES = [
+    'IE', 'GB', 'FR', 'ES', 'PT', 'IT', 'DE', 'NL', 'GR', 'HR', 'SE',
+    'NO', 'US', 'CA', 'AU', 'JP',
+]
+DESTINATIONS = [
+    'Lisbon', 'Crete', 'the Alps', 'Kyoto', 'Dublin', 'the Algarve',
+    'Tuscany', 'Barcelona', 'Lapland', 'Vancouver', 'Provence',
+]
+REVIEW_COMMENTS = [
+    'Lovely house and a great host.',
+    'Everything was as described.',
+    'Spotless, would swap again.',
+    'A bit noisy at night but a great location.',
+    'Communication could have been quicker.',
+]
+MESSAGES = [
+    'Hi! Your place looks amazing.',
+    'Would those dates work for you?',
+    'Sounds great, let me check with my family.',
+    'Is there parking near the house?',
+    'Yes, there is a space in the driveway.',
+    'Perfect, talk soon!',
+]
+# status -> weight of the booking requests
+BOOKING_STATUSES = {
+    'pending': 4, 'accepted': 2, 'denied': 2, 'cancelled': 1, 'expired': 1,
+}
+# Criteria are mostly off, as on the real site
+CRITERIA_RATE = 0.3
+
+
+def existing_users(prefix=DEFAULT_PREFIX):
+    return User.objects.filter(username__startswith=f'{prefix}-')
+
+
+def clear(prefix=DEFAULT_PREFIX, storage=None):
+    """
+    Deletes the synthetic users, their rows through the cascade and the
+    placeholder files. Returns the number of users deleted.
+    """
+    storage = storage or default_storage
+    with transaction.atomic():
+        deleted = existing_users(prefix).count()
+        existing_users(prefix).delete()
+        # The images share the placeholders, which are deleted below
+        # rather than through the queue
+        FileDeletion.objects.filter(
+            name__startswith=PLACEHOLDER_DIR).delete()
+    names = [name for name, _ in list_files(storage, PLACEHOLDER_DIR)]
+    for name, exc in delete_files(storage, names).items():
+        logger.warning(f"Could not delete placeholder {name}: {exc}")
+    return deleted
+
+
+def write_placeholders(storage, count=PLACEHOLDER_COUNT, rng=random):
+    """
+    Writes count solid colour JPEGs and their variants to storage.
+    Returns a (name, variants) pair for each.
+    """
+    placeholders = []
+    for number in range(count):
+        colour = tuple(rng.randrange(60, 220) for _ in range(3))
+        buffer = io.BytesIO()
+        Image.new('RGB', (1280, 853), colour).save(buffer, 'JPEG')
+        name = storage.save(
+            os.path.join(PLACEHOLDER_DIR, f'placeholder-{number}.jpg'),
+            ContentFile(buffer.getvalue()))
+        buffer.seek(0)
+        placeholders.append(
+            (name, generate_variants(buffer, name, storage)))
+    return placeholders
+
+
+def random_range(rng, today, max_days):
+    start = today + timedelta(days=rng.randrange(7, 365))
+    return start, start + timedelta(days=rng.randint(2, max_days))
+
+
+def overlaps(ranges, start, end):
+    return any(start <= other_end and other_start <= end
+               for other_start, other_end in ranges)
+
+
+def generate(users=1000, likes_per_user=20, mutual_rate=0.3,
+             images_per_profile=3, conversation_rate=0.6,
+             messages_per_conversation=8, booking_rate=0.3,
+             review_rate=0.4, notifications_per_user=5,
+             prefix=DEFAULT_PREFIX, seed=1, storage=None,
+             batch_size=BATCH_SIZE, progress=None):
+    """
+    Creates the synthetic population in one transaction. mutual_rate is
+    the share of likes the liked user returns; the conversation, booking
+    and review rates are shares of the mutual pairs. The per-user and
+    per-profile numbers are averages. Returns the number of rows created
+    per model name.
+
+    progress, if given, is called with each model name and its count as
+    the rows are written.
+    """
+    rng = random.Random(seed)
+    storage = storage or default_storage
+    today = date.today()
+    counts = {}
+
+    def create(model, objects):
+        model.objects.bulk_create(objects, batch_size=batch_size)
+        counts[model.__name__] = len(objects)
+        if progress:
+            progress(model.__name__, len(objects))
+        return objects
+
+    placeholders = []
+    if images_per_profile:
+        placeholders = write_placeholders(storage, rng=rng)
+
+    with transaction.atomic():
+        # Hashing is slow on purpose, so every user shares one hash
+        password = make_password(SYNTHETIC_PASSWORD)
+        create(User, [
+            User(username=f'{prefix}-{number}',
+                 email=f'{prefix}-{number}@example.com',
+                 password=password)
+            for number in range(users)
+        ])
+        usernames = dict(existing_users(prefix).order_by(
+            'id').values_list('id', 'username'))
+        user_ids = list(usernames)
+
+        profiles = []
+        for user_id in user_ids:
+            flags = {
+                field: rng.random() < CRITERIA_RATE
+                for field in CRITERIA_FIELDS
+            }
+            available_dates = ''
+            available_from = available_to = None
+            if rng.random() < 0.8:
+                available_from, available_to = random_range(rng, today, 28)
+                available_dates = f'{available_from} to {available_to}'
+            profiles.append(Profile(
+                user_id=user_id,
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                bio='Synthetic profile for load testing.',
+                location=rng.choice(COUNTRIES),
+                is_visible=rng.random() < 0.95,
+                house_description='A house with room for a family.',
+                preferred_destinations=', '.join(
+                    rng.sample(DESTINATIONS, 2)),
+                available_dates=available_dates,
+                available_from=available_from,
+                available_to=available_to,
+                criteria=criteria_mask(flags),
+                **flags,
+            ))
+        create(Profile, profiles)
+        profile_ids = dict(Profile.objects.filter(
+            user_id__in=user_ids).values_list('user_id', 'id'))
+
+        images = []
+        if placeholders:
+            for profile_id in profile_ids.values():
+                for _ in range(rng.randint(0, 2 * images_per_profile)):
+                    name, variants = rng.choice(placeholders)
+                    images.append(HouseImage(
+                        profile_id=profile_id, image=name,
+                        variants=variants))
+        create(HouseImage, images)
+
+        # Likes as (from user, to user) pairs, a share of them returned
+        liked = set()
+        if len(user_ids) > 1:
+            per_user = min(likes_per_user, len(user_ids) - 1)
+            for user_id in user_ids:
+                for other_id in rng.sample(user_ids, per_user + 1):
+                    if other_id == user_id or (user_id, other_id) in liked:
+                        continue
+                    liked.add((user_id, other_id))
+                    if rng.random() < mutual_rate:
+                        liked.add((other_id, user_id))
+        create(MatchResponse, [
+            MatchResponse(
+                from_user_id=from_id, to_profile_id=profile_ids[to_id],
+                liked=True, mutual=(to_id, from_id) in liked)
+            for from_id, to_id in sorted(liked)
+        ])
+        pairs = sorted(
+            (from_id, to_id) for from_id, to_id in liked
+            if from_id < to_id and (to_id, from_id) in liked)
+
+        generate_conversations(
+            rng, pairs, conversation_rate, messages_per_conversation,
+            create)
+        generate_bookings(rng, pairs, booking_rate, today, create)
+
+        reviews = []
+        for pair in pairs:
+            for reviewer_id, reviewee_id in (pair, pair[::-1]):
+                if rng.random() < review_rate:
+                    reviews.append(Review(
+                        reviewer_id=reviewer_id, reviewee_id=reviewee_id,
+                        rating=rng.choices(
+                            range(1, 6), weights=[1, 1, 3, 8, 12])[0],
+                        comment=rng.choice(REVIEW_COMMENTS)))
+        create(Review, reviews)
+        reviewees = sorted({review.reviewee_id for review in reviews})
+        for start in range(0, len(reviewees), 1000):
+            refresh_review_stats(reviewees[start:start + 1000])
+
+        notifications = []
+        for user_id in user_ids:
+            for _ in range(rng.randint(0, 2 * notifications_per_user)):
+                other_id = rng.choice(user_ids)
+                other = usernames[other_id]
+                notifications.append(Notification(
+                    user_id=user_id,
+                    message=rng.choice([
+                        f'{other} liked your profile!',
+                        f'You matched with {other}!',
+                        f'New message from {other}',
+                    ]),
+                    link=reverse('view_profile', args=[other_id]),
+                    is_read=rng.random() < 0.6))
+        create(Notification, notifications)
+
+    # The index of this process would not see rows written without
+    # signals until its TTL runs out
+    candidate_index.invalidate()
+    return counts
+
+
+def generate_conversations(rng, pairs, rate, messages_per_conversation,
+                           create):
+    conversations = create(Conversation, [
+        Conversation(user_a_id=user_a, user_b_id=user_b)
+        for user_a, user_b in pairs if rng.random() < rate
+    ])
+    # bulk_create() stamps each message with the current time, so the
+    # messages are created oldest first and their ids and timestamps
+    # follow the order of each conversation
+    messages = []
+    for conversation in conversations:
+        users = [conversation.user_a_id, conversation.user_b_id]
+        rng.shuffle(users)
+        for number in range(
+                rng.randint(1, 2 * messages_per_conversation - 1)):
+            if number and rng.random() < 0.6:
+                users.reverse()
+            messages.append(Message(
+                conversation=conversation, sender_id=users[0],
+                recipient_id=users[1], content=rng.choice(MESSAGES)))
+    create(Message, messages)
+
+    # What Message.save() would have recorded, message by message
+    participants = {}
+    for conversation in conversations:
+        for user_id in (conversation.user_a_id, conversation.user_b_id):
+            participants[conversation.id, user_id] = (
+                ConversationParticipant(
+                    conversation=conversation, user_id=user_id))
+    for message in messages:
+        conversation = message.conversation
+        conversation.last_message = message
+        conversation.last_message_at = message.timestamp
+        sender = participants[conversation.id, message.sender_id]
+        sender.last_read_at = message.timestamp
+        sender.unread_count = 0
+        participants[conversation.id, message.recipient_id].unread_count += 1
+        for user_id in (message.sender_id, message.recipient_id):
+            participants[conversation.id, user_id].last_message_at = (
+                message.timestamp)
+    # Most people have read their messages
+    for participant in participants.values():
+        if participant.unread_count and rng.random() < 0.7:
+            participant.unread_count = 0
+            participant.last_read_at = participant.last_message_at
+    Conversation.objects.bulk_update(
+        conversations, ['last_message', 'last_message_at'],
+        batch_size=BATCH_SIZE)
+    create(ConversationParticipant, list(participants.values()))
+
+
+def generate_bookings(rng, pairs, rate, today, create):
+    # Accepted bookings of the same user never overlap, as
+    # handle_booking_response() refuses them
+    accepted = {}
+    bookings = []
+    statuses, weights = zip(*BOOKING_STATUSES.items())
+    for pair in pairs:
+        if rng.random() >= rate:
+            continue
+        sender_id, recipient_id = rng.sample(pair, 2)
+        start, end = random_range(rng, today, 14)
+        status = rng.choices(statuses, weights)[0]
+        if status == 'accepted':
+            if any(overlaps(accepted.get(user_id, ()), start, end)
+                   for user_id in pair):
+                status = 'pending'
+            else:
+                for user_id in pair:
+                    accepted.setdefault(user_id, []).append((start, end))
+        responded = status in ('accepted', 'denied')
+        bookings.append(BookingRequest(
+            sender_id=sender_id, recipient_id=recipient_id,
+            requested_dates=f'{start} to {end}',
+            start_date=start, end_date=end,
+            message='Would you like to swap houses?',
+            status=status,
+            responded_at=timezone.now() if responded else None,
+            last_action_by_id=recipient_id if responded else sender_id))
+    create(BookingRequest, bookings)
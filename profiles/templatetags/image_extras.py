@@ -1,9 +1,43 @@
 # profiles/templatetags/image_extras.py
 from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+from profiles.variants import FORMATS
 
 register = template.Library()
 
 
 @register.filter
 def get_main_image(images):
-    return images.filter(is_main=True).first()
+    """The first of a prefetched list of images, without a query."""
+    return next(iter(images), None)
+
+
+@register.simple_tag
+def responsive_image(image, sizes='100vw', alt='', loading='lazy', **attrs):
+    """
+    A lazily loaded <picture> offering the variants of a HouseImage in
+    each recorded format for the browser to pick from, or a plain <img>
+    of the original if it has no variants. Other keyword arguments become
+    attributes of the <img>.
+    """
+    attrs = {'alt': alt, 'loading': loading, 'decoding': 'async', **attrs}
+    fallback = image.variants_of('jpeg')
+    if not fallback:
+        return format_html(
+            '<img src="{}"{}>', image.image.url, flatatt(attrs))
+
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">', [
+            (mime_type, image.srcset(format_name), sizes)
+            for format_name, (_, _, mime_type, _) in FORMATS.items()
+            if format_name != 'jpeg' and image.variants_of(format_name)
+        ])
+    largest = fallback[-1]
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" '
+        'height="{}"{}></picture>',
+        sources, image.image.storage.url(largest['name']),
+        image.srcset('jpeg'), sizes, largest['width'], largest['height'],
+        flatatt(attrs))
@@ -1,6 +1,9 @@
-from django.test import TestCase, Client
+from django.test import RequestFactory, TestCase
+from django.http import HttpResponse
 from django.core.files.uploadedfile import SimpleUploadedFile
-from profiles.models import Profile, HouseImage, MatchResponse
+from profiles.models import (
+    Profile, HouseImage, MatchResponse, criteria_mask, parse_date_range)
+from datetime import date
 from django.core.exceptions import ValidationError
 import io
 import json
@@ -10,20 +13,62 @@ from profiles.forms import (
     UserForm,
     ProfileForm,
     ImageForm,
-    ContactForm
+    ContactForm,
+    SearchForm
 )
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.contrib.messages import get_messages
-from messaging.models import BookingRequest
-from notifications.models import Notification
+from messaging.history import PAGE_SIZE
+from messaging.models import BookingRequest, Message
+from reviews.models import Review
+from notifications.models import Notification, OutboundEmail
 from django.utils.timezone import now
 from django.core import mail
+from django.db import connection, transaction, DatabaseError
+from django.test.utils import CaptureQueriesContext
+from codestar.testing import (
+    QUERY_BUDGETS, QueryBudgetMixin, QueryPlanMixin)
+from codestar.metrics import RequestMetricsMiddleware
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from profiles.views import (
     get_latest_booking,
     check_if_matched,
     user_is_matched
 )
+from profiles.feed import candidate_index, FeedCursor
+from profiles.uploads import (
+    claim_image, get_staging_storage, publish_image, publish_images,
+    stage_image)
+from profiles.variants import (
+    add_variants, generate_variants, variant_formats)
+from profiles.cleanup import delete_batch, delete_files, find_orphans
+from profiles.cards import render_card, render_cards
+from django.core.cache import caches
+from django.test import override_settings
+from profiles.models import FileDeletion, StagedFile
+from profiles.storage import DatabaseStorage
+from cloudinary_storage.storage import MediaCloudinaryStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage
+from datetime import timedelta
+from django.template import Context, Template
+from django.core.files.storage import default_storage
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from messaging.models import Conversation
+from django.conf import settings
+from profiles import loadtest, snapshot, synthetic
+from profiles.models import CRITERIA_FIELDS
+from reviews.models import refresh_review_stats
 User = get_user_model()
 
 
@@ -39,6 +84,69 @@ class ProfileModelTest(TestCase):
         self.assertTrue(profile.is_visible)
         self.assertFalse(profile.pets_allowed)
         self.assertEqual(profile.first_name, '')
+        self.assertEqual(profile.criteria, 0)
+
+    def test_profile_criteria_bitmask_kept_in_sync(self):
+        user = User.objects.create(username='carol')
+        profile = Profile.objects.create(
+            user=user, pets_allowed=True, near_beach=True)
+        self.assertEqual(profile.criteria, 0b1001)
+
+        profile.near_beach = False
+        profile.in_rural = True
+        profile.save(update_fields=['near_beach', 'in_rural'])
+        profile.refresh_from_db()
+        self.assertEqual(profile.criteria, 0b1000001)
+
+    def test_with_criteria_matches_all_bits(self):
+        both = Profile.objects.create(
+            user=User.objects.create(username='both'),
+            has_pool=True, in_city=True)
+        Profile.objects.create(
+            user=User.objects.create(username='pool'), has_pool=True)
+        mask = criteria_mask({'has_pool': True, 'in_city': True})
+        self.assertEqual(
+            list(Profile.objects.with_criteria(mask)), [both])
+        self.assertEqual(Profile.objects.with_criteria(0).count(), 2)
+
+
+class AvailabilityRangeTest(TestCase):
+    def test_parse_date_range(self):
+        self.assertEqual(
+            parse_date_range('2025-07-01 to 2025-07-14'),
+            (date(2025, 7, 1), date(2025, 7, 14)))
+        self.assertEqual(
+            parse_date_range('2025-07-01'),
+            (date(2025, 7, 1), date(2025, 7, 1)))
+        self.assertIsNone(parse_date_range(''))
+        self.assertIsNone(parse_date_range('July'))
+        self.assertIsNone(parse_date_range('2025-07-14 to 2025-07-01'))
+
+    def test_save_parses_available_dates(self):
+        profile = Profile.objects.create(
+            user=User.objects.create(username='dana'),
+            available_dates='2025-07-01 to 2025-07-14')
+        self.assertEqual(profile.available_from, date(2025, 7, 1))
+        self.assertEqual(profile.available_to, date(2025, 7, 14))
+
+        profile.available_dates = ''
+        profile.save()
+        self.assertIsNone(profile.available_from)
+        self.assertIsNone(profile.available_to)
+
+    def test_available_between_is_an_overlap_query(self):
+        profile = Profile.objects.create(
+            user=User.objects.create(username='erin'),
+            available_dates='2025-07-01 to 2025-07-14')
+        overlapping = Profile.objects.available_between(
+            date(2025, 7, 10), date(2025, 7, 20))
+        inside = Profile.objects.available_between(
+            date(2025, 7, 5), date(2025, 7, 6))
+        after = Profile.objects.available_between(
+            date(2025, 7, 15), date(2025, 7, 20))
+        self.assertEqual(list(overlapping), [profile])
+        self.assertEqual(list(inside), [profile])
+        self.assertFalse(after.exists())
 
 
 class HouseImageModelTest(TestCase):
@@ -85,6 +193,38 @@ class MatchResponseModelTest(TestCase):
             MatchResponse.objects.create(
                 from_user=self.user1, to_profile=self.profile2, liked=False)
 
+    def test_mutual_flag_follows_both_responses(self):
+        profile1 = Profile.objects.create(user=self.user1)
+        first = MatchResponse.objects.create(
+            from_user=self.user1, to_profile=self.profile2, liked=True)
+        self.assertFalse(first.mutual)
+
+        second = MatchResponse.objects.create(
+            from_user=self.user2, to_profile=profile1, liked=True)
+        first.refresh_from_db()
+        self.assertTrue(first.mutual and second.mutual)
+        self.assertTrue(MatchResponse.objects.is_match(self.user1, self.user2))
+
+        second.delete()
+        first.refresh_from_db()
+        self.assertFalse(first.mutual)
+        self.assertFalse(
+            MatchResponse.objects.is_match(self.user1, self.user2))
+
+    def test_backfill_command_repairs_mutual_flags(self):
+        profile1 = Profile.objects.create(user=self.user1)
+        MatchResponse.objects.create(
+            from_user=self.user1, to_profile=self.profile2, liked=True)
+        MatchResponse.objects.create(
+            from_user=self.user2, to_profile=profile1, liked=True)
+        MatchResponse.objects.update(mutual=False)
+
+        out = StringIO()
+        call_command('backfill_mutual_matches', stdout=out)
+        self.assertIn("Set 2 mutual flags", out.getvalue())
+        self.assertEqual(
+            MatchResponse.objects.filter(mutual=True).count(), 2)
+
 
 class TestProfileForms(TestCase):
 
@@ -171,6 +311,21 @@ class TestProfileForms(TestCase):
         self.assertFalse(form.is_valid())
         self.assertIn('image', form.errors)
 
+    def test_search_form_criteria_mask(self):
+        form = SearchForm(data={'has_pool': 'on', 'in_mountains': 'on'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.criteria_mask(), 0b10010)
+
+    def test_profile_form_invalid_available_dates(self):
+        form = ProfileForm(data={
+            'bio': 'We are a nice couple.',
+            'house_description': 'Lovely home',
+            'location': 'US',
+            'available_dates': 'next summer',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('available_dates', form.errors)
+
     def test_contact_form_blank_name(self):
         form = ContactForm(data={
             'name': '   ',
@@ -212,7 +367,7 @@ class TestProfileForms(TestCase):
         self.assertIn('message', form.errors)
 
 
-class ProfileViewTest(TestCase):
+class ProfileViewTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
             username='testuser', password='testpass'
@@ -244,7 +399,7 @@ class ProfileViewTest(TestCase):
         )
 
 
-class EditProfileViewTest(TestCase):
+class EditProfileViewTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
             username='testuser', password='testpass', email='test@example.com'
@@ -318,7 +473,7 @@ def generate_test_image():
         "test.jpg", img_io.read(), content_type="image/jpeg")
 
 
-class UploadImagesViewTest(TestCase):
+class UploadImagesViewTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
             username='imguser', password='imgpass')
@@ -364,8 +519,329 @@ class UploadImagesViewTest(TestCase):
 
         self.assertContains(response, "There was a problem updating images.")
 
+    def test_upload_is_staged_and_acknowledged(self):
+        self.client.login(username='imguser', password='imgpass')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(self.url, {
+                'form-TOTAL_FORMS': 1,
+                'form-INITIAL_FORMS': 0,
+                'form-0-image': generate_test_image(),
+            })
+
+        self.assertRedirects(response, reverse('edit_profile'))
+        image = HouseImage.objects.get(profile=self.user.profile)
+        self.assertEqual(image.status, HouseImage.PENDING)
+        self.assertFalse(image.image)
+        self.assertTrue(get_staging_storage().exists(image.staged_name))
+
+        with mock.patch('profiles.uploads.get_executor') as get_executor:
+            for callback in callbacks:
+                callback()
+        get_executor.return_value.submit.assert_called_once_with(
+            mock.ANY, image.id)
+
+        response = self.client.get(reverse('edit_profile'))
+        self.assertContains(response, 'Uploading')
+
 
-class DeleteProfileViewTest(TestCase):
+class HouseImageUploadTest(QueryBudgetMixin, TestCase):
+    """
+    Background uploads, with local filesystem storages standing in for
+    Cloudinary and the staging area.
+    """
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        storage = 'django.core.files.storage.FileSystemStorage'
+        # Django 4.2 drops the OPTIONS of an overridden default storage,
+        # so the media storage is pointed at MEDIA_ROOT instead
+        settings = self.settings(
+            MEDIA_ROOT=os.path.join(root, 'media'),
+            STORAGES={
+                'default': {'BACKEND': storage},
+                'staging': {
+                    'BACKEND': storage,
+                    'OPTIONS': {'location': os.path.join(root, 'staging')}},
+            })
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user(username='owner')
+        self.profile = Profile.objects.create(user=self.user)
+
+    def stage(self):
+        image = HouseImage(profile=self.profile)
+        stage_image(image, generate_test_image())
+        image.save()
+        return image
+
+    def test_publish_moves_staged_file_to_media_storage(self):
+        image = self.stage()
+        staged_name = image.staged_name
+
+        self.assertEqual(publish_image(image.id), HouseImage.READY)
+
+        image.refresh_from_db()
+        self.assertEqual(image.status, HouseImage.READY)
+        self.assertEqual(image.staged_name, '')
+        self.assertTrue(default_storage.exists(image.image.name))
+        self.assertFalse(get_staging_storage().exists(staged_name))
+        self.assertTrue(image.variants)
+        for variant in image.variants:
+            self.assertTrue(default_storage.exists(variant['name']))
+        self.assertIsNone(publish_image(image.id))
+
+    def test_missing_staged_file_leaves_image_pending(self):
+        image = self.stage()
+        staging = get_staging_storage()
+        with staging.open(image.staged_name) as staged:
+            content = staged.read()
+        staging.delete(image.staged_name)
+
+        with self.assertLogs('profiles.uploads', 'WARNING'):
+            self.assertIsNone(publish_image(image.id))
+        image.refresh_from_db()
+        self.assertEqual(image.status, HouseImage.PENDING)
+
+        staging.save(image.staged_name, ContentFile(content))
+        HouseImage.objects.filter(id=image.id).update(
+            claimed_until=now() - timedelta(seconds=1))
+        self.assertEqual(publish_image(image.id), HouseImage.READY)
+
+    def test_upload_error_marks_image_failed(self):
+        image = self.stage()
+
+        with mock.patch.object(
+                default_storage, 'save', side_effect=OSError('refused')):
+            self.assertEqual(publish_image(image.id), HouseImage.FAILED)
+        image.refresh_from_db()
+        self.assertEqual(image.status, HouseImage.FAILED)
+
+    def test_upload_runs_outside_a_transaction(self):
+        image = self.stage()
+        depth = len(connection.atomic_blocks)
+        depths = []
+
+        def record_depth(image, source):
+            depths.append(len(connection.atomic_blocks))
+            return []
+
+        with mock.patch('profiles.uploads.add_variants', record_depth):
+            self.assertEqual(publish_image(image.id), HouseImage.READY)
+        self.assertEqual(depths, [depth])
+        image.refresh_from_db()
+        self.assertIsNone(image.claimed_until)
+
+    def test_claimed_image_is_taken_over_once_claim_runs_out(self):
+        image = self.stage()
+        self.assertIsNotNone(claim_image(image.id))
+
+        self.assertIsNone(publish_image(image.id))
+
+        HouseImage.objects.filter(id=image.id).update(
+            claimed_until=now() - timedelta(seconds=1))
+        self.assertEqual(publish_image(image.id), HouseImage.READY)
+
+    def test_image_deleted_during_upload_queues_uploaded_files(self):
+        image = self.stage()
+
+        def delete_meanwhile(image, source):
+            HouseImage.objects.filter(id=image.id).delete()
+            return []
+
+        with mock.patch('profiles.uploads.add_variants', delete_meanwhile):
+            self.assertIsNone(publish_image(image.id))
+        uploaded = FileDeletion.objects.get(storage='default')
+        self.assertTrue(default_storage.exists(uploaded.name))
+
+    def test_publish_images_bounds_parallel_uploads(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow_publish(image_id):
+            with lock:
+                running.append(image_id)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(image_id)
+            return HouseImage.READY
+
+        with mock.patch('profiles.uploads.publish_image', slow_publish):
+            self.assertEqual(
+                publish_images(range(6), workers=3), (6, 0))
+        self.assertEqual(max(peak), 3)
+
+    def test_pending_images_hidden_from_other_users(self):
+        ready = HouseImage.objects.create(
+            profile=self.profile, image=generate_test_image())
+        self.stage()
+        viewer = User.objects.create_user(username='viewer', password='x')
+        MatchResponse.objects.create(
+            from_user=viewer, to_profile=self.profile, liked=True)
+        self.client.force_login(viewer)
+
+        response = self.client.get(reverse('travel_log'))
+
+        [match] = response.context['liked_profiles']
+        self.assertEqual(match.to_profile.ready_images, [ready])
+
+    def test_command_publishes_pending_images(self):
+        self.stage()
+        self.stage()
+        out = StringIO()
+
+        with mock.patch('profiles.uploads.publish_image',
+                        return_value=HouseImage.READY):
+            call_command('publish_house_images', stdout=out)
+
+        self.assertIn('Uploaded 2 of 2 pending images', out.getvalue())
+
+    def test_command_loop_keeps_polling(self):
+        self.stage()
+        out = StringIO()
+
+        with mock.patch('profiles.uploads.publish_image',
+                        return_value=HouseImage.READY), \
+                mock.patch('time.sleep',
+                           side_effect=[None, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command(
+                    'publish_house_images', '--loop', '--interval=0',
+                    stdout=out)
+
+        self.assertEqual(out.getvalue().count('Uploaded 1 of 1'), 2)
+
+
+@override_settings(STORAGES={
+    **settings.STORAGES,
+    'staging': {'BACKEND': 'profiles.storage.DatabaseStorage'},
+})
+class DatabaseStagingTest(TestCase):
+    def test_staged_file_round_trip(self):
+        storage = DatabaseStorage()
+        name = storage.save('house_images/a.jpg', ContentFile(b'jpeg'))
+
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(storage.size(name), 4)
+        with storage.open(name) as staged:
+            self.assertEqual(staged.read(), b'jpeg')
+        self.assertNotEqual(
+            storage.save('house_images/a.jpg', ContentFile(b'png')), name)
+
+        storage.delete(name)
+        self.assertFalse(storage.exists(name))
+        with self.assertRaises(FileNotFoundError):
+            storage.open(name)
+
+    def test_image_staged_in_database_is_published(self):
+        profile = Profile.objects.create(
+            user=User.objects.create_user(username='owner'))
+        image = HouseImage(profile=profile)
+        stage_image(image, generate_test_image())
+        image.save()
+        self.assertTrue(StagedFile.objects.filter(
+            name=image.staged_name).exists())
+
+        self.assertEqual(publish_image(image.id), HouseImage.READY)
+        self.assertFalse(StagedFile.objects.exists())
+
+
+def generate_photo(width=2000, height=1500):
+    """A large JPEG with gradients and noise, compressing like a photo."""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    photo = Image.blend(gradient, noise, 0.3).convert('RGB')
+    img_io = io.BytesIO()
+    photo.save(img_io, format='JPEG', quality=90)
+    img_io.seek(0)
+    return SimpleUploadedFile(
+        'photo.jpg', img_io.read(), content_type='image/jpeg')
+
+
+class ImageVariantTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner')
+        self.profile = Profile.objects.create(user=self.user)
+
+    def test_variants_are_narrower_and_never_upscaled(self):
+        variants = generate_variants(
+            generate_photo(800, 600), 'house_images/photo.jpg',
+            default_storage)
+
+        self.assertEqual(
+            sorted({variant['width'] for variant in variants}), [320, 640])
+        self.assertEqual(
+            {variant['format'] for variant in variants},
+            set(variant_formats()))
+        self.assertIn('webp', variant_formats())
+        for variant in variants:
+            self.assertTrue(
+                variant['name'].startswith('house_images/variants/photo-'))
+            self.assertEqual(
+                variant['height'], variant['width'] * 3 // 4)
+
+        small = generate_variants(
+            generate_test_image(), 'house_images/test.jpg', default_storage)
+        self.assertEqual({variant['width'] for variant in small}, {10})
+
+    def test_card_variant_is_a_tenth_of_the_original(self):
+        photo = generate_photo()
+        variants = generate_variants(
+            photo, 'house_images/photo.jpg', default_storage)
+
+        # What a card slot of 640 CSS pixels downloads on a 2x screen
+        [card] = [
+            variant for variant in variants
+            if variant['format'] == 'webp' and variant['width'] == 1024]
+        self.assertLess(card['size'] * 10, photo.size)
+
+    def test_responsive_image_tag_emits_srcset(self):
+        image = HouseImage.objects.create(
+            profile=self.profile, image=generate_photo(800, 600))
+        with image.image.open('rb') as source:
+            add_variants(image, source)
+
+        html = Template(
+            '{% load image_extras %}'
+            '{% responsive_image image sizes="400px" class="img-fluid" %}'
+        ).render(Context({'image': image}))
+
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(image.srcset('webp'), html)
+        self.assertIn(' 640w', html)
+        self.assertIn('sizes="400px"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('class="img-fluid"', html)
+
+    def test_responsive_image_tag_falls_back_to_original(self):
+        image = HouseImage.objects.create(
+            profile=self.profile, image=generate_test_image())
+
+        html = Template(
+            '{% load image_extras %}{% responsive_image image alt="x" %}'
+        ).render(Context({'image': image}))
+
+        self.assertIn(f'src="{image.image.url}"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertNotIn('srcset', html)
+
+    def test_command_backfills_variants(self):
+        image = HouseImage.objects.create(
+            profile=self.profile, image=generate_test_image())
+        out = StringIO()
+
+        call_command('generate_image_variants', stdout=out)
+
+        image.refresh_from_db()
+        self.assertTrue(image.variants_of('webp'))
+        self.assertIn('Created variants for 1 images', out.getvalue())
+
+
+class DeleteProfileViewTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
             username='deleteuser', password='deletepass'
@@ -397,7 +873,118 @@ class DeleteProfileViewTest(TestCase):
         self.assertTrue(User.objects.filter(username='deleteuser').exists())
 
 
-class RegisterViewTest(TestCase):
+class BulkDeleteStorage(InMemoryStorage):
+    """A fake remote storage with a multi-delete call."""
+    calls = []
+    fail = False
+
+    def delete_many(self, names):
+        if self.fail:
+            raise ConnectionError("Storage unavailable")
+        self.calls.append(sorted(names))
+        for name in names:
+            self.delete(name)
+
+
+class StoredFileCleanupTest(TestCase):
+    def setUp(self):
+        BulkDeleteStorage.calls = []
+        BulkDeleteStorage.fail = False
+        settings = self.settings(STORAGES={
+            'default': {'BACKEND': 'profiles.tests.BulkDeleteStorage'},
+            'staging': {
+                'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user(username='owner')
+        self.profile = Profile.objects.create(user=self.user)
+
+    def create_image(self):
+        image = HouseImage.objects.create(
+            profile=self.profile, image=generate_test_image_file())
+        with image.image.open('rb') as source:
+            add_variants(image, source)
+        image.save(update_fields=['variants'])
+        return image
+
+    def test_deleting_user_queues_files_of_cascaded_rows(self):
+        image = self.create_image()
+        self.profile.image = default_storage.save(
+            'profile_images/me.jpg', ContentFile(b'me'))
+        self.profile.save()
+        files = {('default', name) for _, name in image.stored_files()}
+        self.assertEqual(len(files), 1 + len(image.variants))
+
+        self.user.delete()
+
+        self.assertEqual(
+            set(FileDeletion.objects.values_list('storage', 'name')),
+            files | {('default', 'profile_images/me.jpg')})
+
+    def test_default_profile_picture_is_never_queued(self):
+        self.user.delete()
+        self.assertFalse(FileDeletion.objects.exists())
+
+    def test_queued_files_are_deleted_in_one_call(self):
+        image = self.create_image()
+        names = sorted(name for _, name in image.stored_files())
+        image.delete()
+
+        self.assertEqual(delete_batch(), (len(names), 0, 0))
+        self.assertEqual(BulkDeleteStorage.calls, [names])
+        self.assertFalse(FileDeletion.objects.exists())
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_failed_deletions_back_off_then_give_up(self):
+        self.create_image().delete()
+        queued = FileDeletion.objects.count()
+        BulkDeleteStorage.fail = True
+
+        self.assertEqual(delete_batch(), (0, queued, 0))
+        deletion = FileDeletion.objects.first()
+        self.assertEqual(deletion.attempts, 1)
+        self.assertGreater(deletion.next_attempt_at, now())
+        self.assertEqual(delete_batch(), (0, 0, 0))
+
+        FileDeletion.objects.update(next_attempt_at=now())
+        self.assertEqual(delete_batch(max_attempts=2), (0, 0, queued))
+        self.assertFalse(FileDeletion.objects.filter(
+            status=FileDeletion.PENDING).exists())
+
+    def test_cloudinary_deletes_in_chunks_of_public_ids(self):
+        names = [f'house_images/photo{i}.jpg' for i in range(250)]
+        with mock.patch('cloudinary.api.delete_resources') as delete:
+            errors = delete_files(MediaCloudinaryStorage(), names)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(
+            [len(call.args[0]) for call in delete.call_args_list],
+            [100, 100, 50])
+        self.assertEqual(
+            delete.call_args_list[0].args[0][0], 'house_images/photo0')
+
+    def test_sweep_deletes_only_unreferenced_files(self):
+        image = self.create_image()
+        orphan = default_storage.save(
+            'house_images/variants/lost.webp', ContentFile(b'lost'))
+        default_storage.save('default.jpg', ContentFile(b'default'))
+
+        self.assertEqual(find_orphans(default_storage), [])
+        self.assertEqual(
+            find_orphans(default_storage, min_age=timedelta(0)), [orphan])
+
+        out = StringIO()
+        call_command('sweep_orphaned_files', '--min-age=0', stdout=out)
+        self.assertIn('Deleted 1 of 1 orphaned files', out.getvalue())
+        self.assertFalse(default_storage.exists(orphan))
+        for _, name in image.stored_files():
+            self.assertTrue(default_storage.exists(name))
+
+
+class RegisterViewTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.url = reverse('register')
 
@@ -452,7 +1039,7 @@ def generate_test_image_file():
         "test.jpg", img_io.read(), content_type="image/jpeg")
 
 
-class DeleteImageViewTest(TestCase):
+class DeleteImageViewTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.owner = User.objects.create_user(
             username='owner', password='pass123')
@@ -489,6 +1076,9 @@ class DeleteImageViewTest(TestCase):
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 204)
         self.assertFalse(HouseImage.objects.filter(id=self.image.id).exists())
+        self.assertEqual(
+            list(FileDeletion.objects.values_list('storage', 'name')),
+            [('default', self.image.image.name)])
 
     def test_invalid_method_returns_400(self):
         self.client.login(username='owner', password='pass123')
@@ -500,7 +1090,7 @@ class DeleteImageViewTest(TestCase):
         )
 
 
-class HomeViewTest(TestCase):
+class HomeViewTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
             username='alice', password='pass123')
@@ -552,6 +1142,16 @@ class HomeViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context['profile'], self.profile)
 
+    def test_home_view_with_overlapping_date_range(self):
+        response = self.client.get(
+            reverse('home') + '?dates=2025-07-10 to 2025-07-20')
+        self.assertEqual(response.context['profile'], self.profile)
+
+    def test_home_view_with_non_overlapping_date_range(self):
+        response = self.client.get(
+            reverse('home') + '?dates=2025-08-01 to 2025-08-10')
+        self.assertIsNone(response.context['profile'])
+
     def test_home_view_with_invalid_date_range(self):
         response = self.client.get(reverse('home') + '?dates=badformat')
         self.assertEqual(response.status_code, 200)
@@ -564,7 +1164,161 @@ class HomeViewTest(TestCase):
         self.assertIn('next_profile_html', response.json())
 
 
-class NextProfileViewTest(TestCase):
+class CandidateIndexTest(TestCase):
+    def setUp(self):
+        self.viewer = User.objects.create_user(
+            username='viewer', password='pass')
+        self.viewer_profile = Profile.objects.create(
+            user=self.viewer, location='GB')
+        self.beach = Profile.objects.create(
+            user=User.objects.create_user(username='beach'),
+            location='FR', near_beach=True)
+        self.city = Profile.objects.create(
+            user=User.objects.create_user(username='city'),
+            location='US', in_city=True)
+
+        # Keep the index between lookups so signal updates are exercised
+        ttl_patch = mock.patch.object(candidate_index, 'ttl', 3600)
+        ttl_patch.start()
+        self.addCleanup(ttl_patch.stop)
+        self.addCleanup(candidate_index.invalidate)
+        candidate_index.rebuild()
+
+    def test_excludes_own_profile(self):
+        self.assertEqual(
+            candidate_index.candidates(self.viewer),
+            [self.beach.id, self.city.id])
+
+    def test_anonymous_sees_all_visible(self):
+        self.assertEqual(
+            candidate_index.candidates(AnonymousUser()),
+            [self.viewer_profile.id, self.beach.id, self.city.id])
+
+    def test_filters_by_criteria_and_location(self):
+        self.assertEqual(
+            candidate_index.candidates(
+                self.viewer, {'near_beach': True}), [self.beach.id])
+        self.assertEqual(
+            candidate_index.candidates(
+                self.viewer, {'location': 'US'}), [self.city.id])
+        self.assertEqual(
+            candidate_index.candidates(
+                self.viewer, {'near_beach': True, 'location': 'US'}), [])
+
+    def test_profile_save_moves_bucket(self):
+        self.city.near_beach = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.city.save()
+        self.assertEqual(
+            candidate_index.candidates(self.viewer, {'near_beach': True}),
+            [self.beach.id, self.city.id])
+
+    def test_hidden_and_deleted_profiles_are_removed(self):
+        self.beach.is_visible = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.beach.save()
+            self.city.delete()
+        self.assertEqual(candidate_index.candidates(self.viewer), [])
+
+    def test_rolled_back_save_is_not_applied(self):
+        self.city.near_beach = True
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.city.save()
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertEqual(
+            candidate_index.candidates(self.viewer, {'near_beach': True}),
+            [self.beach.id])
+
+    def test_stale_index_is_served_while_another_thread_rebuilds(self):
+        candidate_index.candidates(self.viewer)  # load the viewer's responses
+        city_id = self.city.id
+        self.city.delete()
+        with mock.patch.object(candidate_index, 'ttl', 0):
+            # Another thread holds the rebuild, so no query runs or waits
+            with candidate_index._rebuild_lock, self.assertNumQueries(0):
+                self.assertEqual(
+                    candidate_index.candidates(self.viewer),
+                    [self.beach.id, city_id])
+            self.assertEqual(
+                candidate_index.candidates(self.viewer), [self.beach.id])
+
+    def test_responses_are_tracked(self):
+        self.assertEqual(
+            len(candidate_index.candidates(self.viewer)), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            match = MatchResponse.objects.create(
+                from_user=self.viewer, to_profile=self.beach, liked=False)
+        self.assertEqual(
+            candidate_index.candidates(self.viewer), [self.city.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            match.delete()
+        self.assertEqual(
+            candidate_index.candidates(self.viewer),
+            [self.beach.id, self.city.id])
+
+
+class FeedCursorTest(TestCase):
+    def setUp(self):
+        self.viewer = User.objects.create_user(username='viewer')
+        self.profiles = [
+            Profile.objects.create(
+                user=User.objects.create_user(username=f'host{i}'),
+                location='FR', has_pool=i % 2 == 0)
+            for i in range(12)
+        ]
+        ttl_patch = mock.patch.object(candidate_index, 'ttl', 3600)
+        ttl_patch.start()
+        self.addCleanup(ttl_patch.stop)
+        self.addCleanup(candidate_index.invalidate)
+        candidate_index.rebuild()
+
+    def drain(self, cursor, count=1):
+        seen = []
+        while True:
+            ids = cursor.next_ids(self.viewer, count)
+            if not ids:
+                return seen
+            seen.extend(ids)
+
+    def test_permutation_is_invertible(self):
+        for bits in (1, 2, 5, 10):
+            cursor = FeedCursor(seed=7, bits=bits)
+            ids = [cursor._to_id(pos) for pos in range(1 << bits)]
+            self.assertEqual(sorted(ids), list(range(1 << bits)))
+            self.assertEqual(
+                [cursor._to_position(pid) for pid in ids],
+                list(range(1 << bits)))
+
+    def test_pass_visits_each_candidate_once(self):
+        seen = self.drain(FeedCursor.start())
+        self.assertEqual(sorted(seen), [p.id for p in self.profiles])
+
+    def test_pass_applies_filters(self):
+        seen = self.drain(FeedCursor.start({'has_pool': True}), count=4)
+        self.assertEqual(
+            sorted(seen), [p.id for p in self.profiles if p.has_pool])
+
+    def test_ranks_remaining_when_probes_run_out(self):
+        cursor = FeedCursor.start()
+        expected = self.drain(FeedCursor(cursor.seed, cursor.bits))
+        with mock.patch('profiles.feed.PROBE_LIMIT', 0):
+            self.assertEqual(self.drain(cursor), expected)
+
+    def test_session_round_trip_keeps_order(self):
+        cursor = FeedCursor.start({'in_city': False, 'has_pool': True})
+        first = cursor.next_ids(self.viewer)
+        data = json.loads(json.dumps(cursor.to_session()))
+        self.assertEqual(data['filters'], {'has_pool': True})
+        restored = FeedCursor.from_session(data)
+        self.assertNotIn(first[0], self.drain(restored))
+        self.assertEqual(restored.seed, cursor.seed)
+
+
+class NextProfileViewTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
             username='viewer', password='testpass')
@@ -598,8 +1352,7 @@ class NextProfileViewTest(TestCase):
     def test_post_with_valid_session_returns_profile_html(self):
         self.client.login(username='viewer', password='testpass')
         session = self.client.session
-        session['profile_sequence'] = [self.other_profile.id]
-        session['current_index'] = 0
+        session['feed_cursor'] = FeedCursor.start().to_session()
         session.save()
 
         response = self.client.post(
@@ -611,9 +1364,11 @@ class NextProfileViewTest(TestCase):
 
     def test_post_with_only_one_profile_shows_alert(self):
         self.client.login(username='viewer', password='testpass')
+        cursor = FeedCursor.start()
+        cursor.position = 1 << cursor.bits  # Already seen the only profile
+        cursor.served = 1
         session = self.client.session
-        session['profile_sequence'] = [self.other_profile.id]
-        session['current_index'] = 1  # Already seen the only profile
+        session['feed_cursor'] = cursor.to_session()
         session.save()
 
         response = self.client.post(
@@ -624,14 +1379,286 @@ class NextProfileViewTest(TestCase):
         self.assertIn(
             "only matching profile", response.json()['next_profile_html'])
 
+    def test_post_at_end_of_pass_starts_new_pass(self):
+        self.client.login(username='viewer', password='testpass')
+        cursor = FeedCursor.start()
+        cursor.position = 1 << cursor.bits
+        cursor.served = 2
+        session = self.client.session
+        session['feed_cursor'] = cursor.to_session()
+        session.save()
+
+        response = self.client.post(
+            self.url, content_type='application/json',
+            data=json.dumps({'filters': {}})
+        )
+        self.assertIn("Next Home", response.json()['next_profile_html'])
+        self.assertEqual(self.client.session['feed_cursor']['served'], 1)
+
     def test_get_method_disallowed(self):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 405)
 
 
-class LikeProfileViewTest(TestCase):
+class NextProfilesBatchViewTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='viewer', password='testpass')
+        self.client.login(username='viewer', password='testpass')
+        self.profiles = [
+            Profile.objects.create(
+                user=User.objects.create_user(username=f'host{i}'),
+                location='FR', house_description=f'House {i}')
+            for i in range(4)
+        ]
+        for i, rating in enumerate([4, 5]):
+            Review.objects.create(
+                reviewer=User.objects.create_user(username=f'guest{i}'),
+                reviewee=self.profiles[0].user, rating=rating,
+                comment='Lovely stay')
+        self.url = reverse('next_profiles')
+
+        ttl_patch = mock.patch.object(candidate_index, 'ttl', 3600)
+        ttl_patch.start()
+        self.addCleanup(ttl_patch.stop)
+        self.addCleanup(candidate_index.invalidate)
+        candidate_index.rebuild()
+
+    def post(self, **data):
+        return self.client.post(
+            self.url, content_type='application/json',
+            data=json.dumps(data))
+
+    def test_returns_requested_number_of_cards(self):
+        cards = self.post(count=3).json()['cards']
+        self.assertEqual(len(cards), 3)
+        self.assertEqual(len({card['profile_id'] for card in cards}), 3)
+        for card in cards:
+            self.assertIn("Next Home", card['html'])
+
+    def test_card_shows_reviews_and_average(self):
+        cards = self.post(count=4).json()['cards']
+        card = next(card for card in cards
+                    if card['profile_id'] == self.profiles[0].id)
+        self.assertIn("4.5", card['html'])
+        self.assertIn("Lovely stay", card['html'])
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        candidate_index.candidates(self.user)  # load the viewer's responses
+        with CaptureQueriesContext(connection) as single:
+            self.post(count=1)
+        with CaptureQueriesContext(connection) as batch:
+            self.post(count=3)
+        self.assertEqual(len(batch), len(single))
+
+    def test_drained_feed_starts_new_pass(self):
+        first = self.post(count=3).json()['cards']
+        rest = self.post(count=3).json()['cards']
+        self.assertEqual(
+            sorted(card['profile_id'] for card in first + rest),
+            [profile.id for profile in self.profiles])
+        response = self.post(count=3).json()
+        self.assertEqual(len(response['cards']), 3)
+        self.assertIsNone(response['end_html'])
+
+    def test_empty_feed_returns_end_html(self):
+        for profile in self.profiles:
+            profile.is_visible = False
+            profile.save()
+        response = self.post(count=3).json()
+        self.assertEqual(response['cards'], [])
+        self.assertIn("No more profiles available", response['end_html'])
+
+    def test_committed_changes_update_the_built_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Profile.objects.create(
+                user=User.objects.create_user(username='newhost'),
+                location='FR', house_description='New house')
+            hidden = self.profiles[1]
+            hidden.is_visible = False
+            hidden.save()
+            MatchResponse.objects.create(
+                from_user=self.user, to_profile=self.profiles[2],
+                liked=True)
+
+        with mock.patch.object(candidate_index, 'rebuild') as rebuild:
+            cards = self.post(count=5).json()['cards']
+        rebuild.assert_not_called()
+        self.assertEqual(
+            sorted(card['profile_id'] for card in cards),
+            [self.profiles[0].id, self.profiles[3].id, added.id])
+
+    def test_response_made_through_another_worker_is_skipped(self):
+        candidate_index.candidates(self.user)  # load the viewer's responses
+        # Created without running the on_commit hooks, as if another
+        # worker process had handled the like
+        liked = self.profiles[0]
+        MatchResponse.objects.create(
+            from_user=self.user, to_profile=liked, liked=True)
+
+        cards = self.post(count=4).json()['cards']
+        self.assertNotIn(liked.id, [card['profile_id'] for card in cards])
+        self.assertEqual(len(cards), 3)
+        self.assertNotIn(liked.id, candidate_index.candidates(self.user))
+        self.assertIn(liked.id, candidate_index.candidates())
+
+    def test_invalid_count_rejected(self):
+        self.assertEqual(self.post(count='many').status_code, 400)
+
+    def test_get_method_disallowed(self):
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'cards': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'card-tests'},
+})
+class ProfileCardCacheTest(TestCase):
+    def setUp(self):
+        caches['cards'].clear()
+        self.addCleanup(caches['cards'].clear)
+        self.viewer = User.objects.create_user(username='viewer')
+        self.host = User.objects.create_user(username='host')
+        self.profile = Profile.objects.create(
+            user=self.host, location='FR', house_description='Old barn')
+
+        record_patch = mock.patch('profiles.cards.record_cache')
+        self.record_cache = record_patch.start()
+        self.addCleanup(record_patch.stop)
+
+    def fresh(self):
+        return Profile.objects.get(id=self.profile.id)
+
+    def hits(self):
+        return sum(
+            call.kwargs['hits'] for call in self.record_cache.call_args_list)
+
+    def test_cached_card_renders_without_queries(self):
+        render_card(self.fresh(), self.viewer)
+        self.record_cache.assert_called_once_with(hits=0, misses=1, saved=0)
+        profile = self.fresh()
+        with self.assertNumQueries(0):
+            html = render_card(profile, self.viewer)
+
+        self.assertIn('Old barn', html)
+        hit = self.record_cache.call_args.kwargs
+        self.assertEqual((hit['hits'], hit['misses']), (1, 0))
+        self.assertGreater(hit['saved'], 0)
+
+    def test_viewer_actions_are_rendered_outside_the_cache(self):
+        profile = self.fresh()
+        [member_html] = render_cards([profile], self.viewer)
+        [anonymous_html] = render_cards([profile], AnonymousUser())
+
+        self.assertIn(f"handleMatch('{profile.id}', true)", member_html)
+        self.assertNotIn(reverse('login'), member_html)
+        self.assertIn(reverse('login'), anonymous_html)
+        self.assertEqual(self.hits(), 1)
+
+    def test_profile_images_and_reviews_replace_the_version(self):
+        versions = [self.fresh().card_version]
+        render_card(self.fresh(), self.viewer)
+
+        self.profile.house_description = 'New barn'
+        self.profile.save(update_fields=['house_description'])
+        versions.append(self.fresh().card_version)
+        self.assertIn('New barn', render_card(self.fresh(), self.viewer))
+
+        HouseImage.objects.create(
+            profile=self.profile, image=generate_test_image_file())
+        versions.append(self.fresh().card_version)
+        self.assertNotIn(
+            'No images available', render_card(self.fresh(), self.viewer))
+
+        Review.objects.create(
+            reviewer=self.viewer, reviewee=self.host, rating=5,
+            comment='Spotless')
+        versions.append(self.fresh().card_version)
+        self.assertIn('Spotless', render_card(self.fresh(), self.viewer))
+
+        self.assertEqual(len(set(versions)), 4)
+        self.assertEqual(self.hits(), 0)
+
+    def test_pending_images_stay_off_uncached_cards(self):
+        HouseImage.objects.create(
+            profile=self.profile, status=HouseImage.PENDING)
+        self.assertIn(
+            'No images available', render_card(self.fresh(), self.viewer))
+
+
+class PageQueryCountTest(QueryBudgetMixin, TestCase):
+    """
+    Pins the queries of the pages that show house images, with several
+    liked profiles, images and reviews each, so per-row queries show up
+    as a changed count.
+    """
+
+    def setUp(self):
+        self.viewer = User.objects.create_user(
+            username='viewer', password='pass')
+        Profile.objects.create(user=self.viewer)
+        self.client.login(username='viewer', password='pass')
+        self.hosts = []
+        for i in range(3):
+            host = User.objects.create_user(username=f'host{i}')
+            profile = Profile.objects.create(user=host, location='FR')
+            for j in range(3):
+                HouseImage.objects.create(
+                    profile=profile, image=generate_test_image_file())
+                Review.objects.create(
+                    reviewer=User.objects.create_user(
+                        username=f'guest{i}{j}'),
+                    reviewee=host, rating=4, comment='Nice')
+            MatchResponse.objects.create(
+                from_user=self.viewer, to_profile=profile, liked=True)
+            MatchResponse.objects.create(
+                from_user=host, to_profile=self.viewer.profile, liked=True)
+            self.hosts.append(host)
+        HouseImage.objects.create(
+            profile=self.viewer.profile, image=generate_test_image_file())
+        HouseImage.objects.create(
+            profile=self.hosts[0].profile, status=HouseImage.PENDING)
+
+    def test_travel_log_queries(self):
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('travel_log'))
+        self.assertContains(response, 'alt="Profile image"', count=3)
+
+    def test_view_profile_queries(self):
+        with self.assertNumQueries(13):
+            response = self.client.get(
+                reverse('view_profile', args=[self.hosts[0].id]))
+        self.assertContains(response, 'carousel-item', count=3)
+        self.assertContains(response, 'guest02')
+
+    def test_own_profile_and_edit_queries(self):
+        with self.assertNumQueries(7):
+            self.client.get(reverse('profiles'))
+        with self.assertNumQueries(6):
+            self.client.get(reverse('edit_profile'))
+
+    def test_card_queries_do_not_grow_with_images(self):
+        profile = Profile.objects.get(user=self.hosts[1])
+        with self.assertNumQueries(2):
+            html = render_card(profile, self.viewer)
+        self.assertEqual(html.count('class="house-image-slide'), 3)
+
+    def test_main_image_filter_reads_prefetched_list(self):
+        images = list(HouseImage.objects.ready())
+        template = Template(
+            '{% load image_extras %}'
+            '{% with main=images|get_main_image %}{{ main.id }}{% endwith %}')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                template.render(Context({'images': images})),
+                str(images[0].id))
+            self.assertEqual(template.render(Context({'images': []})), '')
+
+
+class LikeProfileViewTest(QueryBudgetMixin, TestCase):
     def setUp(self):
-        self.client = Client()
         self.user1 = User.objects.create_user(
             username='viewer', password='testpass', email='viewer@example.com')
         self.user2 = User.objects.create_user(
@@ -660,13 +1687,38 @@ class LikeProfileViewTest(TestCase):
         data = response.json()
         self.assertIn('message', data)
         self.assertIn('You liked', data['message'])
+        # The next card comes from the client's buffer, not from /like/
+        self.assertNotIn('next_profile_html', data)
 
         match = MatchResponse.objects.get(
             from_user=self.user1, to_profile=self.profile2)
         self.assertTrue(match.liked)
 
+    def test_like_profile_mutual_match_queues_emails(self):
+        MatchResponse.objects.create(
+            from_user=self.user2,
+            to_profile=Profile.objects.create(user=self.user1),
+            liked=True)
+        self.client.login(username='viewer', password='testpass')
+        response = self.client.post(
+            self.url,
+            data=json.dumps({'profile_id': self.profile2.id}),
+            content_type='application/json'
+        )
+
+        self.assertTrue(response.json()['match'])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(OutboundEmail.objects.values_list('to', flat=True)),
+            [['other@example.com'], ['viewer@example.com']])
 
-class UnlikeProfileViewTest(TestCase):
+        call_command('send_queued_mail', stdout=StringIO())
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ['other@example.com', 'viewer@example.com'])
+
+
+class UnlikeProfileViewTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
             username='testuser', password='testpass')
@@ -707,8 +1759,21 @@ class UnlikeProfileViewTest(TestCase):
         messages = list(get_messages(response.wsgi_request))
         self.assertTrue(any("unliked" in str(m) for m in messages))
 
+    def test_unlike_profile_clears_mutual_match(self):
+        MatchResponse.objects.create(
+            from_user=self.other_user,
+            to_profile=Profile.objects.create(user=self.user),
+            liked=True)
+        self.assertTrue(
+            MatchResponse.objects.is_match(self.user, self.other_user))
+
+        self.client.login(username='testuser', password='testpass')
+        self.client.post(self.url)
+        self.assertFalse(
+            MatchResponse.objects.is_match(self.other_user, self.user))
+
 
-class TravelLogMutualMatchTest(TestCase):
+class TravelLogMutualMatchTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.viewer = User.objects.create_user(
             username='viewer', password='pass')
@@ -754,10 +1819,27 @@ class TravelLogMutualMatchTest(TestCase):
 
         liked_profiles = response.context['liked_profiles']
         self.assertEqual(len(liked_profiles), 1)
-        self.assertTrue(getattr(liked_profiles[0], 'is_mutual', False))
+        self.assertTrue(liked_profiles[0].mutual)
+        self.assertEqual(response.context['mutual_matches_count'], 1)
+
+    def test_travel_log_query_count_does_not_grow_with_likes(self):
+        self.client.login(username='viewer', password='pass')
+        with CaptureQueriesContext(connection) as one_like:
+            self.client.get(reverse('travel_log'))
+
+        for i in range(5):
+            MatchResponse.objects.create(
+                from_user=self.viewer,
+                to_profile=Profile.objects.create(
+                    user=User.objects.create_user(username=f'host{i}')),
+                liked=True)
+        with CaptureQueriesContext(connection) as six_likes:
+            response = self.client.get(reverse('travel_log'))
+        self.assertEqual(len(response.context['liked_profiles']), 6)
+        self.assertEqual(len(six_likes), len(one_like))
 
 
-class ViewProfileViewTest(TestCase):
+class ViewProfileViewTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.user1 = User.objects.create_user(
             username='user1', password='pass123', email='user1@example.com')
@@ -800,6 +1882,48 @@ class ViewProfileViewTest(TestCase):
         self.assertIn('booking_form', response.context)
         self.assertIn('review_form', response.context)
 
+    def test_view_profile_gallery_uses_variants(self):
+        image = HouseImage.objects.create(
+            profile=self.profile2, image=generate_photo(800, 600))
+        with image.image.open('rb') as source:
+            add_variants(image, source)
+        image.save()
+        self.client.login(username='user1', password='pass123')
+
+        response = self.client.get(self.url)
+
+        self.assertContains(response, image.srcset('webp'))
+        self.assertContains(
+            response, 'sizes="(max-width: 768px) 100vw, 640px"')
+        self.assertNotContains(response, f'src="{image.image.url}"')
+
+    def test_view_profile_renders_newest_page_of_messages(self):
+        for i in range(PAGE_SIZE + 10):
+            Message.objects.create(
+                sender=self.user1, recipient=self.user2,
+                content=f'Message {i}')
+        self.client.login(username='user1', password='pass123')
+
+        response = self.client.get(self.url)
+
+        shown = response.context['messages_between']
+        self.assertEqual(len(shown), PAGE_SIZE)
+        self.assertEqual(shown[-1].content, f'Message {PAGE_SIZE + 9}')
+        self.assertIsNotNone(response.context['history_cursor'])
+        self.assertContains(response, reverse(
+            'message_history', args=[response.context['conversation'].id]))
+        self.assertNotContains(response, 'Message 9<')
+
+    def test_view_profile_marks_conversation_read(self):
+        message = Message.objects.create(
+            sender=self.user2, recipient=self.user1, content='Hi')
+        self.client.login(username='user1', password='pass123')
+
+        self.client.get(self.url)
+
+        participant = message.conversation.participants.get(user=self.user1)
+        self.assertEqual(participant.unread_count, 0)
+
 
 class BookingUtilsTest(TestCase):
     def setUp(self):
@@ -831,9 +1955,8 @@ class BookingUtilsTest(TestCase):
         self.assertEqual(latest, later)
 
 
-class HandleBookingRequestTest(TestCase):
+class HandleBookingRequestTest(QueryBudgetMixin, TestCase):
     def setUp(self):
-        self.client = Client()
 
         self.user1 = User.objects.create_user(
             username='user1', password='pass1', email='u1@example.com')
@@ -873,8 +1996,35 @@ class HandleBookingRequestTest(TestCase):
             Notification.objects.filter(user=self.user2).exists()
         )
 
+    def test_booking_request_outside_availability_rejected(self):
+        self.profile2.available_dates = '2025-08-01 to 2025-08-31'
+        self.profile2.save()
+
+        self.client.post(self.url, {
+            'request_booking': '1',
+            'requested_dates': '2025-08-25 to 2025-09-05',
+        })
+
+        self.assertFalse(BookingRequest.objects.filter(
+            start_date=date(2025, 8, 25)).exists())
 
-class HandleBookingResponseTest(TestCase):
+    def test_booking_request_overlapping_accepted_rejected(self):
+        user3 = User.objects.create_user(username='user3', password='x')
+        BookingRequest.objects.create(
+            sender=user3, recipient=self.user2,
+            requested_dates='2025-08-01 to 2025-08-12', status='accepted')
+
+        response = self.client.post(self.url, {
+            'request_booking': '1',
+            'requested_dates': '2025-08-10 to 2025-08-15',
+        }, follow=True)
+
+        self.assertFalse(BookingRequest.objects.filter(
+            start_date=date(2025, 8, 10)).exists())
+        self.assertContains(response, 'already has a confirmed exchange')
+
+
+class HandleBookingResponseTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.sender = User.objects.create_user(
             username='alice', password='pass')
@@ -912,12 +2062,51 @@ class HandleBookingResponseTest(TestCase):
         self.assertEqual(self.booking.status, 'amended')
         self.assertEqual(
             self.booking.requested_dates, '2025-08-15 to 2025-08-20')
+        self.assertEqual(self.booking.start_date, date(2025, 8, 15))
         self.assertRedirects(response, self.url)
 
+    def test_handle_booking_response_amend_invalid_dates(self):
+        self.client.login(username='bob', password='pass')
+        self.client.post(self.url, {
+            'respond_booking': 'amended',
+            'amended_dates': 'next week',
+        })
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'pending')
+        self.assertEqual(
+            self.booking.requested_dates, '2025-08-01 to 2025-08-10')
+
+    def test_handle_booking_response_from_stale_page(self):
+        self.booking.transition('amended', self.sender)
+        self.client.login(username='bob', password='pass')
+
+        response = self.client.post(self.url, {
+            'respond_booking': 'denied',
+            'booking_version': '0',
+        }, follow=True)
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'amended')
+        self.assertContains(response, 'changed this booking')
+        self.assertFalse(Notification.objects.filter(
+            user=self.sender).exists())
+
+    def test_handle_booking_response_accept_double_booking(self):
+        carol = User.objects.create_user(username='carol', password='pass')
+        BookingRequest.objects.create(
+            sender=carol, recipient=self.recipient,
+            requested_dates='2025-08-08 to 2025-08-14', status='accepted')
+        self.client.login(username='bob', password='pass')
+
+        self.client.post(self.url, {'respond_booking': 'accepted'})
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'pending')
+
 
-class HandleBookingCancelTest(TestCase):
+class HandleBookingCancelTest(QueryBudgetMixin, TestCase):
     def setUp(self):
-        self.client = Client()
         self.user1 = User.objects.create_user(
             username='user1', password='pass1', email='user1@example.com')
         self.user2 = User.objects.create_user(
@@ -939,10 +2128,9 @@ class HandleBookingCancelTest(TestCase):
             'cancel_booking': '1',
         }, follow=True)
 
-        # Booking is deleted
-        self.assertFalse(
-            BookingRequest.objects.filter(id=self.booking.id).exists()
-        )
+        # Booking is kept as cancelled
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'cancelled')
 
         # Notification is created
         self.assertTrue(
@@ -1015,9 +2203,8 @@ class UserIsMatchedTest(TestCase):
         self.assertFalse(result)
 
 
-class LogoutAnd404ViewTests(TestCase):
+class LogoutAnd404ViewTests(QueryBudgetMixin, TestCase):
     def setUp(self):
-        self.client = Client()
         self.user = User.objects.create_user(
             username='logoutuser', password='pass123'
         )
@@ -1045,7 +2232,275 @@ class LogoutAnd404ViewTests(TestCase):
         self.assertTemplateUsed(response, '404.html')
 
 
-class AboutPageTests(TestCase):
+class RequestMetricsTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='host')
+        Profile.objects.create(
+            user=self.host, location='FR', house_description='Barn')
+
+    def get_home_metrics(self):
+        with self.assertLogs('codestar.metrics', 'INFO') as logs:
+            response = self.client.get(reverse('home'))
+        [line] = logs.output
+        return response, json.loads(line.split(':', 2)[2])
+
+    @override_settings(
+        REQUEST_METRICS_SAMPLE_RATE=1, REQUEST_METRICS_SERVER_TIMING=True)
+    def test_sampled_request_reports_queries_and_timings(self):
+        response, metrics = self.get_home_metrics()
+
+        self.assertEqual(metrics['view'], 'home')
+        self.assertEqual(metrics['status'], 200)
+        self.assertGreater(metrics['queries'], 0)
+        self.assertGreater(metrics['template_ms'], 0)
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{metrics["queries"]} queries"', timing)
+        self.assertRegex(timing, r'tpl;dur=[\d.]+')
+
+    @override_settings(
+        REQUEST_METRICS_SAMPLE_RATE=1,
+        REQUEST_METRICS_SERVER_TIMING=False,
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+            'cards': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'metrics-tests'},
+        })
+    def test_cache_hits_are_counted(self):
+        caches['cards'].clear()
+        self.addCleanup(caches['cards'].clear)
+        response, first = self.get_home_metrics()
+        _, second = self.get_home_metrics()
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual((first['cache_hits'], first['cache_misses']), (0, 1))
+        self.assertEqual(
+            (first['cache_hit_ratio'], first['cache_saved_ms']), (0, 0))
+        self.assertEqual(
+            (second['cache_hits'], second['cache_misses']), (1, 0))
+        self.assertEqual(second['cache_hit_ratio'], 1)
+        self.assertGreater(second['cache_saved_ms'], 0)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1)
+    async def test_async_request_is_measured(self):
+        async def get_response(request):
+            await sync_to_async(list)(User.objects.all())
+            return HttpResponse()
+        middleware = RequestMetricsMiddleware(get_response)
+
+        with self.assertLogs('codestar.metrics', 'INFO') as logs:
+            await middleware(RequestFactory().get('/'))
+        [line] = logs.output
+        metrics = json.loads(line.split(':', 2)[2])
+
+        self.assertEqual(metrics['queries'], 1)
+
+    def test_middleware_runs_natively_in_both_modes(self):
+        async def get_response(request):
+            pass
+
+        self.assertTrue(iscoroutinefunction(
+            RequestMetricsMiddleware(get_response)))
+        self.assertFalse(iscoroutinefunction(
+            RequestMetricsMiddleware(lambda request: None)))
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_unsampled_request_is_not_measured(self):
+        with self.assertNoLogs('codestar.metrics'):
+            response = self.client.get(reverse('home'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_budget_client_fails_views_over_budget(self):
+        with mock.patch.dict(QUERY_BUDGETS, {'home': 1}):
+            with self.assertRaisesMessage(
+                    AssertionError, 'home ran'):
+                self.client.get(reverse('home'))
+
+
+class SyntheticDataTest(TestCase):
+    def generate(self, **kwargs):
+        options = {
+            'users': 30, 'likes_per_user': 6, 'mutual_rate': 0.5,
+            'images_per_profile': 1, 'conversation_rate': 1,
+            'booking_rate': 1, 'review_rate': 1, 'seed': 3,
+        }
+        options.update(kwargs)
+        return synthetic.generate(**options)
+
+    def test_generate_fills_denormalised_columns(self):
+        counts = self.generate()
+
+        self.assertEqual(counts['User'], 30)
+        self.assertEqual(Profile.objects.count(), 30)
+        for profile in Profile.objects.all():
+            flags = {
+                field: getattr(profile, field) for field in CRITERIA_FIELDS}
+            self.assertEqual(profile.criteria, criteria_mask(flags))
+            if profile.available_dates:
+                self.assertEqual(
+                    (profile.available_from, profile.available_to),
+                    parse_date_range(profile.available_dates))
+        for match in MatchResponse.objects.select_related('to_profile'):
+            self.assertEqual(match.mutual, MatchResponse.objects.filter(
+                from_user_id=match.to_profile.user_id,
+                to_profile__user_id=match.from_user_id).exists())
+        self.assertTrue(MatchResponse.objects.filter(mutual=True).exists())
+        self.assertEqual(refresh_review_stats(list(
+            User.objects.values_list('id', flat=True))), 0)
+        self.assertEqual(
+            HouseImage.objects.filter(
+                image__startswith=synthetic.PLACEHOLDER_DIR).count(),
+            counts['HouseImage'])
+
+    def test_conversations_match_their_messages(self):
+        self.generate()
+
+        conversations = Conversation.objects.prefetch_related('participants')
+        self.assertTrue(conversations)
+        for conversation in conversations:
+            latest = conversation.messages.latest('timestamp', 'id')
+            self.assertEqual(conversation.last_message, latest)
+            for participant in conversation.participants.all():
+                self.assertEqual(
+                    participant.last_message_at, latest.timestamp)
+                if participant.user_id == latest.sender_id:
+                    self.assertEqual(participant.unread_count, 0)
+
+    def test_clear_removes_users_and_placeholders(self):
+        self.generate(users=5)
+        self.assertTrue(default_storage.listdir(
+            synthetic.PLACEHOLDER_DIR)[1])
+
+        self.assertEqual(synthetic.clear(), 5)
+
+        self.assertFalse(synthetic.existing_users().exists())
+        self.assertFalse(HouseImage.objects.exists())
+        self.assertFalse(FileDeletion.objects.exists())
+        self.assertFalse(default_storage.listdir(
+            synthetic.PLACEHOLDER_DIR)[1])
+
+    def test_command_refuses_to_add_to_existing_users(self):
+        self.generate(users=5, images_per_profile=0)
+        with self.assertRaisesMessage(CommandError, '--clear'):
+            call_command(
+                'generate_synthetic_data', '--users=5', stdout=StringIO())
+
+    def test_run_benchmarks_saves_results_per_endpoint(self):
+        self.generate(users=10, images_per_profile=0)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = os.path.join(directory, 'run.json')
+
+        call_command(
+            'run_benchmarks', '--virtual-users=1', '--iterations=2',
+            '--warmup=0', f'--output={output}', stdout=StringIO())
+        out = StringIO()
+        call_command(
+            'run_benchmarks', '--virtual-users=1', '--iterations=1',
+            f'--output={output}', f'--compare={output}', stdout=out)
+
+        with open(output) as results_file:
+            results = json.load(results_file)
+        self.assertEqual(set(results['endpoints']), set(loadtest.ENDPOINTS))
+        for endpoint, stats in results['endpoints'].items():
+            self.assertEqual(stats['errors'], 0, endpoint)
+            self.assertGreater(stats['queries_max'], 0)
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertEqual(results['endpoints']['next_profile']['requests'], 3)
+        self.assertIn('Compared with the run', out.getvalue())
+
+    def test_percentiles_interpolate_between_samples(self):
+        self.assertEqual(
+            loadtest.percentiles([float(ms) for ms in range(1, 101)]),
+            [50.5, 95.05, 99.01])
+        self.assertEqual(loadtest.percentiles([7.0]), [7.0, 7.0, 7.0])
+
+
+class LoadSnapshotTest(TestCase):
+    path = settings.BASE_DIR / 'latest.dump'
+
+    def dump_rows(self, table):
+        with open(self.path, 'rb') as dump:
+            archive = snapshot.DumpArchive(dump)
+            entry = archive.tables[table]
+            return [
+                dict(zip(entry.columns, row))
+                for row, _ in archive.rows(entry)]
+
+    def load(self, **kwargs):
+        with open(self.path, 'rb') as dump:
+            return snapshot.load(dump, **kwargs)
+
+    def test_loads_every_row_and_rebuilds_derived_columns(self):
+        self.load()
+
+        for model in (User, Profile, HouseImage, MatchResponse, Message,
+                      BookingRequest, Notification, Review):
+            self.assertEqual(
+                model.objects.count(),
+                len(self.dump_rows(model._meta.db_table)),
+                model.__name__)
+        for profile in Profile.objects.all():
+            flags = {
+                field: getattr(profile, field) for field in CRITERIA_FIELDS}
+            self.assertEqual(profile.criteria, criteria_mask(flags))
+            self.assertEqual(
+                (profile.available_from, profile.available_to),
+                parse_date_range(profile.available_dates) or (None, None))
+        self.assertEqual(MatchResponse.objects.refresh_mutual(), (0, 0))
+        self.assertEqual(refresh_review_stats(list(
+            User.objects.values_list('id', flat=True))), 0)
+        for conversation in Conversation.objects.all():
+            self.assertEqual(
+                conversation.last_message,
+                conversation.messages.latest('timestamp', 'id'))
+            self.assertEqual(conversation.participants.count(), 2)
+
+    def test_indexes_and_sequences_are_restored(self):
+        self.load()
+
+        with connection.cursor() as cursor:
+            indexes = [
+                index.name for index in Profile._meta.indexes
+                if index.name in connection.introspection.get_constraints(
+                    cursor, Profile._meta.db_table)]
+        self.assertEqual(len(indexes), len(Profile._meta.indexes))
+        loaded = User.objects.order_by('-id').first()
+        self.assertGreater(
+            User.objects.create(username='after-load').id, loaded.id)
+
+    def test_anonymize_replaces_usernames_in_the_stream(self):
+        usernames = {
+            row['username'] for row in self.dump_rows('auth_user')}
+        self.load(anonymize=True)
+
+        for user in User.objects.all():
+            self.assertEqual(user.username, f'user{user.id}')
+            self.assertIn(user.email, ('', f'user{user.id}@example.com'))
+        for message in Notification.objects.values_list(
+                'message', flat=True):
+            for username in usernames:
+                self.assertNotIn(f'with {username}!', message)
+
+    def test_refuses_database_with_rows(self):
+        User.objects.create(username='existing')
+        with self.assertRaisesMessage(CommandError, 'freshly migrated'):
+            call_command('load_snapshot', stdout=StringIO())
+
+    def test_rejects_other_files(self):
+        with self.assertRaisesMessage(
+                snapshot.SnapshotError, 'custom format'):
+            snapshot.DumpArchive(io.BytesIO(b'-- plain SQL dump'))
+
+    def test_parse_copy_line_unescapes_values(self):
+        self.assertEqual(
+            snapshot.parse_copy_line(
+                '1\ttab\\there\t\\N\ta\\\\N\tline\\nbreak\t\\101'),
+            ['1', 'tab\there', None, 'a\\N', 'line\nbreak', 'A'])
+
+
+class AboutPageTests(QueryBudgetMixin, TestCase):
     def test_about_page_get(self):
         """GET request should return 200 and use the correct template"""
         response = self.client.get(reverse('about'))
@@ -1062,6 +2517,8 @@ class AboutPageTests(TestCase):
             'message': 'Test message content.'
         }, follow=True)
         self.assertRedirects(response, reverse('about'))
+        self.assertEqual(len(mail.outbox), 0)  # queued, not sent inline
+        call_command('send_queued_mail', stdout=StringIO())
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn("Your message has been sent!", response.content.decode())
 
@@ -1077,3 +2534,45 @@ class AboutPageTests(TestCase):
         self.assertContains(
             response, "Please correct the errors below and try again.")
         self.assertEqual(len(mail.outbox), 0)
+
+
+class ProfileQueryPlanTest(QueryBudgetMixin, QueryPlanMixin, TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username='user1', password='pass123', email='user1@example.com')
+        self.user2 = User.objects.create_user(
+            username='user2', password='pass456', email='user2@example.com')
+        self.profile1 = Profile.objects.create(user=self.user1, location='US')
+        self.profile2 = Profile.objects.create(user=self.user2, location='FR')
+        MatchResponse.objects.create(
+            from_user=self.user1, to_profile=self.profile2, liked=True)
+        MatchResponse.objects.create(
+            from_user=self.user2, to_profile=self.profile1, liked=True)
+        Message.objects.create(
+            sender=self.user1, recipient=self.user2, content='Hi')
+        Message.objects.create(
+            sender=self.user2, recipient=self.user1, content='Hello')
+        BookingRequest.objects.create(
+            sender=self.user1, recipient=self.user2,
+            message='Can I stay?')
+        self.client.login(username='user1', password='pass123')
+
+    def test_visible_profiles_by_location_use_index(self):
+        self.assertIndexed(
+            Profile.objects.filter(is_visible=True, location='FR'))
+
+    def test_is_match_uses_index(self):
+        self.assertIndexed(MatchResponse.objects.filter(
+            from_user=self.user1, to_profile__user=self.user2, mutual=True))
+
+    def test_view_profile_queries_use_indexes(self):
+        response = self.assertViewQueriesIndexed(
+            lambda: self.client.get(
+                reverse('view_profile', args=[self.user2.id])))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['messages_between']), 2)
+
+    def test_travel_log_queries_use_indexes(self):
+        response = self.assertViewQueriesIndexed(
+            lambda: self.client.get(reverse('travel_log')))
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,172 @@
+"""
+Background upload of house images.
+
+upload_images() writes each new file to the staging storage (the
+database, see profiles/storage.py) and saves its HouseImage as pending,
+so the request returns without waiting on Cloudinary. Once the
+transaction commits, schedule_uploads() hands the images to a thread
+pool of settings.IMAGE_UPLOAD_WORKERS threads that push the files to the
+default storage, write their resized variants and mark the images ready.
+
+A worker claims an image with a lease (HouseImage.claimed_until) in one
+UPDATE, uploads it with no transaction open, and records the result in a
+second short transaction, so no connection or row lock is held while
+Cloudinary is busy. Pending images are only shown to their owner. Images
+left behind, such as by a restart, are claimed again once their lease
+runs out by the publish_house_images command, which the Procfile's worker
+process runs in a loop.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cleanup import queue_deletions
+from .models import HouseImage
+from .variants import add_variants
+
+logger = logging.getLogger(__name__)
+
+# How long a worker may take over one image before others take it over
+CLAIM_SECONDS = 300
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_staging_storage():
+    return storages['staging']
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_UPLOAD_WORKERS,
+                thread_name_prefix='image-upload')
+        return _executor
+
+
+def stage_image(image, upload):
+    """
+    Stores an uploaded file in the staging storage and marks the unsaved
+    HouseImage as pending.
+    """
+    name = HouseImage._meta.get_field('image').generate_filename(
+        image, upload.name)
+    image.staged_name = get_staging_storage().save(name, upload)
+    image.image = ''
+    image.status = HouseImage.PENDING
+
+
+def schedule_uploads(image_ids):
+    """Uploads the images in the background once the transaction commits."""
+    def submit():
+        executor = get_executor()
+        for image_id in image_ids:
+            executor.submit(_publish_and_close, image_id)
+    transaction.on_commit(submit)
+
+
+def claimable_images():
+    """Pending images no worker holds a live claim on."""
+    return HouseImage.objects.filter(status=HouseImage.PENDING).filter(
+        Q(claimed_until__isnull=True) | Q(claimed_until__lt=timezone.now()))
+
+
+def claim_image(image_id):
+    """
+    Takes a lease on a pending image in a single UPDATE. Returns the image
+    with its claimed_until set, or None if it is not pending or another
+    worker holds it.
+    """
+    claimed_until = timezone.now() + timedelta(seconds=CLAIM_SECONDS)
+    if not claimable_images().filter(id=image_id).update(
+            claimed_until=claimed_until):
+        return None
+    return HouseImage.objects.filter(
+        id=image_id, claimed_until=claimed_until).first()
+
+
+def publish_image(image_id):
+    """
+    Pushes a pending image from the staging storage to the default
+    storage. Returns its new status, or None if the image is no longer
+    pending, another worker holds it or its staged file cannot be read
+    yet.
+    """
+    image = claim_image(image_id)
+    if image is None:
+        return None
+
+    staging = get_staging_storage()
+    staged_name = image.staged_name
+    try:
+        with staging.open(staged_name) as staged:
+            image.image.save(
+                os.path.basename(staged_name), File(staged), save=False)
+            staged.seek(0)
+            add_variants(image, staged)
+    except FileNotFoundError as exc:
+        # Not a reason to give up on the image: it stays pending and is
+        # tried again once the claim runs out
+        logger.warning(
+            f"Staged file of house image {image_id} missing: {exc}")
+        return None
+    except Exception as exc:
+        logger.warning(f"Could not upload house image {image_id}: {exc}")
+        image.status = HouseImage.FAILED
+    else:
+        image.status = HouseImage.READY
+        image.staged_name = ''
+
+    with transaction.atomic():
+        # Only record the upload if the image is still ours: it may have
+        # been deleted, or taken over once the claim ran out
+        if not HouseImage.objects.select_for_update().filter(
+                id=image_id, status=HouseImage.PENDING,
+                claimed_until=image.claimed_until).exists():
+            if image.status == HouseImage.READY:
+                queue_deletions(image.stored_files())
+            return None
+        image.claimed_until = None
+        image.save(update_fields=[
+            'image', 'status', 'staged_name', 'variants', 'claimed_until'])
+
+    if image.status == HouseImage.READY:
+        staging.delete(staged_name)
+    return image.status
+
+
+def publish_images(image_ids, workers=None):
+    """
+    Uploads the pending images with up to workers threads and waits for
+    them. Returns the number that became ready and the number that failed.
+    """
+    workers = workers or settings.IMAGE_UPLOAD_WORKERS
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        statuses = list(executor.map(_publish_and_close, image_ids))
+    return (
+        statuses.count(HouseImage.READY),
+        statuses.count(HouseImage.FAILED),
+    )
+
+
+def _publish_and_close(image_id):
+    # Pool threads outlive requests, so they manage their own connection
+    close_old_connections()
+    try:
+        return publish_image(image_id)
+    except Exception:
+        logger.exception(f"Uploading house image {image_id} failed")
+    finally:
+        connection.close()
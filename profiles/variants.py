@@ -0,0 +1,98 @@
+"""
+Resized and re-encoded copies of house images.
+
+An original upload can be a couple of megabytes while a card shows it in
+a box a few hundred pixels wide. When an image is published (see
+profiles/uploads.py) a copy is written for each of VARIANT_WIDTHS in each
+format Pillow can encode, and recorded in HouseImage.variants. The
+responsive_image template tag turns the records into srcset attributes
+so browsers download only the size and format they need.
+"""
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (320, 640, 1024)
+
+# Format -> (Pillow format, file extension, MIME type, save options),
+# in the order browsers should prefer them
+FORMATS = {
+    'avif': ('AVIF', 'avif', 'image/avif', {'quality': 50}),
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 75, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {
+        'quality': 80, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_formats():
+    """The formats of FORMATS this Pillow build can write."""
+    return [
+        name for name in FORMATS
+        if name == 'jpeg' or features.check(name)
+    ]
+
+
+def generate_variants(source, name, storage):
+    """
+    Writes the variants of the image file source to storage, named after
+    name, the original's name in that storage. Returns one record per
+    variant, narrowest first.
+    """
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGB')
+
+    # Never upscale: an image narrower than every width gets one variant
+    # at its own width
+    widths = [
+        width for width in VARIANT_WIDTHS if width < original.width
+    ] or [original.width]
+    stem = os.path.splitext(os.path.basename(name))[0]
+    directory = os.path.join(os.path.dirname(name), 'variants')
+
+    records = []
+    for width in widths:
+        height = round(original.height * width / original.width)
+        resized = original.resize(
+            (width, height), Image.LANCZOS, reducing_gap=3.0)
+        for format_name in variant_formats():
+            pil_format, extension, _, options = FORMATS[format_name]
+            image = resized
+            if format_name == 'jpeg' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, **options)
+            saved = storage.save(
+                os.path.join(directory, f'{stem}-{width}.{extension}'),
+                ContentFile(buffer.getvalue()))
+            records.append({
+                'format': format_name,
+                'width': width,
+                'height': height,
+                'name': saved,
+                'size': buffer.tell(),
+            })
+    return records
+
+
+def add_variants(image, source):
+    """
+    Generates and records the variants of a HouseImage from source, an
+    open copy of its file. Failures are logged and leave the image with
+    no variants, in which case pages fall back to the original.
+    """
+    try:
+        image.variants = generate_variants(
+            source, image.image.name, image.image.storage)
+    except Exception as exc:
+        logger.warning(
+            f"Could not create variants of house image {image.id}: {exc}")
+        image.variants = []
+    return image.variants
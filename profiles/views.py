@@ -1,6 +1,9 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .models import Profile, HouseImage, MatchResponse
+from .models import Profile, HouseImage, MatchResponse, parse_date_range
+from .feed import candidate_index, FeedCursor
+from .cards import ready_images, render_card, render_cards
+from .uploads import schedule_uploads, stage_image
 from .forms import (
     CustomUserCreationForm,
     ProfileForm,
@@ -12,20 +15,19 @@ from .forms import (
 from django.contrib.auth import login, logout, authenticate
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponse, HttpResponseRedirect
-from cloudinary.uploader import destroy
-from django.template.loader import render_to_string
 import json
+from operator import attrgetter
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Q, Avg
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from messaging.forms import MessageForm, BookingRequestForm
-from messaging.models import Message, BookingRequest
-from django.core.mail import send_mail
+from messaging.history import encode_cursor, get_history_page
+from messaging.models import (
+    BookingConflict, BookingRequest, Conversation, InvalidTransition)
+from notifications.outbox import queue_mail
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils.timezone import now
-from datetime import datetime
-import logging
-import random
 from django.urls import reverse
 from notifications.models import Notification
 from reviews.forms import ReviewForm
@@ -41,15 +43,14 @@ def profile_view(request):
     profile, created = Profile.objects.get_or_create(user=request.user)
 
     house_images = profile.house_images.all()
-    reviews = Review.objects.filter(reviewee=request.user)
-    average_rating_val = reviews.aggregate(avg=Avg('rating'))['avg']
-    average_rating = float(average_rating_val) if average_rating_val else None
+    reviews = Review.objects.filter(
+        reviewee=request.user).select_related('reviewer')
     # Pass profile object to the template
     return render(request, 'profiles/profile.html', {
         'profile': profile,
         'house_images': house_images,
         'reviews': reviews,
-        'average_rating': round(average_rating, 1) if average_rating else None,
+        'average_rating': profile.average_rating,
         })
 
 
@@ -91,6 +92,7 @@ def edit_profile(request):
         'profile_form': profile_form,
         'formset': formset,  # for image modal only
         'profile': profile,
+        'house_images': list(profile.house_images.all()),
     })
 
 
@@ -109,25 +111,22 @@ def upload_images(request):
         if formset.is_valid():
             new_images = []
 
-            for form in formset:
-                image_file = form.cleaned_data.get('image')
-                if image_file:
-                    instance = form.save(commit=False)
-                    instance.profile = profile
-                    try:
+            # Files are staged locally and pushed to Cloudinary in the
+            # background, so the request does not wait on the uploads
+            with transaction.atomic():
+                for form in formset:
+                    image_file = form.cleaned_data.get('image')
+                    if image_file:
+                        instance = form.save(commit=False)
+                        instance.profile = profile
+                        stage_image(instance, image_file)
                         instance.save()
                         new_images.append(instance)
-                    except Exception as e:
-                        print("Upload failed:", e)
-                        messages.error(request, f"Image upload failed: {e}")
-                        return render(request, 'profiles/edit_profile.html', {
-                            'user_form': UserForm(instance=request.user),
-                            'profile_form': ProfileForm(instance=profile),
-                            'formset': formset,
-                            'profile': profile,
-                        })
-
-            messages.success(request, "Images updated successfully.")
+                schedule_uploads([image.id for image in new_images])
+
+            messages.success(
+                request, "Images received. They will appear on your "
+                "profile once they finish uploading.")
             return redirect('edit_profile')
 
         else:
@@ -137,6 +136,7 @@ def upload_images(request):
                 'profile_form': ProfileForm(instance=profile),
                 'formset': formset,
                 'profile': profile,
+                'house_images': list(profile.house_images.all()),
             })
 
     return redirect('edit_profile')
@@ -177,173 +177,137 @@ def delete_image(request, image_id):
         return JsonResponse({"error": "Forbidden"}, status=403)
 
     if request.method == "POST":
-        public_id = image.image.name.rsplit('.', 1)[0]
-        print(f"Deleting Cloudinary image: public_id={public_id}")
-        try:
-            destroy(public_id)
-        except Exception as e:
-            print(f"Error deleting image from Cloudinary: {e}")
-
+        # The files are queued for deletion by a post_delete signal
         image.delete()
         return HttpResponse(status=204)  # ✅ No content
 
     return JsonResponse({"error": "Invalid request"}, status=400)
 
 
-def home(request):
-    form = SearchForm(request.GET or None)
-    profiles = Profile.objects.filter(is_visible=True)
-
-    # Get list of profiles the user has already responded to
-    responded_ids = []
-    if request.user.is_authenticated:
-        responded_ids = MatchResponse.objects.filter(
-            from_user=request.user
-        ).values_list('to_profile_id', flat=True)
-        profiles = profiles.exclude(user=request.user)
-    else:
-        # If not authenticated,
-        # still try to exclude anonymous user profile if any
-        profiles = profiles.exclude(user__isnull=True)
+# Largest number of cards next_profiles renders in one request
+MAX_CARD_BATCH = 10
 
-    profiles = profiles.exclude(id__in=responded_ids)
+NO_MORE_PROFILES_HTML = (
+    "<p class='text-center mt-5'>🎉 "
+    "No more profiles available!</p>"
+)
+ONLY_PROFILE_SEEN_HTML = (
+    "<div class='alert alert-info text-center mt-4'>"
+    "🎉 You've already seen the only matching profile. "
+    "Try changing your filters to see more!</div>"
+)
 
-    # Apply house criteria filters from form
-    if form.is_valid():
-        for field, value in form.cleaned_data.items():
-            if value and field != "location":
-                profiles = profiles.filter(**{field: True})
-        if form.cleaned_data.get("location"):
-            profiles = profiles.filter(location=form.cleaned_data["location"])
-
-    # Apply date range filter
-    date_range = request.GET.get("dates")
-    if date_range:
-        try:
-            start_date, end_date = date_range.split(" to ")
-            profiles = profiles.filter(
-                available_dates__icontains=start_date
-            ) | profiles.filter(
-                available_dates__icontains=end_date
-            )
-        except ValueError:
-            pass
 
-    # Create randomized profile sequence on first load
-    profile_ids = list(profiles.values_list('id', flat=True))
-    random.shuffle(profile_ids)
-    request.session['profile_sequence'] = profile_ids
-    request.session['current_index'] = 0
+def home(request):
+    form = SearchForm(request.GET or None)
+    filters = form.cleaned_data if form.is_valid() else {}
 
-    # Load the first profile
-    next_profile = None
-    if profile_ids:
-        next_profile = Profile.objects.get(id=profile_ids[0])
-        request.session['current_index'] = 1
+    # Start a new pass over visible, unseen profiles matching the house
+    # criteria and available at some point in the date range
+    cursor = FeedCursor.start(filters, request.GET.get("dates"))
 
-    reviews = []
-    average_rating = None
+    # Load the first profile
+    next_profile = get_next_visible_profile(cursor, request.user)
+    request.session['feed_cursor'] = cursor.to_session()
 
-    if next_profile:
-        reviews = Review.objects.filter(reviewee=next_profile.user)
-        average_rating_val = reviews.aggregate(avg=Avg('rating'))['avg']
-        if average_rating_val:
-            average_rating = round(average_rating_val, 1)
+    card_html = render_card(next_profile, request.user)
 
     # AJAX: return partial
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        html = render_to_string('partials/profile_card.html', {
-            'profile': next_profile,
-            'reviews': reviews,
-            'average_rating': average_rating,
-        }, request=request)
-        return JsonResponse({'next_profile_html': html})
+        return JsonResponse({'next_profile_html': card_html})
 
     # Normal page load
     return render(request, 'home.html', {
         'profile': next_profile,
+        'card_html': card_html,
         'form': form,
-        'reviews': reviews,
-        'average_rating': average_rating,
         'countries': list(countries),
     })
 
 
+def get_next_visible_profiles(cursor, user, count):
+    """
+    Advances the feed cursor past the next count profiles that are still
+    visible, loaded in bulk with their house images. Ids the candidate
+    index handed out that have since been hidden or deleted are dropped
+    from it, and profiles the user has responded to through another
+    worker are recorded as responded to.
+    """
+    visible = Profile.objects.filter(is_visible=True)
+    if user.is_authenticated:
+        visible = visible.annotate(responded=Exists(
+            MatchResponse.objects.filter(
+                from_user=user, to_profile=OuterRef('pk'))))
+    profiles = []
+    while len(profiles) < count:
+        profile_ids = cursor.next_ids(user, count - len(profiles))
+        if not profile_ids:
+            break
+        found = visible.select_related('user').prefetch_related(
+            ready_images()).in_bulk(profile_ids)
+        for profile_id in profile_ids:
+            profile = found.get(profile_id)
+            if profile is None:
+                candidate_index.remove_profile(profile_id)
+            elif getattr(profile, 'responded', False):
+                candidate_index.add_response(user.id, profile_id)
+            else:
+                profiles.append(profile)
+    cursor.served += len(profiles)
+    return profiles
+
+
+def get_next_visible_profile(cursor, user):
+    profiles = get_next_visible_profiles(cursor, user, 1)
+    return profiles[0] if profiles else None
+
+
+def get_feed_cursor(request, data):
+    """
+    Returns the session's feed cursor, or a new one for the filters posted
+    by the client if the session has none.
+    """
+    cursor = FeedCursor.from_session(request.session.get('feed_cursor'))
+    if cursor is None:
+        filters = data.get('filters', {})
+        form = SearchForm(filters)
+        cursor = FeedCursor.start(
+            form.cleaned_data if form.is_valid() else {},
+            filters.get('dates'))
+    return cursor
+
+
 def next_profile(request):
     if request.method != 'POST':
         return HttpResponseNotAllowed(['POST'])
 
     data = json.loads(request.body)
-    filters = data.get('filters', {})
+    cursor = get_feed_cursor(request, data)
 
-    profile_ids = request.session.get('profile_sequence', [])
-    current_index = request.session.get('current_index', 0)
+    # Try to get the next profile
+    next_profile = get_next_visible_profile(cursor, request.user)
 
-    # If we reached the end, reshuffle and restart
-    if current_index >= len(profile_ids):
+    # If we reached the end, start a new pass in a fresh order
+    if next_profile is None and cursor.served:
 
         # ✅ Prevent infinite loop if only one profile matches
-        if len(profile_ids) == 1:
-            html = (
-                "<div class='alert alert-info text-center mt-4'>"
-                "🎉 You've already seen the only matching profile. "
-                "Try changing your filters to see more!</div>"
-            )
-            return JsonResponse(
-                {'match': False, 'next_profile_html': html})
-        profiles = Profile.objects.filter(is_visible=True)
-
-        if request.user.is_authenticated:
-            profiles = profiles.exclude(user=request.user)
-            responded_ids = MatchResponse.objects.filter(
-                from_user=request.user
-            ).values_list('to_profile_id', flat=True)
-            profiles = profiles.exclude(id__in=responded_ids)
-        else:
-            profiles = profiles.exclude(user__isnull=True)
+        if cursor.served == 1:
+            request.session['feed_cursor'] = cursor.to_session()
+            return JsonResponse({
+                'match': False,
+                'next_profile_html': ONLY_PROFILE_SEEN_HTML,
+            })
 
-        # Re-apply filters
-        form = SearchForm(filters)
-        if form.is_valid():
-            for field, value in form.cleaned_data.items():
-                if value and field != "location":
-                    profiles = profiles.filter(**{field: True})
-            if form.cleaned_data.get("location"):
-                profiles = profiles.filter(
-                    location=form.cleaned_data["location"])
-
-        profile_ids = list(profiles.values_list('id', flat=True))
-        random.shuffle(profile_ids)
-        current_index = 0
-        request.session['profile_sequence'] = profile_ids
-        request.session['current_index'] = current_index
+        cursor = cursor.restart()
+        next_profile = get_next_visible_profile(cursor, request.user)
 
-    # Try to get the next profile
-    next_profile = None
-    if current_index < len(profile_ids):
-        try:
-            next_profile = Profile.objects.get(
-                id=profile_ids[current_index])
-            request.session['current_index'] = current_index + 1
-        except Profile.DoesNotExist:
-            next_profile = None
+    request.session['feed_cursor'] = cursor.to_session()
 
     # Prepare HTML
     if next_profile:
-        reviews = Review.objects.filter(reviewee=next_profile.user)
-        avg_val = reviews.aggregate(avg=Avg('rating'))['avg']
-        average_rating = round(avg_val, 1) if avg_val else None
-
-        html = render_to_string('partials/profile_card.html', {
-            'profile': next_profile,
-            'reviews': reviews,
-            'average_rating': average_rating,
-        }, request=request)
+        html = render_card(next_profile, request.user)
     else:
-        html = (
-            "<p class='text-center mt-5'>🎉 "
-            "No more profiles available!</p>"
-        )
+        html = NO_MORE_PROFILES_HTML
 
     return JsonResponse({
         'match': False,
@@ -351,6 +315,49 @@ def next_profile(request):
     })
 
 
+def next_profiles(request):
+    """
+    Batched version of next_profile for the client's prefetch buffer.
+    Returns up to count rendered cards, and end_html once the feed has
+    nothing more to show.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    data = json.loads(request.body)
+    try:
+        count = min(max(int(data.get('count', 1)), 1), MAX_CARD_BATCH)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Invalid count"}, status=400)
+
+    cursor = get_feed_cursor(request, data)
+    profiles = get_next_visible_profiles(cursor, request.user, count)
+
+    # Start a new pass only once the client has drained the current one,
+    # so a batch never holds the same profile twice
+    end_html = None
+    if not profiles:
+        if cursor.served == 1:
+            end_html = ONLY_PROFILE_SEEN_HTML
+        elif cursor.served:
+            cursor = cursor.restart()
+            profiles = get_next_visible_profiles(
+                cursor, request.user, count)
+        if not profiles and not end_html:
+            end_html = NO_MORE_PROFILES_HTML
+
+    request.session['feed_cursor'] = cursor.to_session()
+
+    return JsonResponse({
+        'cards': [{
+            'profile_id': profile.id,
+            'html': html,
+        } for profile, html in zip(
+            profiles, render_cards(profiles, request.user))],
+        'end_html': end_html,
+    })
+
+
 @csrf_exempt
 @login_required
 def like_profile(request):
@@ -359,79 +366,64 @@ def like_profile(request):
         profile_id = data.get('profile_id')
         profile = get_object_or_404(Profile, id=profile_id)
 
-        # Create or update MatchResponse
-        match, created = MatchResponse.objects.get_or_create(
-            from_user=request.user,
-            to_profile=profile,
-            defaults={'liked': True}
-        )
-
-        if not created and not match.liked:
-            match.liked = True
-            match.save()
-
-        # Check if it's a mutual match
-        is_match = MatchResponse.objects.filter(
-            from_user=profile.user,
-            to_profile__user=request.user,
-            liked=True
-        ).exists()
-
-        email_logger = logging.getLogger('email_notifications')
-
-        # ✅ Send email if a mutual match is confirmed
-        if is_match:
-            send_mail(
-                subject="You've got a new match on TravelSwap!",
-                message=(
-                    f"You and {profile.user.username} "
-                    "have liked each other.\n\n"
-                    "Visit their profile to start "
-                    "messaging or suggest vacation dates."
-                ),
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[request.user.email],
-                fail_silently=False,
-            )
-            send_mail(
-                subject="You've got a new match on TravelSwap!",
-                message=(
-                    f"{request.user.username} also liked you back!\n\n"
-                    "Log in to view their profile and connect."
-                ),
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[profile.user.email],
-                fail_silently=False,
-            )
-            email_logger.info(
-                f"Match email sent to: {profile.user.email} "
-                "with subject: {subject}"
-            )
-            Notification.objects.create(
-                user=profile.user,
-                message=f"You matched with {request.user.username}!",
-                link=reverse('view_profile', args=[request.user.id])
-            )
-            Notification.objects.create(
-                user=request.user,
-                message=f"You matched with {profile.user.username}!",
-                link=reverse('view_profile', args=[profile.user.id])
+        with transaction.atomic():
+            # Lock both users so two people liking each other at the same
+            # time still see each other's like and set the mutual flag
+            list(User.objects.select_for_update().filter(
+                id__in=[request.user.id, profile.user_id]).order_by('id'))
+
+            # Create or update MatchResponse
+            match, created = MatchResponse.objects.get_or_create(
+                from_user=request.user,
+                to_profile=profile,
+                defaults={'liked': True}
             )
 
-        # Get next profile to show
-        next_profile = Profile.objects.exclude(user=request.user).exclude(
-            id__in=MatchResponse.objects.filter(
-                from_user=request.user
-            ).values_list('to_profile_id', flat=True)
-        ).first()
+            if not created and not match.liked:
+                match.liked = True
+                match.save()
+
+            # Check if it's a mutual match
+            is_match = match.mutual
 
-        html = render_to_string('partials/profile_card.html', {
-            'profile': next_profile}, request=request)
+            # ✅ Queue emails if a mutual match is confirmed
+            if is_match:
+                queue_mail(
+                    subject="You've got a new match on TravelSwap!",
+                    message=(
+                        f"You and {profile.user.username} "
+                        "have liked each other.\n\n"
+                        "Visit their profile to start "
+                        "messaging or suggest vacation dates."
+                    ),
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    recipient_list=[request.user.email],
+                )
+                queue_mail(
+                    subject="You've got a new match on TravelSwap!",
+                    message=(
+                        f"{request.user.username} also liked you back!\n\n"
+                        "Log in to view their profile and connect."
+                    ),
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    recipient_list=[profile.user.email],
+                )
+                Notification.objects.create(
+                    user=profile.user,
+                    message=f"You matched with {request.user.username}!",
+                    link=reverse('view_profile', args=[request.user.id])
+                )
+                Notification.objects.create(
+                    user=request.user,
+                    message=f"You matched with {profile.user.username}!",
+                    link=reverse('view_profile', args=[profile.user.id])
+                )
 
+        # The client shows the next card from its prefetch buffer, which
+        # follows the feed cursor, so no card is picked here
         return JsonResponse({
             'match': is_match,
             'match_with': profile.user.username if is_match else None,
-            'next_profile_html': html,
             'message': (
                 f"You matched with {profile.user.username}! 🎉"
                 if is_match else
@@ -449,7 +441,9 @@ def unlike_profile(request, profile_id):
             liked=True
         )
         username = match.to_profile.user.username
-        match.delete()
+        # Deleting the response also clears the other user's mutual flag
+        with transaction.atomic():
+            match.delete()
         messages.success(
             request, f"You have unliked {username}'s profile.")
     except MatchResponse.DoesNotExist:
@@ -465,19 +459,12 @@ def travel_log(request):
         from_user=request.user,
         liked=True,
         to_profile__user__isnull=False  # ensures the profile has a user
-    ).select_related('to_profile', 'to_profile__user')
-
-    # Build mutual match list (by setting a flag on each match)
-    for match in liked_profiles:
-        is_mutual = MatchResponse.objects.filter(
-            from_user=match.to_profile.user,
-            to_profile__user=request.user,
-            liked=True
-        ).exists()
-        match.is_mutual = is_mutual  # attach flag directly
+    ).select_related(
+        'to_profile', 'to_profile__user'
+    ).prefetch_related(ready_images('to_profile__house_images'))
 
     mutual_matches_count = sum(
-        1 for match in liked_profiles if match.is_mutual)
+        1 for match in liked_profiles if match.mutual)
 
     return render(request, 'travel_log.html', {
         'liked_profiles': liked_profiles,
@@ -488,7 +475,8 @@ def travel_log(request):
 @login_required
 def view_profile(request, user_id):
     profile_user = get_object_or_404(User, id=user_id)
-    profile = Profile.objects.get(user=profile_user)
+    profile = Profile.objects.prefetch_related(
+        ready_images()).get(user=profile_user)
     is_match = check_if_matched(request.user, profile_user)
     user_is_viewing_own = request.user == profile_user
     can_review = is_match and not user_is_viewing_own
@@ -499,14 +487,22 @@ def view_profile(request, user_id):
     review_form = ReviewForm(instance=existing_review) if can_review else None
 
     message_form = None
+    conversation = None
     messages_between = None
+    history_cursor = None
+    latest_cursor = None
     booking_form = None
 
     if is_match:
-        messages_between = Message.objects.filter(
-            Q(sender=request.user, recipient=profile_user) |
-            Q(sender=profile_user, recipient=request.user)
-        ).order_by('timestamp')
+        # Only the newest page is rendered, older pages load on scroll
+        conversation = Conversation.objects.between(
+            request.user, profile_user)
+        if conversation:
+            messages_between, history_cursor = get_history_page(
+                conversation)
+            if messages_between:
+                latest_cursor = encode_cursor(messages_between[-1])
+            conversation.mark_read(request.user)
 
         if request.method == 'POST' and 'content' in request.POST:
             message_form = MessageForm(request.POST)
@@ -515,50 +511,41 @@ def view_profile(request, user_id):
                 message = message_form.save(commit=False)
                 message.sender = request.user
                 message.recipient = profile_user
-                message.save()
-
-                if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                is_ajax = (
+                    request.headers.get('x-requested-with')
+                    == 'XMLHttpRequest')
+
+                with transaction.atomic():
+                    message.save()
+                    if not is_ajax:
+                        queue_mail(
+                            subject=f'New message from '
+                            f'{request.user.username} on TravelSwap!',
+                            message=(
+                                f"You've received a new message from "
+                                f"{request.user.username}:\n\n"
+                                "Log in to TravelSwap to view and reply."
+                            ),
+                            from_email=settings.DEFAULT_FROM_EMAIL,
+                            recipient_list=[profile_user.email],
+                        )
+
+                if is_ajax:
                     return JsonResponse({
                         'success': True,
                         'username': request.user.username,
                         'content': message.content,
                     })
 
-                send_mail(
-                    subject=f'New message from {request.user.username} '
-                    'on TravelSwap!',
-                    message=(
-                        f"You've received a new message from "
-                        f"{request.user.username}:\n\n"
-                        "Log in to TravelSwap to view and reply."
-                    ),
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[profile_user.email],
-                    fail_silently=False,
-                )
-
                 messages.success(request, "Message sent successfully!")
                 return redirect('view_profile', user_id=profile_user.id)
         else:
             message_form = MessageForm()
 
-    booking = BookingRequest.objects.filter(
-        Q(sender=request.user, recipient=profile_user) |
-        Q(sender=profile_user, recipient=request.user)
-    ).order_by('-created_at').first()
-
-    available_start = None
-    available_end = None
+    booking = get_latest_booking(request.user, profile_user)
 
-    if profile.available_dates and 'to' in profile.available_dates:
-        try:
-            start_str, end_str = profile.available_dates.split(' to ')
-            available_start = datetime.strptime(
-                start_str.strip(), '%Y-%m-%d').date()
-            available_end = datetime.strptime(
-                end_str.strip(), '%Y-%m-%d').date()
-        except ValueError:
-            pass
+    available_start = profile.available_from
+    available_end = profile.available_to
 
     if request.method == 'POST':
         if 'request_booking' in request.POST:
@@ -580,7 +567,8 @@ def view_profile(request, user_id):
                 review = review_form.save(commit=False)
                 review.reviewer = request.user
                 review.reviewee = profile_user
-                review.save()
+                with transaction.atomic():
+                    review.save()
                 messages.success(request, "Your review has been submitted.")
                 return redirect('view_profile', user_id=profile_user.id)
 
@@ -595,14 +583,19 @@ def view_profile(request, user_id):
         'profile': profile,
         'is_match': is_match,
         'message_form': message_form,
+        'conversation': conversation,
         'messages_between': messages_between,
+        'history_cursor': history_cursor,
+        'latest_cursor': latest_cursor,
         'booking': booking,
         'available_start': available_start,
         'available_end': available_end,
         'can_review': can_review,
         'review_form': review_form,
         'existing_review': existing_review,
-        'reviews': Review.objects.filter(reviewee=profile_user),
+        'reviews': Review.objects.filter(
+            reviewee=profile_user).select_related('reviewer'),
+        'average_rating': profile.average_rating,
         'booking_form': booking_form,
     }
 
@@ -610,10 +603,26 @@ def view_profile(request, user_id):
 
 
 def get_latest_booking(user, other_user):
-    return BookingRequest.objects.filter(
-        Q(sender=user, recipient=other_user) |
-        Q(sender=other_user, recipient=user)
-    ).order_by('-created_at').first()
+    # One indexed lookup per direction rather than an OR that has to sort
+    latest = [
+        BookingRequest.objects.filter(
+            sender=sender, recipient=recipient
+        ).order_by('-created_at').first()
+        for sender, recipient in [(user, other_user), (other_user, user)]
+    ]
+    latest = [booking for booking in latest if booking]
+    return max(latest, key=attrgetter('created_at'), default=None)
+
+
+DATES_TAKEN = (
+    "One of you already has a confirmed exchange during those dates.")
+
+
+def lock_users(*users):
+    # Serialises booking writes for the same users so two overlapping
+    # requests cannot both pass the conflict check
+    list(User.objects.select_for_update().filter(
+        id__in=[user.id for user in users]).order_by('id'))
 
 
 def handle_booking_request(request, profile_user):
@@ -624,25 +633,42 @@ def handle_booking_request(request, profile_user):
         booking.recipient = profile_user
         booking.created_at = now()
         booking.last_action_by = request.user
-        booking.save()
+        booking.start_date, booking.end_date = parse_date_range(
+            booking.requested_dates)
 
-        Notification.objects.create(
-            user=profile_user,
-            message=f"{request.user.username} "
-                    f"sent you a vacation exchange request.",
-            link=reverse('view_profile', args=[request.user.id])
-        )
+        profile = profile_user.profile
+        if profile.available_from and not (
+                profile.available_from <= booking.start_date
+                and booking.end_date <= profile.available_to):
+            messages.error(
+                request,
+                f"{profile_user.username} is only available "
+                f"{profile.available_dates}.")
+            return redirect('view_profile', user_id=profile_user.id)
+
+        with transaction.atomic():
+            lock_users(request.user, profile_user)
+            if booking.conflicts().exists():
+                messages.error(request, DATES_TAKEN)
+                return redirect('view_profile', user_id=profile_user.id)
+            booking.save()
 
-        send_mail(
-            subject='New vacation exchange request on TravelSwap',
-            message=f"{request.user.username} "
-                    f"has requested a vacation exchange.\n\n"
-                    f"Dates: {booking.requested_dates}\n\n"
-                    "Log in to your account to respond.",
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[profile_user.email],
-            fail_silently=False,
-        )
+            Notification.objects.create(
+                user=profile_user,
+                message=f"{request.user.username} "
+                        f"sent you a vacation exchange request.",
+                link=reverse('view_profile', args=[request.user.id])
+            )
+
+            queue_mail(
+                subject='New vacation exchange request on TravelSwap',
+                message=f"{request.user.username} "
+                        f"has requested a vacation exchange.\n\n"
+                        f"Dates: {booking.requested_dates}\n\n"
+                        "Log in to your account to respond.",
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=[profile_user.email],
+            )
 
         messages.success(request, "Booking request sent!")
         return redirect('view_profile', user_id=profile_user.id)
@@ -652,73 +678,113 @@ def handle_booking_request(request, profile_user):
     return None
 
 
+def posted_booking_version(request):
+    # Version of the booking the user's page was rendered with
+    try:
+        return int(request.POST['booking_version'])
+    except (KeyError, ValueError):
+        return None
+
+
+def transition_booking(request, profile_user, booking, status, **kwargs):
+    """
+    Applies a status transition for request.user, flashing an error and
+    returning False if the booking has moved on since the page was loaded.
+    """
+    try:
+        booking.transition(
+            status, request.user,
+            version=posted_booking_version(request), **kwargs)
+    except InvalidTransition:
+        messages.error(request, f"This booking can no longer be {status}.")
+        return False
+    except BookingConflict:
+        messages.warning(
+            request,
+            f"{profile_user.username} changed this booking at the same "
+            "time. Please check the latest details.")
+        return False
+    return True
+
+
+@transaction.atomic
 def handle_booking_response(request, profile_user, booking):
     action = request.POST.get('respond_booking')
+    if action not in ['accepted', 'amended', 'denied']:
+        return None
+
     if booking.recipient != request.user:
         recipient = booking.recipient
     else:
         recipient = booking.sender
 
+    new_dates = None
     if action == 'amended':
-        new_dates = request.POST.get('amended_dates')
-        if new_dates:
-            booking.requested_dates = new_dates
-            send_mail(
-                subject='Booking request amended',
-                message=(
-                    f"{request.user.username} has suggested new dates.\n\n"
-                    f"Suggested Dates: {new_dates}"
-                ),
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[recipient.email],
-                fail_silently=False,
-            )
-            Notification.objects.create(
-                user=recipient,
-                message=f"{request.user.username} "
-                        f"suggested new vacation dates.",
-                link=reverse('view_profile', args=[request.user.id])
-            )
-
-    if action in ['accepted', 'amended', 'denied']:
-        booking.status = action
-        booking.responded_at = now()
-        booking.last_action_by = request.user
-        booking.save()
-
-        if action in ['accepted', 'denied']:
-            send_mail(
-                subject=f"Booking request {action} on TravelSwap",
-                message=f"{request.user.username} has "
-                        f"{action} your vacation request.\n\n"
-                        f"Dates: {booking.requested_dates}",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[recipient.email],
-                fail_silently=False,
-            )
-            Notification.objects.create(
-                user=recipient,
-                message=f"{request.user.username} {action} "
-                        f"your vacation request.",
-                link=reverse('view_profile', args=[request.user.id])
-            )
+        new_dates = request.POST.get('amended_dates') or None
+        if new_dates and parse_date_range(new_dates) is None:
+            messages.error(
+                request, "Please select valid dates for your amendment.")
+            return redirect('view_profile', user_id=profile_user.id)
 
-        # Flash message to current user
-        if action == 'accepted':
-            messages.success(request, "Vacation request accepted!")
-        elif action == 'denied':
-            if booking.sender == request.user:
-                messages.warning(request, "Your vacation request was denied.")
-            else:
-                messages.info(request, f"You denied the request from "
-                              f"{booking.sender.username}.")
-        elif action == 'amended':
-            messages.info(request, "You proposed new dates.")
+    if action == 'accepted':
+        lock_users(booking.sender, booking.recipient)
+        if booking.conflicts().exists():
+            messages.error(request, DATES_TAKEN)
+            return redirect('view_profile', user_id=profile_user.id)
 
+    if not transition_booking(request, profile_user, booking, action,
+                              requested_dates=new_dates):
         return redirect('view_profile', user_id=profile_user.id)
-    return None
 
+    if new_dates:
+        queue_mail(
+            subject='Booking request amended',
+            message=(
+                f"{request.user.username} has suggested new dates.\n\n"
+                f"Suggested Dates: {new_dates}"
+            ),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[recipient.email],
+        )
+        Notification.objects.create(
+            user=recipient,
+            message=f"{request.user.username} "
+                    f"suggested new vacation dates.",
+            link=reverse('view_profile', args=[request.user.id])
+        )
 
+    if action in ['accepted', 'denied']:
+        queue_mail(
+            subject=f"Booking request {action} on TravelSwap",
+            message=f"{request.user.username} has "
+                    f"{action} your vacation request.\n\n"
+                    f"Dates: {booking.requested_dates}",
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[recipient.email],
+        )
+        Notification.objects.create(
+            user=recipient,
+            message=f"{request.user.username} {action} "
+                    f"your vacation request.",
+            link=reverse('view_profile', args=[request.user.id])
+        )
+
+    # Flash message to current user
+    if action == 'accepted':
+        messages.success(request, "Vacation request accepted!")
+    elif action == 'denied':
+        if booking.sender == request.user:
+            messages.warning(request, "Your vacation request was denied.")
+        else:
+            messages.info(request, f"You denied the request from "
+                          f"{booking.sender.username}.")
+    elif action == 'amended':
+        messages.info(request, "You proposed new dates.")
+
+    return redirect('view_profile', user_id=profile_user.id)
+
+
+@transaction.atomic
 def handle_booking_cancel(request, profile_user, booking):
     # Identify the other user
     if booking.sender == request.user:
@@ -726,12 +792,11 @@ def handle_booking_cancel(request, profile_user, booking):
     else:
         recipient = booking.sender
 
-    # Store the dates before deleting
+    # The booking is kept with a cancelled status for both users' history
+    if not transition_booking(request, profile_user, booking, 'cancelled'):
+        return redirect('view_profile', user_id=profile_user.id)
     cancelled_dates = booking.requested_dates
 
-    # Delete the booking
-    booking.delete()
-
     # Create notification for the other user
     Notification.objects.create(
         user=recipient,
@@ -740,8 +805,8 @@ def handle_booking_cancel(request, profile_user, booking):
         link=reverse('view_profile', args=[request.user.id])
     )
 
-    # Send email to the other user (optional but useful)
-    send_mail(
+    # Queue email to the other user (optional but useful)
+    queue_mail(
         subject='Vacation exchange cancelled',
         message=(
             f"{request.user.username} has cancelled the "
@@ -751,7 +816,6 @@ def handle_booking_cancel(request, profile_user, booking):
         ),
         from_email=settings.DEFAULT_FROM_EMAIL,
         recipient_list=[recipient.email],
-        fail_silently=False,
     )
 
     # Feedback for the user performing the cancellation
@@ -760,28 +824,11 @@ def handle_booking_cancel(request, profile_user, booking):
 
 
 def check_if_matched(user1, user2):
-    return MatchResponse.objects.filter(
-        from_user=user1,
-        to_profile__user=user2,
-        liked=True
-    ).exists() and MatchResponse.objects.filter(
-        from_user=user2,
-        to_profile__user=user1,
-        liked=True
-    ).exists()
+    return MatchResponse.objects.is_match(user1, user2)
 
 
 def user_is_matched(user1, user2):
-    try:
-        profile2 = user2.profile
-        profile1 = user1.profile
-        liked_by_user1 = MatchResponse.objects.filter(
-            from_user=user1, to_profile=profile2, liked=True).exists()
-        liked_by_user2 = MatchResponse.objects.filter(
-            from_user=user2, to_profile=profile1, liked=True).exists()
-        return liked_by_user1 and liked_by_user2
-    except Profile.DoesNotExist:
-        return False
+    return MatchResponse.objects.is_match(user1, user2)
 
 
 def about(request):
@@ -789,7 +836,7 @@ def about(request):
         form = ContactForm(request.POST)
         if form.is_valid():
             cd = form.cleaned_data
-            send_mail(
+            queue_mail(
                 cd['subject'],
                 cd['message'],
                 cd['email'],
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from profiles.models import Profile
+from reviews.models import refresh_review_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the denormalized review_count and rating_sum on every "
+        "Profile from the Review table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = Profile.objects.order_by('user_id').values_list(
+            'user_id', flat=True)
+
+        checked = changed = 0
+        last_id = 0
+        while True:
+            batch = list(user_ids.filter(user_id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            changed += refresh_review_stats(batch)
+            checked += len(batch)
+            last_id = batch[-1]
+
+        self.stdout.write(
+            f"Checked {checked} profiles, corrected {changed}.")
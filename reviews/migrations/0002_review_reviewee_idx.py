@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['reviewee', '-created_at'], name='review_reviewee_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Sum
 from django.contrib.auth.models import User
+from profiles.models import Profile
 
 
 class Review(models.Model):
@@ -14,6 +16,39 @@ class Review(models.Model):
     class Meta:
         unique_together = ('reviewer', 'reviewee')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['reviewee', '-created_at'],
+                name='review_reviewee_idx'),
+        ]
 
     def __str__(self):
         return f"{self.reviewer} → {self.reviewee} ({self.rating} stars)"
+
+
+def refresh_review_stats(user_ids):
+    """
+    Recomputes review_count and rating_sum on the profiles of the given
+    reviewees from their reviews. The profile rows are locked first so
+    concurrent review writes for the same user apply one after the other.
+    """
+    with transaction.atomic():
+        profiles = list(Profile.objects.select_for_update().filter(
+            user_id__in=user_ids
+        ).only('id', 'user_id', 'review_count', 'rating_sum'))
+        totals = {
+            reviewee: (count, total)
+            for reviewee, count, total in Review.objects.filter(
+                reviewee_id__in=user_ids
+            ).values_list('reviewee').annotate(
+                count=Count('id'), total=Sum('rating'))
+        }
+
+        changed = []
+        for profile in profiles:
+            count, total = totals.get(profile.user_id, (0, 0))
+            if (profile.review_count, profile.rating_sum) != (count, total):
+                profile.review_count, profile.rating_sum = count, total
+                changed.append(profile)
+        Profile.objects.bulk_update(changed, ['review_count', 'rating_sum'])
+    return len(changed)
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Review, refresh_review_stats
+
+
+# Keep the reviewee's denormalized rating totals on Profile current
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def update_review_stats(sender, instance, **kwargs):
+    refresh_review_stats([instance.reviewee_id])
@@ -1,10 +1,13 @@
-from django.test import TestCase, Client
+from django.test import TestCase
 from django.contrib.auth.models import User
 from reviews.models import Review
 from django.db import IntegrityError
 from django.urls import reverse
 from profiles.models import MatchResponse, Profile
 from reviews.forms import ReviewForm
+from django.core.management import call_command
+from io import StringIO
+from codestar.testing import QueryBudgetMixin, QueryPlanMixin
 
 
 class ReviewModelTest(TestCase):
@@ -51,10 +54,9 @@ class ReviewModelTest(TestCase):
             )
 
 
-class ReviewViewsTest(TestCase):
+class ReviewViewsTest(QueryBudgetMixin, TestCase):
 
     def setUp(self):
-        self.client = Client()
         self.reviewer = User.objects.create_user(
             username='alice', password='pass123')
         self.reviewee = User.objects.create_user(
@@ -90,6 +92,8 @@ class ReviewViewsTest(TestCase):
         self.assertTrue(
             Review.objects.filter(
                 reviewer=self.reviewer, reviewee=self.reviewee).exists())
+        self.reviewee_profile.refresh_from_db()
+        self.assertEqual(self.reviewee_profile.average_rating, 4)
 
     def test_cannot_review_self(self):
         self.client.login(username='alice', password='pass123')
@@ -122,6 +126,72 @@ class ReviewViewsTest(TestCase):
                 reviewee=self.reviewee
             ).exists()
         )
+        self.reviewee_profile.refresh_from_db()
+        self.assertEqual(self.reviewee_profile.review_count, 0)
+
+
+class ReviewStatsTest(TestCase):
+
+    def setUp(self):
+        self.reviewee = User.objects.create_user(username='bob')
+        self.profile = Profile.objects.create(user=self.reviewee)
+        self.reviewers = [
+            User.objects.create_user(username=f'guest{i}') for i in range(3)
+        ]
+
+    def review(self, reviewer, rating):
+        return Review.objects.create(
+            reviewer=reviewer, reviewee=self.reviewee,
+            rating=rating, comment="Stayed here")
+
+    def assertStats(self, count, total):
+        self.profile.refresh_from_db()
+        self.assertEqual(
+            (self.profile.review_count, self.profile.rating_sum),
+            (count, total))
+
+    def test_stats_follow_review_writes(self):
+        first = self.review(self.reviewers[0], 4)
+        self.review(self.reviewers[1], 5)
+        self.assertStats(2, 9)
+        self.assertEqual(self.profile.average_rating, 4.5)
+
+        first.rating = 2
+        first.save()
+        self.assertStats(2, 7)
+
+        first.delete()
+        self.assertStats(1, 5)
+
+    def test_profile_save_keeps_totals_written_meanwhile(self):
+        stale = Profile.objects.get(id=self.profile.id)
+        self.review(self.reviewers[0], 4)
+        stale.bio = "Updated bio"
+        stale.save()
+        self.assertStats(1, 4)
+        self.assertEqual(self.profile.bio, "Updated bio")
+
+    def test_unreviewed_profile_has_no_average(self):
+        self.assertIsNone(self.profile.average_rating)
+
+    def test_recompute_command_corrects_drift(self):
+        self.review(self.reviewers[0], 3)
+        Profile.objects.update(review_count=7, rating_sum=1)
+        out = StringIO()
+        call_command('recompute_review_stats', stdout=out)
+        self.assertStats(1, 3)
+        self.assertIn("corrected 1", out.getvalue())
+
+    def test_by_rating_orders_unreviewed_last(self):
+        other = Profile.objects.create(user=self.reviewers[0])
+        unreviewed = Profile.objects.create(user=self.reviewers[1])
+        self.review(self.reviewers[2], 2)
+        Review.objects.create(
+            reviewer=self.reviewers[2], reviewee=other.user,
+            rating=5, comment="Great")
+        self.assertEqual(
+            list(Profile.objects.by_rating()),
+            [other, self.profile, unreviewed])
 
 
 class ReviewFormTest(TestCase):
@@ -158,3 +228,16 @@ class ReviewFormTest(TestCase):
         form = ReviewForm()
         self.assertEqual(form.fields['rating'].label, 'Star Rating')
         self.assertEqual(form.fields['comment'].label, 'Your Review')
+
+
+class ReviewQueryPlanTest(QueryPlanMixin, TestCase):
+
+    def test_reviews_of_a_user_use_index(self):
+        reviewee = User.objects.create_user(username='bob', password='x')
+        self.assertIndexed(Review.objects.filter(reviewee=reviewee))
+
+    def test_reviews_of_several_users_use_index(self):
+        # The profile card query, newest first per reviewee
+        self.assertIndexed(Review.objects.filter(
+            reviewee_id__in=[1, 2, 3]
+        ).select_related('reviewer').order_by('reviewee', '-created_at'))
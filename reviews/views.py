@@ -2,34 +2,17 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
+from django.db import transaction
 from .models import Review
 from .forms import ReviewForm
-from profiles.models import Profile, MatchResponse
+from profiles.models import MatchResponse
 
 
 def user_is_matched(user1, user2):
     """
     Returns True if user1 and user2 have liked each other.
     """
-    try:
-        profile2 = user2.profile  # user2's profile
-        liked_by_user1 = MatchResponse.objects.filter(
-            from_user=user1,
-            to_profile=profile2,
-            liked=True
-        ).exists()
-
-        profile1 = user1.profile
-        liked_by_user2 = MatchResponse.objects.filter(
-            from_user=user2,
-            to_profile=profile1,
-            liked=True
-        ).exists()
-
-        return liked_by_user1 and liked_by_user2
-
-    except Profile.DoesNotExist:
-        return False
+    return MatchResponse.objects.is_match(user1, user2)
 
 
 @login_required
@@ -54,7 +37,9 @@ def leave_review(request, user_id):
             review = form.save(commit=False)
             review.reviewer = request.user
             review.reviewee = reviewee
-            review.save()
+            # Saved together with the reviewee's rating totals
+            with transaction.atomic():
+                review.save()
             messages.success(request, "Review submitted successfully.")
             return redirect('view_profile', user_id=reviewee.id)
 
@@ -80,6 +65,7 @@ def delete_review(request, user_id):
     review = get_object_or_404(
         Review, reviewer=request.user, reviewee__id=user_id)
     if request.method == 'POST':
-        review.delete()
+        with transaction.atomic():
+            review.delete()
         messages.success(request, "Your review has been deleted.")
     return redirect('view_profile', user_id=user_id)
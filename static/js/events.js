@@ -0,0 +1,147 @@
+// Live updates: new messages, booking changes and notifications are pushed
+// over server-sent events, so open pages update without reloading. Where
+// the stream is unavailable, an open conversation polls for new messages.
+(() => {
+  const url = document.body.dataset.eventsUrl;
+  if (!url) return;
+
+  const POLL_INTERVAL = 5000;
+
+  // The conversation window on the sender's profile page, if it is open
+  function messagesWindowFor(userId) {
+    return document.querySelector(
+      `.messages-window[data-other-user-id="${userId}"]`);
+  }
+
+  const shownMessages = new Set();
+
+  function appendMessage(messagesWindow, message) {
+    if (shownMessages.has(message.id)) return;
+    shownMessages.add(message.id);
+
+    const placeholder = messagesWindow.querySelector('p.text-muted');
+    if (placeholder) placeholder.remove();
+
+    const bubble = document.createElement('div');
+    bubble.classList.add('message-bubble', 'message-received');
+    const sender = document.createElement('div');
+    const name = document.createElement('strong');
+    name.textContent = message.sender;
+    sender.appendChild(name);
+    const content = document.createElement('div');
+    content.textContent = message.content;
+    const time = document.createElement('small');
+    time.classList.add('text-muted');
+    time.textContent = 'just now';
+    bubble.append(sender, content, time);
+
+    const atBottom = messagesWindow.scrollHeight - messagesWindow.scrollTop
+      - messagesWindow.clientHeight < 50;
+    messagesWindow.appendChild(bubble);
+    if (atBottom) messagesWindow.scrollTop = messagesWindow.scrollHeight;
+  }
+
+  // Poll the conversation for messages after the newest one shown. The
+  // ETag of the last answer is sent back, so an unchanged conversation
+  // costs the server a cache lookup and returns 304.
+  function pollMessages(messagesWindow) {
+    let etag = null;
+    const poll = () => {
+      if (document.hidden) {
+        setTimeout(poll, POLL_INTERVAL);
+        return;
+      }
+      const params = new URLSearchParams();
+      if (messagesWindow.dataset.latestCursor) {
+        params.set('after', messagesWindow.dataset.latestCursor);
+      }
+      fetch(`${messagesWindow.dataset.sinceUrl}?${params}`, {
+        cache: 'no-store',
+        headers: etag ? { 'If-None-Match': etag } : {}
+      })
+        .then(response => {
+          if (response.status === 304) return null;
+          if (!response.ok) throw new Error(`HTTP ${response.status}`);
+          etag = response.headers.get('ETag');
+          return response.json();
+        })
+        .then(data => {
+          let delay = POLL_INTERVAL;
+          if (data) {
+            data.messages
+              .filter(message =>
+                String(message.sender_id) === messagesWindow.dataset.otherUserId)
+              .forEach(message => appendMessage(messagesWindow, message));
+            if (data.cursor) messagesWindow.dataset.latestCursor = data.cursor;
+            if (data.more) {
+              // The ETag covers the whole conversation, so fetch the rest
+              // without it
+              etag = null;
+              delay = 0;
+            }
+          }
+          setTimeout(poll, delay);
+        })
+        .catch(error => {
+          console.error('Failed to poll for messages:', error);
+          setTimeout(poll, POLL_INTERVAL);
+        });
+    };
+    setTimeout(poll, POLL_INTERVAL);
+  }
+
+  let polling = false;
+  function startPolling() {
+    if (polling) return;
+    polling = true;
+    document.querySelectorAll('.messages-window[data-since-url]')
+      .forEach(pollMessages);
+  }
+
+  if (!window.EventSource) {
+    startPolling();
+    return;
+  }
+
+  const source = new EventSource(url);
+
+  // The server refuses the stream when it cannot hold it open
+  source.addEventListener('error', () => {
+    if (source.readyState === EventSource.CLOSED) startPolling();
+  });
+
+  source.addEventListener('message', event => {
+    const message = JSON.parse(event.data);
+    const messagesWindow = messagesWindowFor(message.sender_id);
+    if (messagesWindow) appendMessage(messagesWindow, message);
+  });
+
+  source.addEventListener('booking', event => {
+    const booking = JSON.parse(event.data);
+    const onProfile = messagesWindowFor(booking.sender_id)
+      || messagesWindowFor(booking.recipient_id);
+    if (onProfile && typeof showMessageAlert === 'function') {
+      showMessageAlert(
+        'Your booking request was updated. <a href="" class="alert-link">Reload</a> to see it.',
+        'info');
+    }
+  });
+
+  source.addEventListener('notification', () => {
+    document.querySelectorAll('.notification-bell').forEach(bell => {
+      let badge = bell.querySelector('.badge');
+      if (badge) {
+        badge.textContent = parseInt(badge.textContent, 10) + 1;
+      } else {
+        badge = document.createElement('span');
+        badge.classList.add('badge', 'bg-danger');
+        badge.setAttribute('aria-hidden', 'true');
+        badge.textContent = '1';
+        bell.querySelector('.fa-bell').insertAdjacentElement('afterend', badge);
+      }
+      // Fetch the preview again the next time the dropdown opens
+      const menu = bell.querySelector('.notification-menu');
+      if (menu) menu.dataset.stale = 'true';
+    });
+  });
+})();
@@ -0,0 +1,30 @@
+// Notification bell: fetch the latest unread notifications the first time
+// each dropdown is opened, instead of rendering them into every page
+document.querySelectorAll('.notification-menu').forEach(menu => {
+  const toggle = document.getElementById(menu.getAttribute('aria-labelledby'));
+  if (!toggle) return;
+
+  let loaded = false;
+  toggle.addEventListener('show.bs.dropdown', () => {
+    if (loaded && !menu.dataset.stale) return;
+    loaded = true;
+    delete menu.dataset.stale;
+
+    fetch(menu.dataset.previewUrl, {
+      headers: { 'X-Requested-With': 'XMLHttpRequest' }
+    })
+      .then(response => {
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        return response.text();
+      })
+      .then(html => {
+        menu.innerHTML = html;
+      })
+      .catch(error => {
+        loaded = false;
+        console.error('Failed to load notifications:', error);
+        menu.innerHTML =
+          '<li><span class="dropdown-item text-muted">Could not load notifications</span></li>';
+      });
+  });
+});
@@ -1,12 +1,88 @@
-function handleMatch(profileId, liked) {
-  const url = liked === true ? '/like/' : '/next/';
-  const bodyData = { profile_id: profileId };
+// Swipe feed: rendered cards fetched ahead of time from /next/batch/
+const CARD_BATCH_SIZE = 5;
+const CARD_REFILL_AT = 2;
+let cardBuffer = [];
+let cardBufferEndHtml = null;
+let cardRequest = null;
+let cardGeneration = 0;
+
+function resetCardBuffer() {
+  cardBuffer = [];
+  cardBufferEndHtml = null;
+  cardRequest = null;
+  cardGeneration += 1;
+}
 
-  if (window.currentFilters && liked !== true) {
-    // Only apply filters for Next, not Like
+function fetchCards() {
+  if (cardRequest) return cardRequest;
+
+  const generation = cardGeneration;
+  const bodyData = { count: CARD_BATCH_SIZE };
+  if (window.currentFilters) {
     bodyData.filters = Object.fromEntries(window.currentFilters.entries());
   }
 
+  cardRequest = fetch('/next/batch/', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'X-CSRFToken': getCSRFToken(),
+    },
+    body: JSON.stringify(bodyData)
+  })
+  .then(response => response.json())
+  .then(data => {
+    // Drop batches requested before the filters changed
+    if (generation !== cardGeneration) return;
+    cardBuffer.push(...data.cards.map(card => card.html));
+    cardBufferEndHtml = data.end_html;
+  })
+  .finally(() => {
+    if (generation === cardGeneration) cardRequest = null;
+  });
+  return cardRequest;
+}
+
+function showProfileCard(html) {
+  document.getElementById('profile-section').innerHTML = html;
+  initManualImageViewer();
+}
+
+function showNextCard() {
+  if (cardBuffer.length) {
+    showProfileCard(cardBuffer.shift());
+    if (cardBuffer.length <= CARD_REFILL_AT && !cardBufferEndHtml) {
+      fetchCards().catch(error => {
+        console.error("Failed to prefetch profiles:", error);
+      });
+    }
+    return;
+  }
+
+  if (cardBufferEndHtml) {
+    showProfileCard(cardBufferEndHtml);
+    return;
+  }
+
+  fetchCards()
+    .then(() => {
+      if (cardBuffer.length || cardBufferEndHtml) showNextCard();
+    })
+    .catch(error => {
+      console.error("Failed to load next profile:", error);
+      alert("Oops! Something went wrong. Please try again.");
+    });
+}
+
+function handleMatch(profileId, liked) {
+  if (liked !== true) {
+    showNextCard();
+    return;
+  }
+
+  const url = '/like/';
+  const bodyData = { profile_id: profileId };
+
   fetch(url, {
     method: 'POST',
     headers: {
@@ -27,9 +103,7 @@ function handleMatch(profileId, liked) {
     if (data.message) {
       showMessageAlert(data.message, data.match ? 'success' : 'info');
     }
-    document.getElementById('profile-section').innerHTML = data.next_profile_html;
-
-    initManualImageViewer();
+    showNextCard();
   })
   .catch(error => {
     console.error("Failed to load next profile:", error);
@@ -96,6 +170,8 @@ if (filterForm) {
       .then(data => {
         document.getElementById('profile-section').innerHTML = data.next_profile_html;
         window.currentFilters = params;
+        // The search started a new feed, so buffered cards are stale
+        resetCardBuffer();
       })
       .catch(error => {
         console.error('Search filter AJAX error:', error);
@@ -104,26 +180,23 @@ if (filterForm) {
 }
 
 function initManualImageViewer() {
-  const imageDataElement = document.getElementById('house-image-urls');
-  if (!imageDataElement) return;
-
-  const imageUrls = JSON.parse(imageDataElement.textContent);
+  // Slides other than the current one are hidden, so their lazy images
+  // are only downloaded when the user steps to them
+  const slides = document.querySelectorAll('#house-image-slides .house-image-slide');
   let currentImageIndex = 0;
 
-  const imgElement = document.getElementById('current-house-image');
   const prevBtn = document.getElementById('prev-image');
   const nextBtn = document.getElementById('next-image');
 
-  if (prevBtn && nextBtn && imgElement && imageUrls.length > 0) {
-    prevBtn.addEventListener('click', () => {
-      currentImageIndex = (currentImageIndex - 1 + imageUrls.length) % imageUrls.length;
-      imgElement.src = imageUrls[currentImageIndex];
-    });
+  function showSlide(index) {
+    slides[currentImageIndex].classList.add('d-none');
+    currentImageIndex = (index + slides.length) % slides.length;
+    slides[currentImageIndex].classList.remove('d-none');
+  }
 
-    nextBtn.addEventListener('click', () => {
-      currentImageIndex = (currentImageIndex + 1) % imageUrls.length;
-      imgElement.src = imageUrls[currentImageIndex];
-    });
+  if (prevBtn && nextBtn && slides.length > 0) {
+    prevBtn.addEventListener('click', () => showSlide(currentImageIndex - 1));
+    nextBtn.addEventListener('click', () => showSlide(currentImageIndex + 1));
   }
 }
 